@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+问答结果缓存
+对归一化后的问题文本做精确匹配，可选按问题向量相似度做语义匹配；
+LRU + TTL 淘汰，知识图谱版本变化后旧条目自动失效。
+语义匹配在锁外对缓存向量矩阵做一次矩阵乘法，矩阵只在缓存内容变化后重建
+"""
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from tracing import get_tracer
+
+try:
+    import numpy as np
+except ImportError:  # 未安装时语义匹配退化为纯 Python 计算
+    np = None
+
+# 归一化时去掉的空白与标点
+_STRIP_PATTERN = re.compile(r"[\s,.!?;:'\"，。！？；：、“”‘’()（）]+")
+
+
+def normalize_question(question):
+    """归一化问题文本: 全角转半角、小写、去除空白与标点"""
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    return _STRIP_PATTERN.sub('', text)
+
+
+class AnswerCache:
+    """问答缓存(线程安全)
+
+    encode(text) 返回问题向量，提供时启用语义匹配(相似度 ≥ semantic_threshold 视为命中)。
+    """
+
+    def __init__(self, max_entries=1024, ttl_s=3600.0, encode=None, semantic_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.encode = encode
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_latency_s = 0.0
+        self.version = None
+        # 语义匹配索引: variant -> (keys, 向量矩阵)，缓存内容变化时作废
+        self._index = {}
+        self._generation = 0
+
+    def _expired(self, entry, now):
+        return self.ttl_s and now - entry['created'] > self.ttl_s
+
+    def _changed(self, variant=None):
+        """缓存内容变化，作废语义匹配索引(需持锁)
+
+        淘汰条目无需作废: 查询时会跳过索引中已不存在的 key。
+        """
+        self._generation += 1
+        if variant is None:
+            self._index.clear()
+        else:
+            self._index.pop(variant, None)
+
+    def _check_version(self, version):
+        """图谱版本变化时清空缓存"""
+        if version != self.version:
+            self._entries.clear()
+            self._changed()
+            self.version = version
+
+    @staticmethod
+    def _unit(vector):
+        norm = math.sqrt(sum(float(x) * float(x) for x in vector)) or 1.0
+        return [float(x) / norm for x in vector]
+
+    def _semantic_index(self, variant):
+        """返回该 variant 下带向量条目的 (keys, 矩阵) 快照；矩阵在锁外构建"""
+        with self._lock:
+            index = self._index.get(variant)
+            if index is not None:
+                return index
+            generation = self._generation
+            items = [(key, entry['vector']) for key, entry in self._entries.items()
+                     if key[0] == variant and entry['vector'] is not None]
+        keys = [key for key, _ in items]
+        vectors = [vector for _, vector in items]
+        if np is not None and vectors:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        index = (keys, vectors)
+        with self._lock:
+            # 构建期间缓存有变化时不保存，下次查询重建
+            if generation == self._generation:
+                self._index[variant] = index
+        return index
+
+    def _semantic_candidates(self, vector, variant):
+        """相似度不低于阈值的条目 key，按相似度降序(不持锁)"""
+        keys, vectors = self._semantic_index(variant)
+        if not keys:
+            return []
+        if np is not None:
+            scores = (vectors @ np.asarray(vector, dtype=np.float32)).tolist()
+        else:
+            scores = [sum(a * b for a, b in zip(vector, row)) for row in vectors]
+        ranked = sorted(zip(scores, range(len(keys))), reverse=True)
+        return [keys[i] for score, i in ranked if score >= self.semantic_threshold]
+
+    def get(self, question, version=None, variant=''):
+        """查找缓存，返回 (答案, 命中类型) 或 (None, None)
+
+        variant 区分同一问题的不同调用参数(如是否使用图谱上下文)。
+        """
+        answer, hit, _ = self.lookup(question, version, variant)
+        return answer, hit
+
+    def lookup(self, question, version=None, variant=''):
+        """查找缓存，额外返回问题向量供未命中时 put 复用"""
+        key = (variant, normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_latency_s += entry['latency_s']
+                return entry['answer'], 'exact', None
+            if self.encode is None:
+                self.misses += 1
+                return None, None, None
+
+        # 编码与相似度计算可能较慢，不持锁
+        vector = self._unit(self.encode(question))
+        candidates = self._semantic_candidates(vector, variant)
+        with self._lock:
+            # 计算期间条目可能已被淘汰、过期或因图谱版本变化而清空
+            for match in candidates:
+                entry = self._entries.get(match)
+                if entry is None or self._expired(entry, now):
+                    continue
+                self._entries.move_to_end(match)
+                self.semantic_hits += 1
+                self.saved_latency_s += entry['latency_s']
+                return entry['answer'], 'semantic', vector
+            self.misses += 1
+            return None, None, vector
+
+    def put(self, question, answer, latency_s=0.0, version=None, variant='', vector=None):
+        """写入缓存；答案对应的图谱版本已不是缓存当前版本时丢弃，返回是否写入"""
+        key = (variant, normalize_question(question))
+        if vector is None and self.encode:
+            vector = self._unit(self.encode(question))
+        with self._lock:
+            # 编码在锁外进行，期间其他线程可能已按新版本清空缓存，此时不再写入旧答案
+            if self.version is not None and version != self.version:
+                return False
+            self.version = version
+            if vector is not None:
+                self._changed(variant)
+            self._entries[key] = {
+                'answer': answer,
+                'vector': vector,
+                'latency_s': latency_s,
+                'created': time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._changed()
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0,
+                'saved_latency_s': self.saved_latency_s,
+            }
+
+
+def cached_answer(answer_fn, cache, version_fn=lambda: None):
+    """为 answer_question(question, **kwargs) 包上缓存；只缓存成功的回答"""
+    tracer = get_tracer()
+
+    def answer_question(question, *args, **kwargs):
+        version = version_fn()
+        variant = repr((args, sorted(kwargs.items())))
+        answer, hit, vector = cache.lookup(question, version, variant)
+        if answer is not None:
+            tracer.count(f"answer_cache_{hit}_hits")
+            return dict(answer, cache_hit=hit)
+        tracer.count("answer_cache_misses")
+
+        start = time.perf_counter()
+        answer = answer_fn(question, *args, **kwargs)
+        # 回答期间图谱有更新时答案可能基于旧图谱，不写入缓存
+        if isinstance(answer, dict) and 'error' not in answer and version_fn() == version:
+            cache.put(question, answer, time.perf_counter() - start, version, variant, vector)
+        return answer
+
+    return answer_question
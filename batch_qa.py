@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+批量问答引擎
+按批做实体链接与问题向量编码，LLM 调用在有并发上限与速率限制的线程池中执行，
+结果逐条追加写入 JSONL(含每题耗时)，中断后重跑会跳过已成功回答的问题，
+并在续跑前重写结果文件，去掉失败记录与重复序号，每个序号只保留一条
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from kg_context import EntityLinker
+from tracing import get_tracer
+
+
+class RateLimiter:
+    """令牌桶限速器(线程安全)，rate 为每秒请求数，0 表示不限速"""
+
+    def __init__(self, rate=0.0, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # 令牌不足时先预占(余额可为负)，各线程按预占顺序依次等待
+            self._tokens -= 1
+            wait_s = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_s:
+            time.sleep(wait_s)
+        return wait_s
+
+
+class BatchGraphRetriever:
+    """批量检索: 实体链接 + 可选的批量问题向量检索 + k 跳图谱上下文
+
+    kg 为 MockKnowledgeGraph 或 GraphSnapshot；encode_batch(texts) 提供时，
+    一批问题只做一次向量编码，并在快照的向量矩阵上检索。
+    返回格式与 llm_streaming.graph_retrieve() 相同。
+    """
+
+    def __init__(self, kg, context_builder, encode_batch=None, k=5):
+        self.kg = kg
+        self.context_builder = context_builder
+        self.k = k
+        if hasattr(kg, 'entities'):
+            names = (entity['name'] for entity in kg.entities.values())
+            self.types = {entity['name']: entity.get('type', 'unknown') for entity in kg.entities.values()}
+        else:
+            names = (kg.name(node) for node in range(kg.num_nodes))
+            self.types = None
+        self.linker = EntityLinker(names)
+        self.encode_batch = encode_batch if getattr(kg, 'has_vectors', False) else None
+
+    def _entity_type(self, name):
+        if self.types is not None:
+            return self.types.get(name, 'unknown')
+        node = self.kg.node_id(name)
+        return 'unknown' if node is None else self.kg.node_type(node)
+
+    def __call__(self, questions):
+        tracer = get_tracer()
+        with tracer.span("batch_link"):
+            linked = self.linker.link_batch(questions)
+        vector_hits = [[] for _ in questions]
+        if self.encode_batch and questions:
+            with tracer.span("batch_embed"):
+                vectors = list(self.encode_batch(list(questions)))
+            vector_hits = [self.kg.vector_search(vector, self.k) for vector in vectors]
+
+        results = []
+        for question, names, hits in zip(questions, linked, vector_hits):
+            entities = [{'name': name, 'type': self._entity_type(name), 'score': 1.0}
+                        for name in names[:self.k]]
+            entities += [{'name': hit['name'], 'type': hit['type'], 'score': hit['similarity']}
+                         for hit in hits if hit['name'] not in names]
+            seeds = [entity['name'] for entity in entities]
+            built = self.context_builder.build(question, seeds) if seeds else {}
+            results.append({
+                'entities': entities,
+                'seeds': seeds,
+                'context': built.get('context', ''),
+                'paths': len(built.get('paths', [])),
+                'token_count': built.get('token_count', 0),
+                'truncated': built.get('truncated', False),
+            })
+        return results
+
+
+def load_completed(output_path):
+    """读取已有结果，返回已成功回答的 (序号, 问题) 集合；末尾写了一半的行会被忽略"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'error' not in record:
+                done.add((record['id'], record['question']))
+    return done
+
+
+def rewrite_completed(output_path):
+    """续跑前重写结果文件: 只保留成功的记录，同一序号只留第一条；返回保留的条数
+
+    失败的问题会被重新回答并追加，不先删掉旧的失败记录，同一序号就会在 JSONL 中出现两次。
+    先写临时文件再替换，重写中途中断不会丢失已有结果。
+    """
+    kept, seen = [], set()
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'error' in record or record['id'] in seen:
+                continue
+            seen.add(record['id'])
+            kept.append(line if line.endswith('\n') else line + '\n')
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(kept)
+    os.replace(tmp_path, output_path)
+    return len(kept)
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class BatchQAEngine:
+    """并发批量问答
+
+    answer_fn(question, retrieved) 返回与 answer_question 相同形式的字典；
+    retrieve_batch(questions) 返回等长的检索结果列表，为 None 时 retrieved 恒为 None。
+    """
+
+    def __init__(self, answer_fn, retrieve_batch=None, concurrency=8, rate_limit=0.0, batch_size=64):
+        self.answer_fn = answer_fn
+        self.retrieve_batch = retrieve_batch
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate_limit, burst=self.concurrency)
+        self.batch_size = max(1, batch_size)
+
+    def _answer_one(self, index, question, retrieved, retrieval_ms):
+        waited = self.limiter.acquire()
+        start = time.perf_counter()
+        try:
+            result = self.answer_fn(question, retrieved)
+            if not isinstance(result, dict):
+                result = {'error': f"回答函数返回了 {type(result).__name__}，应为字典"}
+        except Exception as e:
+            result = {'error': str(e)}
+        latency = time.perf_counter() - start
+        get_tracer().observe("batch_qa_answer", latency)
+
+        record = {
+            'id': index,
+            'question': question,
+            'answer': result.get('answer', ''),
+            'latency_ms': latency * 1000,
+            'retrieval_ms': retrieval_ms,
+            'rate_limit_wait_ms': waited * 1000,
+        }
+        if retrieved:
+            record['entities'] = [entity['name'] for entity in retrieved['entities']]
+        for key in ('usage', 'ttft_ms', 'cache_hit', 'error'):
+            if key in result:
+                record[key] = result[key]
+        return record
+
+    @staticmethod
+    def _failed_record(index, question, error, retrieval_ms):
+        """检索失败的问题不调用 LLM，直接记为失败(续跑时重答)"""
+        return {'id': index, 'question': question, 'answer': '', 'latency_ms': 0.0,
+                'retrieval_ms': retrieval_ms, 'rate_limit_wait_ms': 0.0, 'error': error}
+
+    @staticmethod
+    def _open_output(output_path, resume):
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        if not resume or not os.path.exists(output_path):
+            return open(output_path, 'w', encoding='utf-8')
+        # 重写后的文件只含完整的行，追加的新记录不会与半行粘连
+        rewrite_completed(output_path)
+        return open(output_path, 'a', encoding='utf-8')
+
+    def run(self, questions, output_path, resume=True, on_record=None):
+        """回答全部问题并写入 output_path，返回汇总统计"""
+        tracer = get_tracer()
+        latencies = []
+        answered = errors = 0
+        start = time.perf_counter()
+
+        def write(record, called=True):
+            nonlocal answered, errors
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            # 检索失败未调用 LLM 的记录不计入回答耗时
+            if called:
+                latencies.append(record['latency_ms'])
+            if 'error' in record:
+                errors += 1
+            else:
+                answered += 1
+            if on_record:
+                on_record(record)
+
+        with self._open_output(output_path, resume) as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-qa") as pool:
+            done = load_completed(output_path) if resume else set()
+            todo = [(i, q) for i, q in enumerate(questions) if (i, q) not in done]
+            pending = set()
+            for offset in range(0, len(todo), self.batch_size):
+                chunk = todo[offset:offset + self.batch_size]
+                # 下一批的检索与上一批仍在进行的 LLM 调用重叠
+                retrieved = [None] * len(chunk)
+                retrieval_ms = 0.0
+                if self.retrieve_batch:
+                    t0 = time.perf_counter()
+                    try:
+                        with tracer.span("batch_qa_retrieve"):
+                            retrieved = self.retrieve_batch([q for _, q in chunk])
+                        if len(retrieved) != len(chunk):
+                            raise ValueError(f"检索结果 {len(retrieved)} 条，与问题数 {len(chunk)} 不符")
+                    except Exception as e:
+                        # 只把这一批记为失败，其余批次照常回答
+                        tracer.count("batch_qa_retrieve_errors")
+                        retrieval_ms = (time.perf_counter() - t0) * 1000 / len(chunk)
+                        for index, question in chunk:
+                            write(self._failed_record(index, question, f"检索失败: {e}", retrieval_ms), called=False)
+                        continue
+                    retrieval_ms = (time.perf_counter() - t0) * 1000 / len(chunk)
+
+                for (index, question), item in zip(chunk, retrieved):
+                    # 在途任务有上限，结果边完成边写出
+                    while len(pending) >= self.concurrency * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write(future.result())
+                    pending.add(pool.submit(self._answer_one, index, question, item, retrieval_ms))
+
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(future.result())
+
+        wall = time.perf_counter() - start
+        return {
+            'total': len(questions),
+            'skipped': len(questions) - len(todo),
+            'answered': answered,
+            'errors': errors,
+            'wall_s': wall,
+            'throughput_qps': (answered + errors) / wall if wall > 0 else 0.0,
+            'p50_ms': _percentile(latencies, 0.50),
+            'p95_ms': _percentile(latencies, 0.95),
+        }
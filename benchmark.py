@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Agri-mGraphrag 微基准测试
+使用确定性的合成农业语料(作物/病害/虫害/农药、CSV记录与文本)在 1k~10M 实体规模下
+测量核心操作耗时，并输出可在版本间对比的 JSON 结果
+
+用法:
+    python benchmark.py --scales 1000,10000,100000 --output benchmark_results.json
+    python benchmark.py --scales 1000 --compare benchmark_results.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from demo_basic import MockAgriDataProcessor, MockKnowledgeGraph, MockQASystem
+
+
+class SyntheticAgriCorpus:
+    """确定性合成农业语料生成器(相同 seed 与规模生成完全相同的数据)"""
+
+    CROPS = ['水稻', '小麦', '玉米', '大豆', '棉花', '油菜', '马铃薯', '番茄']
+    DISEASES = ['稻瘟病', '小麦锈病', '纹枯病', '白粉病', '赤霉病', '霜霉病', '枯萎病', '炭疽病']
+    PESTS = ['稻飞虱', '蚜虫', '玉米螟', '红蜘蛛', '棉铃虫', '粘虫', '蝗虫', '蓟马']
+    PESTICIDES = ['三环唑', '吡虫啉', '多菌灵', '阿维菌素', '戊唑醇', '毒死蜱', '井冈霉素', '苏云金杆菌']
+
+    # 实体类型占比
+    TYPE_RATIOS = (('crop', 0.2), ('disease', 0.3), ('pest', 0.3), ('pesticide', 0.2))
+
+    def __init__(self, n_entities, seed=42, avg_degree=4):
+        self.n_entities = n_entities
+        self.seed = seed
+        self.avg_degree = avg_degree
+        self.base_names = {
+            'crop': self.CROPS,
+            'disease': self.DISEASES,
+            'pest': self.PESTS,
+            'pesticide': self.PESTICIDES,
+        }
+        self.type_labels = MockAgriDataProcessor().entity_types
+        self.counts = {t: max(1, int(n_entities * ratio)) for t, ratio in self.TYPE_RATIOS}
+
+    def name(self, entity_type, index):
+        """第 index 个该类型实体的名称(前几个即真实名称，之后加编号)"""
+        base = self.base_names[entity_type]
+        name = base[index % len(base)]
+        return name if index < len(base) else f"{name}{index // len(base)}"
+
+    def _pick(self, rng, entity_type):
+        """按幂律偏斜抽取实体，使少量实体成为高度数节点"""
+        return self.name(entity_type, int(self.counts[entity_type] * rng.random() ** 3))
+
+    def entities(self):
+        """逐个生成实体"""
+        for entity_type, count in self.counts.items():
+            label = self.type_labels.get(entity_type, entity_type)
+            for i in range(count):
+                name = self.name(entity_type, i)
+                yield {
+                    'id': f"{entity_type}_{i:08d}",
+                    'name': name,
+                    'type': entity_type,
+                    'description': f"{label}: {name}"
+                }
+
+    def relations(self):
+        """逐个生成关系三元组"""
+        rng = random.Random(self.seed)
+        for _ in range(self.n_entities * self.avg_degree // 2):
+            kind = rng.random()
+            if kind < 0.35:
+                yield (self._pick(rng, 'crop'), 'infected_by', self._pick(rng, 'disease'))
+            elif kind < 0.7:
+                yield (self._pick(rng, 'crop'), 'damaged_by', self._pick(rng, 'pest'))
+            else:
+                target_type = 'disease' if rng.random() < 0.5 else 'pest'
+                yield (self._pick(rng, 'pesticide'), 'prevents', self._pick(rng, target_type))
+
+    def processed_chunks(self, chunk_size=10000):
+        """按块生成 build_from_data 所需的处理结果，避免一次性占用内存"""
+        chunk = []
+        for entity in self.entities():
+            chunk.append(entity)
+            if len(chunk) >= chunk_size:
+                yield {'entities': chunk, 'relations': []}
+                chunk = []
+        if chunk:
+            yield {'entities': chunk, 'relations': []}
+
+        chunk = []
+        for relation in self.relations():
+            chunk.append(relation)
+            if len(chunk) >= chunk_size:
+                yield {'entities': [], 'relations': chunk}
+                chunk = []
+        if chunk:
+            yield {'entities': [], 'relations': chunk}
+
+    def csv_records(self, n, seed_offset=1):
+        """生成结构化记录(字段与 agriculture_data.csv 一致)"""
+        rng = random.Random(self.seed + seed_offset)
+        for _ in range(n):
+            yield {
+                'crop_name': self._pick(rng, 'crop'),
+                'disease': self._pick(rng, 'disease'),
+                'pest': self._pick(rng, 'pest'),
+                'pesticide': self._pick(rng, 'pesticide'),
+            }
+
+    def write_csv(self, path, n):
+        """写出结构化CSV文件"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['crop_name', 'disease', 'pest', 'pesticide'])
+            writer.writeheader()
+            writer.writerows(self.csv_records(n))
+
+    def texts(self, n, seed_offset=2):
+        """生成非结构化农业文本段落"""
+        rng = random.Random(self.seed + seed_offset)
+        for _ in range(n):
+            crop = self._pick(rng, 'crop')
+            disease = self._pick(rng, 'disease')
+            pest = self._pick(rng, 'pest')
+            pesticide = self._pick(rng, 'pesticide')
+            yield (f"{crop}是重要的作物，容易感染{disease}，也会受到{pest}危害。"
+                   f"防治{disease}可以使用{pesticide}，施用尿素有利于{crop}生长。")
+
+    def questions(self, n, seed_offset=3):
+        """生成问答测试问题"""
+        rng = random.Random(self.seed + seed_offset)
+        templates = ['如何防治{disease}？', '{crop}容易得什么病？', '什么是{crop}？', '{pest}怎么办？']
+        for i in range(n):
+            yield templates[i % len(templates)].format(
+                crop=self._pick(rng, 'crop'),
+                disease=self._pick(rng, 'disease'),
+                pest=self._pick(rng, 'pest'))
+
+
+def summarize(durations):
+    """汇总一组耗时(秒)"""
+    ordered = sorted(durations)
+    count = len(ordered)
+    if count == 0:
+        return {'count': 0}
+    total = sum(ordered)
+
+    def percentile(p):
+        return ordered[min(count - 1, int(p * count))] * 1000
+
+    return {
+        'count': count,
+        'total_s': total,
+        'mean_ms': total / count * 1000,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'ops_per_s': count / total if total > 0 else None,
+    }
+
+
+def time_each(fn, items):
+    """逐项计时"""
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def run_scale(n_entities, samples=200, seed=42, structured_batch=50):
+    """在指定规模下运行全部基准"""
+    corpus = SyntheticAgriCorpus(n_entities, seed=seed)
+    processor = MockAgriDataProcessor()
+    results = {}
+
+    # 建图: 整体吞吐
+    kg = MockKnowledgeGraph()
+    build_durations = []
+    entity_time = relation_time = 0.0
+    for chunk in corpus.processed_chunks():
+        start = time.perf_counter()
+        kg.build_from_data(chunk)
+        elapsed = time.perf_counter() - start
+        build_durations.append(elapsed)
+        # 实体块与关系块分别计时，吞吐只除以各自的插入耗时
+        if chunk['entities']:
+            entity_time += elapsed
+        else:
+            relation_time += elapsed
+    results['build_from_data'] = summarize(build_durations)
+    results['build_from_data']['entities_per_s'] = len(kg.entities) / entity_time if entity_time > 0 else None
+    results['build_from_data']['relations'] = len(kg.relations)
+    results['build_from_data']['relations_per_s'] = (len(kg.relations) / relation_time
+                                                     if relation_time > 0 else None)
+
+    results['extract_entities_from_text'] = time_each(
+        processor.extract_entities_from_text, list(corpus.texts(samples)))
+
+    # 结构化处理按批调用(与导入时分批处理一致)
+    records = list(corpus.csv_records(samples * structured_batch))
+    batches = [{'records': records[i:i + structured_batch]}
+               for i in range(0, len(records), structured_batch)]
+    results['process_structured_data'] = time_each(processor.process_structured_data, batches)
+
+    # 四类实体轮流抽取，共 samples 次查询
+    rng = random.Random(seed + 4)
+    entity_types = ('crop', 'disease', 'pest', 'pesticide')
+    names = [corpus._pick(rng, entity_types[i % len(entity_types)]) for i in range(samples)]
+    results['search_entities'] = time_each(lambda q: kg.search_entities(q, limit=5), names)
+    results['get_neighbors'] = time_each(kg.get_neighbors, names)
+
+    qa = MockQASystem(kg)
+    results['answer_question'] = time_each(qa.answer_question, list(corpus.questions(samples)))
+    return results
+
+
+def compare(current, baseline):
+    """打印与基线结果的对比(p50 比值，<1 表示变快)"""
+    print("\n📊 与基线对比 (p50 当前/基线):")
+    for scale, ops in current['results'].items():
+        base_ops = baseline.get('results', {}).get(scale)
+        if not base_ops:
+            continue
+        print(f"   规模 {scale}:")
+        for op, stats in ops.items():
+            base = base_ops.get(op, {})
+            if stats.get('p50_ms') and base.get('p50_ms'):
+                ratio = stats['p50_ms'] / base['p50_ms']
+                print(f"     - {op}: {base['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agri-mGraphrag 微基准测试")
+    parser.add_argument("--scales", default="1000,10000,100000", help="实体规模列表(逗号分隔)，最大支持 10000000")
+    parser.add_argument("--samples", type=int, default=200, help="每个操作的采样次数")
+    parser.add_argument("--seed", type=int, default=42, help="合成语料随机种子")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果JSON输出路径")
+    parser.add_argument("--compare", default="", help="用于对比的基线结果JSON")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': args.seed,
+            'samples': args.samples,
+        },
+        'results': {},
+    }
+
+    for n in scales:
+        print(f"\n🚀 规模: {n} 个实体")
+        results = run_scale(n, samples=args.samples, seed=args.seed)
+        report['results'][str(n)] = results
+        for op, stats in results.items():
+            print(f"   - {op}: p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms ({stats['count']} 次)")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ 结果已保存: {args.output}")
+
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
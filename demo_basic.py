@@ -7,12 +7,56 @@ Agri-mGraphrag V2 基础演示
 import os
 import sys
 import json
+from bisect import insort
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
 
 # 添加项目路径
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+# 字典形式关系的端点与类型字段(按顺序取第一个非空值)
+RELATION_SOURCE_KEYS = ('source', 'from', 'src')
+RELATION_TYPE_KEYS = ('type', 'relation')
+RELATION_TARGET_KEYS = ('target', 'to', 'dst')
+
+
+def _first_field(relation, keys):
+    return next((relation[key] for key in keys if relation.get(key)), None)
+
+
+def relation_triple(relation):
+    """关系统一为 (起点, 关系, 终点)；字典形式取 source/from/src、type/relation、target/to/dst，不完整时返回 None"""
+    if isinstance(relation, dict):
+        triple = (_first_field(relation, RELATION_SOURCE_KEYS),
+                  _first_field(relation, RELATION_TYPE_KEYS),
+                  _first_field(relation, RELATION_TARGET_KEYS))
+    elif isinstance(relation, (list, tuple)) and len(relation) >= 3:
+        triple = tuple(relation[:3])
+    else:
+        return None
+    return triple if all(triple) else None
+
+
+def normalize_relation(relation):
+    """校验关系并统一为按下标取端点的形式
+
+    列表/元组原样返回(不足 3 项的只保存不建索引)；字典转为 [起点, 关系, 终点]，
+    其余字段(如 confidence)作为第 4 项字典保留；无法识别或字典缺少端点/类型时抛出 ValueError。
+    """
+    if isinstance(relation, (list, tuple)):
+        return relation
+    if isinstance(relation, dict):
+        triple = relation_triple(relation)
+        if triple is None:
+            raise ValueError(f"关系缺少起点、类型或终点: {relation!r}")
+        used = RELATION_SOURCE_KEYS + RELATION_TYPE_KEYS + RELATION_TARGET_KEYS
+        extra = {key: value for key, value in relation.items() if key not in used}
+        return list(triple) + ([extra] if extra else [])
+    raise ValueError(f"无法识别的关系: {relation!r}")
+
+
 def display_banner():
     """显示系统banner"""
     banner = """
@@ -179,27 +223,89 @@ class MockKnowledgeGraph:
         self.entities = {}
         self.relations = []
         self.stats = {'node_count': 0, 'relation_count': 0}
+        # 邻接索引: 实体名 -> [(关系下标, 方向)]，避免每次邻居查询扫描全部关系
+        self._adjacency = {}
+        # 节点指标(度数/PageRank/重要度)，由 graph_analytics 预计算
+        self.node_metrics = {}
+        # 每次增删改递增，供 graph_analytics 判断指标是否过期
+        self.version = 0
+        # 可选的追加写变更日志(见 mutation_log.py)与已应用的最后一条日志序号
+        self.mutation_log = None
+        self.log_seq = 0
+        self._log_depth = 0
+    
+    @staticmethod
+    def _check_entity(entity):
+        if not isinstance(entity, dict) or 'id' not in entity:
+            raise ValueError(f"实体缺少 id: {entity!r}")
+    
+    @contextmanager
+    def _logged(self, op, data):
+        """先写日志再修改内存(预写日志)；嵌套调用只记录最外层操作
+
+        调用方须在此之前完成校验，保证写入日志的记录都能重放。
+        """
+        log = self.mutation_log if self._log_depth == 0 else None
+        seq = log.append(op, data) if log is not None else None
+        self._log_depth += 1
+        try:
+            yield
+        finally:
+            self._log_depth -= 1
+        if seq is not None:
+            self.log_seq = seq
+            log.maybe_compact(self)
     
     def add_entity(self, entity):
         """添加实体"""
-        entity_id = entity['id']
-        self.entities[entity_id] = entity
-        self.stats['node_count'] = len(self.entities)
+        self._check_entity(entity)
+        with self._logged('add_entity', entity):
+            entity_id = entity['id']
+            self.entities[entity_id] = entity
+            self.stats['node_count'] = len(self.entities)
+            self.version += 1
     
     def add_relation(self, relation):
         """添加关系"""
-        self.relations.append(relation)
-        self.stats['relation_count'] = len(self.relations)
+        relation = normalize_relation(relation)
+        with self._logged('add_relation', relation):
+            index = len(self.relations)
+            self.relations.append(relation)
+            self.stats['relation_count'] = len(self.relations)
+            
+            self.version += 1
+            
+            if len(relation) >= 3:
+                source, target = relation[0], relation[2]
+                self._link(source, (index, 'outgoing'))
+                if target != source:
+                    self._link(target, (index, 'incoming'))
+    
+    def _link(self, entity_name, link):
+        """加入邻接表；已计算节点指标时按邻居重要度插入，保持降序"""
+        links = self._adjacency.setdefault(entity_name, [])
+        if self.node_metrics:
+            insort(links, link, key=lambda l: -self.get_importance(self._other_end(l)))
+        else:
+            links.append(link)
     
     def build_from_data(self, processed_data):
-        """从处理数据构建图谱"""
-        # 添加实体
-        for entity in processed_data.get('entities', []):
-            self.add_entity(entity)
-        
-        # 添加关系
-        for relation in processed_data.get('relations', []):
-            self.add_relation(relation)
+        """从处理数据构建图谱(写日志时整批作为一条记录)"""
+        entities = processed_data.get('entities', [])
+        relations = processed_data.get('relations', [])
+        # 整批校验通过后才写日志与修改内存，不会留下部分应用的批次
+        for entity in entities:
+            self._check_entity(entity)
+        # 字典形式的关系先转为 [起点, 关系, 终点]，日志与内存中只保存按下标取端点的形式
+        relations = [normalize_relation(relation) for relation in relations]
+        with self._logged('build', {'entities': entities, 'relations': relations}):
+            # 添加实体
+            for entity in entities:
+                self.add_entity(entity)
+            
+            # 添加关系
+            for relation in relations:
+                self.add_relation(relation)
         
         return True
     
@@ -228,32 +334,54 @@ class MockKnowledgeGraph:
                     'score': score
                 })
         
-        # 按分数排序
-        results.sort(key=lambda x: x['score'], reverse=True)
+        # 按分数排序，同分时按节点重要度排序
+        results.sort(key=lambda x: (x['score'], self.get_importance(x['entity']['name'])), reverse=True)
         return results[:limit]
     
-    def get_neighbors(self, entity_name):
-        """获取实体邻居"""
-        neighbors = []
-        
-        for relation in self.relations:
-            if len(relation) >= 3:
-                source, rel_type, target = relation[0], relation[1], relation[2]
-                
-                if source == entity_name:
-                    neighbors.append({
-                        'entity': target,
-                        'relation': rel_type,
-                        'direction': 'outgoing'
-                    })
-                elif target == entity_name:
-                    neighbors.append({
-                        'entity': source, 
-                        'relation': rel_type,
-                        'direction': 'incoming'
-                    })
-        
-        return neighbors
+    def iter_neighbors(self, entity_name):
+        """逐个返回实体邻居(默认按关系插入顺序)"""
+        for link in self._adjacency.get(entity_name, ()):
+            yield {
+                'entity': self._other_end(link),
+                'relation': self.relations[link[0]][1],
+                'direction': link[1]
+            }
+    
+    def get_neighbors(self, entity_name, limit=None):
+        """获取实体邻居(计算过节点指标后按邻居重要度排序，可用 limit 截断)"""
+        return list(islice(self.iter_neighbors(entity_name), limit))
+    
+    def degree(self, entity_name):
+        """获取实体度数"""
+        return len(self._adjacency.get(entity_name, ()))
+    
+    def get_importance(self, entity_name):
+        """获取节点重要度(未计算时为0)"""
+        metrics = self.node_metrics.get(entity_name)
+        return metrics['importance'] if metrics else 0.0
+    
+    def copy(self):
+        """复制图谱结构(实体与关系对象本身共享)，供只读副本写时复制后整体替换"""
+        other = MockKnowledgeGraph()
+        other.entities = dict(self.entities)
+        other.relations = list(self.relations)
+        other.stats = dict(self.stats)
+        other._adjacency = {name: list(links) for name, links in self._adjacency.items()}
+        other.node_metrics = self.node_metrics
+        other.version = self.version
+        other.log_seq = self.log_seq
+        return other
+    
+    def set_node_metrics(self, metrics):
+        """写入节点指标，并按邻居重要度重排邻接表，使邻居截断只取最重要的部分"""
+        self.node_metrics = metrics
+        for entity_name, links in self._adjacency.items():
+            links.sort(key=lambda link: self.get_importance(self._other_end(link)), reverse=True)
+    
+    def _other_end(self, link):
+        index, direction = link
+        relation = self.relations[index]
+        return relation[2] if direction == 'outgoing' else relation[0]
     
     def get_stats(self):
         """获取统计信息"""
@@ -375,7 +503,7 @@ class MockQASystem:
                     'score': len(entity['name'])
                 })
         
-        results.sort(key=lambda x: x['score'], reverse=True)
+        results.sort(key=lambda x: (x['score'], self.kg.get_importance(x['entity']['name'])), reverse=True)
         return results
 
 
@@ -452,6 +580,14 @@ def demo_knowledge_graph(text_result, structured_result):
         type_name = MockAgriDataProcessor().entity_types.get(entity_type, entity_type)
         print(f"     - {type_name}: {count} 个")
     
+    # 预计算节点重要度，供检索、问答与上下文构建排序
+    from graph_analytics import GraphAnalytics
+    metrics = GraphAnalytics(kg).compute()
+    top_nodes = sorted(metrics.items(), key=lambda x: x[1]['pagerank'], reverse=True)[:3]
+    print("   重要节点 (PageRank):")
+    for name, m in top_nodes:
+        print(f"     - {name}: 度数 {m['degree']}, 重要度 {m['importance']:.2f}")
+    
     # 实体搜索演示
     print("\n2️⃣ 实体搜索演示:")
     search_queries = ["水稻", "病害", "肥料"]
@@ -509,6 +645,25 @@ def demo_qa_system(kg):
         print(f"💡 答案: {answer}")
 
 
+def demo_graph_context(kg):
+    """演示k跳子图上下文构建"""
+    from kg_context import KHopContextBuilder
+    
+    print("\n" + "="*60)
+    print("🧭 图谱上下文构建演示")
+    print("="*60)
+    
+    builder = KHopContextBuilder(kg, max_hops=2, token_budget=200)
+    question = "如何防治稻瘟病？"
+    result = builder.build(question)
+    
+    print(f"\n❓ 问题: {question}")
+    print(f"   链接实体: {', '.join(result['seeds']) or '无'}")
+    print(f"   扩展节点: {result['expanded_nodes']} 个, 上下文: {result['token_count']}/{result['token_budget']} tokens")
+    for line in result['context'].splitlines():
+        print(f"     {line}")
+
+
 def demo_system_architecture():
     """演示系统架构"""
     print("\n" + "="*60)
@@ -559,6 +714,9 @@ def main():
         # 问答系统演示
         demo_qa_system(kg)
         
+        # 图谱上下文演示
+        demo_graph_context(kg)
+        
         # 系统架构演示
         demo_system_architecture()
         
@@ -3,26 +3,442 @@
 Agri-mGraphrag V2 完整演示
 集成ChatGPT API、Neo4j数据库和Embedding模型的智慧农业知识图谱问答系统演示
 """
+from __future__ import annotations
+
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import logging
 import argparse
 import json
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING
+from functools import wraps
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-try:
+from tracing import get_tracer
+
+if TYPE_CHECKING:
+    # 功能模块(缓存/批量问答/实体消解/图像导入/流式问答)在使用处导入，避免拖慢演示启动
+    from entity_resolution import EntityResolver
+    from llm_streaming import StreamingAnswerer
     from src.core.agri_system_v2 import AgriMGraphragV2
-except ImportError as e:
-    print(f"Import error: {e}")
-    print("请确保所有模块都已正确安装")
-    sys.exit(1)
 
 
+# 组件名 -> 系统上的单组件初始化方法
+# 系统未提供这些方法时回退到 initialize_all_components: 首次使用任一组件即初始化全部组件
+_COMPONENT_INITIALIZERS = {
+    'data_processing': 'initialize_data_processing',
+    'embedding': 'initialize_embedding',
+    'neo4j': 'initialize_neo4j',
+    'chatgpt': 'initialize_chatgpt',
+}
+
+
+class StartupProfiler:
+    """记录导入与启动各阶段耗时"""
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """计时一个启动阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def report(self):
+        """打印启动耗时分解"""
+        total = time.perf_counter() - self._t0
+        print("\n⏱️  启动耗时分解:")
+        if not self.stages:
+            print("   (未加载任何组件)")
+        for name, elapsed in self.stages:
+            print(f"   - {name}: {elapsed * 1000:.1f} ms")
+        print(f"   总运行时间: {total * 1000:.1f} ms")
+
+
+class _LazyComponentsStatus:
+    """组件状态视图: 读取某个组件状态时才初始化该组件"""
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __getitem__(self, name):
+        self._owner.ensure(name)
+        return self._owner.system.components_status.get(name, False)
+
+    def get(self, name, default=False):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+
+def _result_counts(result):
+    if not isinstance(result, dict):
+        return {}
+    return {'entities': len(result.get('entities', [])), 'relations': len(result.get('relations', []))}
+
+
+def _written_counts(ok, args):
+    if not ok or not args:
+        return {}
+    return {f"kg_{key}_written": value for key, value in _result_counts(args[0]).items()}
+
+
+def _llm_counts(result, args):
+    if not isinstance(result, dict):
+        return {}
+    usage = result.get('usage') or {}
+    return {
+        'llm_tokens': usage.get('total_tokens') or result.get('tokens_used', 0),
+        'qa_errors': 1 if 'error' in result else 0,
+    }
+
+
+# 需要埋点的系统方法 -> 从(返回值, 位置参数)中提取计数器
+_TRACED_METHODS = {
+    'process_agricultural_data': lambda result, args: _result_counts(result),
+    'build_knowledge_graph': _written_counts,
+    'add_embeddings': lambda ok, args: {'embeddings_added': len(args[0])} if ok and args else {},
+    'search_similar_entities': lambda result, args: {'vector_search_results': len(result or [])},
+    'answer_question': _llm_counts,
+}
+
+
+class SystemUnavailable(RuntimeError):
+    """AgriMGraphragV2 系统模块无法导入"""
+
+
+class LazyAgriSystem:
+    """AgriMGraphragV2 的延迟加载包装
+
+    首次访问时才导入系统模块(torch 等重依赖随之加载)。
+    系统提供 initialize_<组件>() 时各组件(向量模型/Neo4j/ChatGPT)在首次使用时才单独初始化；
+    否则首次使用任一组件时调用 initialize_all_components() 一次性初始化(并打印提示)。
+    """
+
+    # 系统方法 -> 所依赖的组件
+    _METHOD_COMPONENTS = {
+        'process_agricultural_data': ('data_processing',),
+        'build_knowledge_graph': ('neo4j',),
+        'add_embeddings': ('embedding',),
+        'search_similar_entities': ('embedding',),
+        'embedding_manager': ('embedding',),
+        'answer_question': ('embedding', 'neo4j', 'chatgpt'),
+    }
+
+    def __init__(self, profiler: StartupProfiler = None, tracer=None):
+        self.profiler = profiler or StartupProfiler()
+        self.tracer = tracer or get_tracer()
+        self.components_status = _LazyComponentsStatus(self)
+        self._system = None
+        self._ready = set()
+        # 问答缓存(可选)与知识图谱版本: 每次成功入图后版本递增，缓存随之失效
+        self.answer_cache = None
+        self.kg_version = 0
+        # 图谱在其他进程导入时，可改用外部版本来源(如处理结果文件的修改时间)
+        self.kg_version_fn = None
+        # 服务模式下多线程可能同时触发首次初始化
+        self._init_lock = threading.RLock()
+
+    @property
+    def loaded(self):
+        return self._system is not None
+
+    @property
+    def system(self) -> AgriMGraphragV2:
+        if self._system is None:
+            with self._init_lock:
+                if self._system is None:
+                    self._load_system()
+        return self._system
+
+    def _load_system(self):
+        with self.profiler.stage("导入 AgriMGraphragV2"):
+            try:
+                from src.core.agri_system_v2 import AgriMGraphragV2
+            except ImportError as e:
+                # 由调用方决定如何处理: 命令行退出，查询服务返回 503
+                raise SystemUnavailable(f"Import error: {e}") from e
+        with self.profiler.stage("创建系统实例"):
+            self._system = AgriMGraphragV2()
+
+    def ensure(self, *names):
+        """确保指定组件已初始化"""
+        if all(name in self._ready for name in names):
+            return
+        system = self.system
+        with self._init_lock:
+            for name in names:
+                if name in self._ready:
+                    continue
+                initializer = getattr(system, _COMPONENT_INITIALIZERS.get(name, ''), None)
+                if callable(initializer):
+                    with self.profiler.stage(f"初始化组件 {name}"):
+                        initializer()
+                    self._ready.add(name)
+                else:
+                    print(f"⚠️  系统未提供 {_COMPONENT_INITIALIZERS.get(name, name)}()，"
+                          f"改为一次性初始化全部组件(不再按组件延迟加载)")
+                    with self.profiler.stage("初始化全部组件"):
+                        system.initialize_all_components()
+                    self._ready.update(_COMPONENT_INITIALIZERS)
+                    self._ready.add(name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        required = self._METHOD_COMPONENTS.get(name)
+        if required:
+            self.ensure(*required)
+        attr = getattr(self.system, name)
+        if self.tracer.enabled and name in _TRACED_METHODS:
+            attr = self._traced(name, attr)
+        if name == 'build_knowledge_graph':
+            attr = self._versioned(attr)
+        elif name == 'answer_question' and self.answer_cache is not None:
+            from answer_cache import cached_answer
+            attr = cached_answer(attr, self.answer_cache, self.current_kg_version)
+        return attr
+
+    def current_kg_version(self):
+        return self.kg_version_fn() if self.kg_version_fn else self.kg_version
+
+    def _versioned(self, method):
+        """入图成功后递增知识图谱版本"""
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            result = method(*args, **kwargs)
+            if result:
+                self.kg_version += 1
+            return result
+        return wrapper
+
+    def _traced(self, name, method):
+        """为系统方法包上计时 span 与计数器"""
+        tracer = self.tracer
+        extract = _TRACED_METHODS[name]
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                result = method(*args, **kwargs)
+            tracer.count(f"{name}_calls")
+            for key, value in extract(result, args).items():
+                tracer.count(key, value)
+            return result
+        return wrapper
+
+    def get_system_status(self):
+        """系统状态，附带埋点指标与问答缓存统计"""
+        status = self.system.get_system_status()
+        if self.tracer.enabled:
+            status['metrics'] = self.tracer.snapshot()
+        if self.answer_cache is not None:
+            status['answer_cache'] = self.answer_cache.stats()
+        return status
+
+    def cleanup(self):
+        if self._system is not None:
+            self._system.cleanup()
+
+
+def build_answer_cache(system, size, ttl_s, semantic_threshold, embed_method="encode"):
+    """按参数创建问答缓存；语义匹配使用嵌入管理器编码问题"""
+    if size <= 0:
+        return None
+    from answer_cache import AnswerCache
+
+    encode = None
+    if semantic_threshold > 0:
+        encode = lambda question: getattr(system.embedding_manager, embed_method)(question)
+    return AnswerCache(max_entries=size, ttl_s=ttl_s, encode=encode,
+                       semantic_threshold=semantic_threshold)
+
+
+def build_entity_resolver(system, jaccard_threshold=0.5, embedding_threshold=0.0):
+    """创建导入阶段的实体消解器；embedding_threshold > 0 时用向量相似度复核候选"""
+    from entity_resolution import EntityResolver
+
+    encode = None
+    if embedding_threshold > 0:
+        encode = lambda texts: system.embedding_manager.encode(texts)
+    return EntityResolver(jaccard_threshold=jaccard_threshold, encode=encode,
+                          embedding_threshold=embedding_threshold)
+
+
+def resolve_entities(resolver: EntityResolver, data):
+    """对一个处理结果做增量实体消解"""
+    if resolver is None or not isinstance(data, dict):
+        return data
+    resolved = resolver.resolve_data(data)
+    info = resolved['entity_resolution']
+    print(f"   🔗 实体消解: {info['input_entities']} → {len(resolved['entities'])} 个实体 "
+          f"(合并 {info['merged']}, 去除关系 {info['relations_removed']})")
+    return resolved
+
+
+def ingest_images(system, image_dir, args, existing_entities=()):
+    """批量导入图像目录，返回处理结果；未安装 pillow 或没有可用的描述模型时返回 None
+
+    图像描述中与 existing_entities 同名的实体复用已有 id。
+    """
+    from image_ingest import ImageIngestPipeline, PerceptualHashCache, build_describer, scan_images
+
+    paths = scan_images(image_dir)
+    if not paths:
+        return None
+    describer = build_describer(system, args.llm_config, args.vision_model)
+    # 图像描述成批编码为向量，写入图像实体(构建快照时直接使用)
+    encode_batch = None
+    if system.components_status['embedding']:
+        encode_batch = getattr(system.embedding_manager, 'encode', None)
+    cache = PerceptualHashCache(args.image_cache) if args.image_cache else None
+    try:
+        pipeline = ImageIngestPipeline(describer, cache, args.image_workers, args.image_batch_size,
+                                       encode_batch=encode_batch)
+        processed, stats = pipeline.run(paths, root=image_dir, existing_entities=existing_entities)
+    except RuntimeError as e:
+        print(f"⚠️  跳过图像导入: {e}")
+        return None
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"   🖼️  图像: {stats['images']} 张, 解码 {stats['decoded']}, 缓存命中 {stats['file_cache_hits']}, "
+          f"近重复 {stats['duplicates']}, 描述 {stats['described']}, 向量 {stats['embedded']}, 失败 {stats['errors']} "
+          f"({stats['images_per_s']:.1f} 张/秒)")
+    return processed
+
+
+def build_query_graph(processed_data_list):
+    """用已处理的数据构建内存图谱并计算节点重要度"""
+    from demo_basic import MockKnowledgeGraph
+    from graph_analytics import GraphAnalytics
+
+    kg = MockKnowledgeGraph()
+    for data in processed_data_list:
+        if data:
+            kg.build_from_data(data)
+    GraphAnalytics(kg).compute()
+    return kg
+
+
+def build_streamer(system, processed_data_list, config_path="config/config_v2.yaml"):
+    """用已处理的数据构建流式问答器；未配置 OpenAI 兼容接口时返回 None"""
+    from hybrid_retrieval import HybridRetriever
+    from kg_context import KHopContextBuilder
+    from llm_streaming import StreamingAnswerer, graph_retrieve, load_llm_config
+
+    config = load_llm_config(config_path)
+    if not (config['api_key'] or config['base_url']):
+        return None
+    kg = build_query_graph(processed_data_list)
+
+    # 仅在向量模型已加载时使用向量检索，不为流式问答额外触发初始化
+    vector_search = lambda q, k: []
+    if system.loaded and system.components_status['embedding']:
+        vector_search = lambda q, k: system.search_similar_entities(q, k=k)
+    retriever = HybridRetriever(kg.search_entities, vector_search)
+    return StreamingAnswerer(graph_retrieve(retriever, KHopContextBuilder(kg)), **config)
+
+
+def demo_llm_questions(system, questions):
+    """逐题调用系统的 answer_question(经过问答缓存与埋点)"""
+    if not system.components_status['chatgpt']:
+        print("❌ ChatGPT未配置，无法进行LLM回答。")
+        return
+    print("\n== LLM 辅助问答 ==")
+    for i, q in enumerate(questions, 1):
+        print(f"\n❓ 问题 {i}: {q}")
+        ans = system.answer_question(q, use_kg_context=True)
+        if 'error' not in ans:
+            print(f"💡 答案: {ans.get('answer', '')[:200]}{'...' if len(ans.get('answer',''))>200 else ''}")
+        else:
+            print(f"❌ 回答失败: {ans['error']}")
+
+
+def run_batch_qa(system, questions, processed_data_list, args):
+    """--questions_file 的并发批量问答，结果逐条写入 args.answers_out(可断点续跑)
+
+    system 后端(默认)逐题调用系统的 answer_question，经过问答缓存与埋点；
+    direct 后端(需显式指定)直接调用 OpenAI 兼容接口，问题按批做实体链接与向量编码。
+    """
+    from batch_qa import BatchGraphRetriever, BatchQAEngine
+    from graph_snapshot import GraphSnapshot, snapshot_is_stale
+    from kg_context import KHopContextBuilder
+    from llm_streaming import StreamingAnswerer, load_llm_config
+
+    kg = None
+    engine_args = dict(concurrency=args.qa_concurrency, rate_limit=args.qa_rate_limit,
+                       batch_size=args.qa_batch_size)
+    config = load_llm_config(args.llm_config)
+    if args.qa_backend == 'direct' and (config['api_key'] or config['base_url']):
+        sources = [args.processed_out_struct, args.processed_out_text, args.processed_out_image]
+        use_snapshot = bool(args.snapshot_dir) and not snapshot_is_stale(args.snapshot_dir, sources)
+        if args.snapshot_dir and not use_snapshot:
+            print(f"⚠️  快照 {args.snapshot_dir} 不存在或已过期，改用处理结果构建图谱")
+        if use_snapshot:
+            kg = GraphSnapshot(args.snapshot_dir)
+            builder = KHopContextBuilder(kg, importance=kg.get_importance)
+        else:
+            kg = build_query_graph(processed_data_list)
+            builder = KHopContextBuilder(kg)
+        # 快照带实体向量时，每批问题只调用一次批量编码
+        encode_batch = None
+        if getattr(kg, 'has_vectors', False) and system.components_status['embedding']:
+            encode_batch = getattr(system.embedding_manager, 'encode', None)
+        streamer = StreamingAnswerer(None, **config)
+        engine = BatchQAEngine(streamer.answer, BatchGraphRetriever(kg, builder, encode_batch), **engine_args)
+        backend = f"direct ({streamer.model})"
+    elif args.qa_backend == 'direct':
+        print("❌ 未配置 OpenAI 兼容接口(openai.base_url/api_key)，无法使用 direct 后端。")
+        return
+    elif not system.components_status['chatgpt']:
+        print("❌ ChatGPT未配置，无法进行LLM回答。")
+        return
+    else:
+        engine = BatchQAEngine(lambda q, retrieved: system.answer_question(q, use_kg_context=True),
+                               **engine_args)
+        backend = "system"
+
+    print(f"\n== LLM 辅助问答 ({len(questions)} 题, 后端 {backend}, 并发 {engine.concurrency}) ==")
+    verbose = len(questions) <= 20
+    progress = {'count': 0}
+
+    def on_record(record):
+        progress['count'] += 1
+        if verbose:
+            print(f"\n❓ 问题 {record['id'] + 1}: {record['question']}")
+            if 'error' not in record:
+                answer = record['answer']
+                print(f"💡 答案: {answer[:200]}{'...' if len(answer) > 200 else ''} ({record['latency_ms']:.0f} ms)")
+            else:
+                print(f"❌ 回答失败: {record['error']}")
+        elif progress['count'] % 100 == 0:
+            print(f"   -> 已完成 {progress['count']} 题")
+
+    try:
+        summary = engine.run(questions, args.answers_out, resume=not args.no_resume, on_record=on_record)
+    finally:
+        if hasattr(kg, 'close'):
+            kg.close()
+    if summary['skipped']:
+        print(f"\n⏭️  跳过已完成 {summary['skipped']} 题")
+    print(f"\n✓ 回答 {summary['answered']} 题, 失败 {summary['errors']} 题, 用时 {summary['wall_s']:.1f} s "
+          f"({summary['throughput_qps']:.2f} 题/秒, p50 {summary['p50_ms']:.0f} ms, p95 {summary['p95_ms']:.0f} ms)")
+    print(f"已保存问答结果: {args.answers_out}")
 
 
 def display_banner():
@@ -225,6 +641,43 @@ def demo_embedding_search(system: AgriMGraphragV2, processed_data_list: list):
         print(f"❌ 向量搜索演示失败: {str(e)}")
 
 
+def demo_hybrid_search(system: AgriMGraphragV2, processed_data_list: list):
+    """演示关键词 + 向量混合检索"""
+    from demo_basic import MockKnowledgeGraph
+    from hybrid_retrieval import HybridRetriever
+    
+    print("\n" + "="*60)
+    print("🔀 混合检索演示 (关键词 + 向量)")
+    print("="*60)
+    
+    # 用已保存的处理结果构建内存关键词索引
+    kg = MockKnowledgeGraph()
+    for data in processed_data_list:
+        if data:
+            kg.build_from_data(data)
+    
+    vector_search = None
+    if system.components_status['embedding']:
+        vector_search = lambda q, k: system.search_similar_entities(q, k=k)
+    else:
+        print("⚠️  Embedding模型未初始化，仅使用关键词检索")
+    
+    retriever = HybridRetriever(kg.search_entities, vector_search or (lambda q, k: []))
+    try:
+        for query in ["水稻", "植物病害", "害虫防治"]:
+            print(f"\n🔎 搜索: '{query}'")
+            results = retriever.search(query, k=3)
+            if not results:
+                print("     未找到相关实体")
+            for i, item in enumerate(results, 1):
+                sources = ", ".join(f"{src}#{info['rank']}" for src, info in item['sources'].items())
+                print(f"     {i}. {item['name']} ({item['type']}) - 融合得分: {item['score']:.4f} [{sources}]")
+    except Exception as e:
+        print(f"❌ 混合检索演示失败: {str(e)}")
+    finally:
+        retriever.close()
+
+
 def demo_qa_system(system: AgriMGraphragV2):
     """演示问答系统"""
     print("\n" + "="*60)
@@ -289,11 +742,30 @@ def demo_system_status(system: AgriMGraphragV2):
         print(f"\n知识图谱统计:")
         print(f"  📊 节点总数: {stats.get('total_nodes', 0)}")
         print(f"  🔗 关系总数: {stats.get('total_relationships', 0)}")
+    
+    # 埋点指标
+    metrics = status.get('metrics')
+    if metrics:
+        print("\n阶段耗时:")
+        for name, span in metrics['spans'].items():
+            print(f"  ⏱️  {name}: {span['count']} 次, 平均 {span['mean_ms']:.1f} ms, p99 ≤ {span['p99_ms']:.0f} ms")
+        if metrics['counters']:
+            print("\n计数器:")
+            for name, value in metrics['counters'].items():
+                print(f"  🔢 {name}: {value}")
+    
+    # 问答缓存
+    cache_stats = status.get('answer_cache')
+    if cache_stats:
+        print("\n问答缓存:")
+        print(f"  💾 条目: {cache_stats['entries']}, 命中率: {cache_stats['hit_rate']:.1%} "
+              f"(精确 {cache_stats['exact_hits']}, 语义 {cache_stats['semantic_hits']}, 未命中 {cache_stats['misses']})")
+        print(f"  ⚡ 节省LLM耗时: {cache_stats['saved_latency_s']:.1f} s")
 
 
-def interactive_qa_demo(system: AgriMGraphragV2):
-    """交互式问答演示"""
-    if not system.components_status['chatgpt']:
+def interactive_qa_demo(system: AgriMGraphragV2, streamer: StreamingAnswerer = None):
+    """交互式问答演示；提供 streamer 时边生成边输出"""
+    if streamer is None and not system.components_status['chatgpt']:
         return
         
     print("\n" + "="*60)
@@ -310,6 +782,10 @@ def interactive_qa_demo(system: AgriMGraphragV2):
                 
             if not question:
                 continue
+            
+            if streamer is not None:
+                print_streamed_answer(streamer, question)
+                continue
                 
             print("🤖 AI正在思考...")
             
@@ -328,9 +804,27 @@ def interactive_qa_demo(system: AgriMGraphragV2):
             print(f"❌ 发生错误: {str(e)}")
 
 
+def print_streamed_answer(streamer: StreamingAnswerer, question):
+    """先打印检索到的实体，再随 token 到达逐段打印答案"""
+    for event in streamer.stream(question):
+        if event['type'] == 'context':
+            names = ", ".join(event['seeds']) or "无"
+            print(f"🔎 相关实体: {names} (图谱路径 {event['paths']} 条, 检索 {event['retrieval_ms']:.0f} ms)")
+            print("\n💡 答案:")
+        elif event['type'] == 'token':
+            print(event['text'], end="", flush=True)
+        elif event['type'] == 'error':
+            print(f"\n❌ 回答失败: {event['error']}")
+        elif event['type'] == 'done':
+            ttft = f"{event['ttft_ms']:.0f} ms" if event['ttft_ms'] is not None else "N/A"
+            print(f"\n⏱️  首字 {ttft}, 总计 {event['total_ms']:.0f} ms")
+
+
 def main():
     """主演示函数"""
     display_banner()
+    profiler = StartupProfiler()
+    system = LazyAgriSystem(profiler)
     
     try:
         parser = argparse.ArgumentParser(description="Agri-mGraphrag V2 Demo")
@@ -339,30 +833,58 @@ def main():
         parser.add_argument("--unstructured", default="data/raw/unstructured/agriculture_text.txt", help="非结构化文本路径")
         parser.add_argument("--processed_out_struct", default="data/processed/structured_result.json", help="结构化结果输出")
         parser.add_argument("--processed_out_text", default="data/processed/unstructured_result.json", help="文本结果输出")
+        parser.add_argument("--images", default="data/raw/images", help="图像目录(批量导入)")
+        parser.add_argument("--processed_out_image", default="data/processed/image_result.json", help="图像结果输出")
+        parser.add_argument("--image_cache", default="data/processed/image_cache.jsonl", help="图像感知哈希缓存(空为不缓存)")
+        parser.add_argument("--image_workers", type=int, default=os.cpu_count(), help="图像解码进程数")
+        parser.add_argument("--image_batch_size", type=int, default=8, help="每次描述请求的图像数")
+        parser.add_argument("--vision_model", default="gpt-4o-mini", help="图像描述使用的视觉模型")
         parser.add_argument("--embeddings_out", default="data/embeddings/index", help="向量索引前缀")
         parser.add_argument("--question", default="", help="单条检索问题（启用LLM回答）")
         parser.add_argument("--questions_file", default="", help="批量问题文件(每行一问)（启用LLM回答）")
+        parser.add_argument("--resolve_entities", action="store_true", help="导入时合并近重复实体(如 稻瘟/稻瘟病；水稻稻瘟病 等带作物限定词的名称保持独立)")
+        parser.add_argument("--resolution_jaccard", type=float, default=0.5, help="实体消解的字符相似度阈值")
+        parser.add_argument("--resolution_embedding_threshold", type=float, default=0.0,
+                            help="实体消解的向量相似度复核阈值(0为不复核)")
+        parser.add_argument("--graph_log_dir", default="", help="导入时把处理结果追加写入图谱变更日志(供查询服务增量加载)")
+        parser.add_argument("--answers_out", default="data/qa/answers.jsonl", help="批量问答(--questions_file)结果输出(JSONL，可断点续跑)")
+        parser.add_argument("--no_resume", action="store_true", help="忽略已有问答结果，全部重新回答")
+        parser.add_argument("--qa_backend", choices=["system", "direct"], default="system",
+                            help="批量问答后端: system=系统answer_question, direct=直连OpenAI兼容接口并批量检索")
+        parser.add_argument("--qa_concurrency", type=int, default=8, help="并发LLM调用数")
+        parser.add_argument("--qa_rate_limit", type=float, default=0.0, help="LLM调用速率上限(次/秒, 0为不限)")
+        parser.add_argument("--qa_batch_size", type=int, default=64, help="批量检索的问题数")
+        parser.add_argument("--snapshot_dir", default="", help="图谱/向量快照目录(direct 后端可用其批量向量检索)")
+        parser.add_argument("--answer_cache_size", type=int, default=1024, help="问答缓存条目数(0为关闭)")
+        parser.add_argument("--answer_cache_ttl", type=float, default=3600.0, help="问答缓存有效期(秒)")
+        parser.add_argument("--semantic_cache_threshold", type=float, default=0.0, help="语义缓存相似度阈值(0为仅精确匹配)")
+        parser.add_argument("--llm_config", default="config/config_v2.yaml", help="OpenAI 兼容接口配置文件")
+        parser.add_argument("--stream", action="store_true",
+                            help="交互式问答流式输出(直连 OpenAI 兼容接口，不经过系统 answer_question、问答缓存与埋点)")
+        parser.add_argument("--trace", action="store_true", help="启用各阶段耗时与计数埋点")
+        parser.add_argument("--metrics_out", default="", help="埋点指标输出路径(Prometheus文本格式)")
         args = parser.parse_args()
+        system.tracer.enabled = args.trace or bool(args.metrics_out)
+        system.answer_cache = build_answer_cache(system, args.answer_cache_size, args.answer_cache_ttl,
+                                                 args.semantic_cache_threshold)
         # 使用用户提供的数据文件
         print("📋 使用用户数据进行演示...")
         
-        # 初始化系统
-        print("\n🔧 初始化系统...")
-        system = AgriMGraphragV2()
-        
-        # 初始化所有组件
-        print("⚙️ 初始化组件...")
-        components_status = system.initialize_all_components()
-        
-        # 显示系统状态
-        demo_system_status(system)
+        # 组件按需初始化: 仅在首次使用时加载向量模型/连接Neo4j/创建ChatGPT客户端
+        print("\n🔧 系统组件将按需初始化...")
         
         processed_data_list = []
+        cached = []
         if args.mode == "ingest":
             # 处理并保存
             print("\n== 导入阶段 ==")
+            # 各数据源共用一个消解器，后处理的数据块会合并到已有实体上
+            resolver = None
+            if args.resolve_entities:
+                resolver = build_entity_resolver(system, args.resolution_jaccard,
+                                                 args.resolution_embedding_threshold)
             if os.path.exists(args.structured):
-                sd = system.process_agricultural_data(args.structured, "structured")
+                sd = resolve_entities(resolver, system.process_agricultural_data(args.structured, "structured"))
                 processed_data_list.append(sd)
                 try:
                     os.makedirs(os.path.dirname(args.processed_out_struct), exist_ok=True)
@@ -373,7 +895,7 @@ def main():
                     print(f"保存结构化结果失败: {e}")
 
             if os.path.exists(args.unstructured):
-                td = system.process_agricultural_data(args.unstructured, "text")
+                td = resolve_entities(resolver, system.process_agricultural_data(args.unstructured, "text"))
                 processed_data_list.append(td)
                 try:
                     os.makedirs(os.path.dirname(args.processed_out_text), exist_ok=True)
@@ -383,8 +905,39 @@ def main():
                 except Exception as e:
                     print(f"保存文本结果失败: {e}")
 
+            if os.path.isdir(args.images):
+                existing = [e for d in processed_data_list if d for e in d.get('entities', [])]
+                idata = resolve_entities(resolver, ingest_images(system, args.images, args, existing))
+                if idata:
+                    processed_data_list.append(idata)
+                    try:
+                        os.makedirs(os.path.dirname(args.processed_out_image), exist_ok=True)
+                        with open(args.processed_out_image, 'w', encoding='utf-8') as f:
+                            json.dump(idata, f, ensure_ascii=False)
+                        print(f"已保存图像处理结果: {args.processed_out_image}")
+                    except Exception as e:
+                        print(f"保存图像结果失败: {e}")
+
             # 入图
             demo_knowledge_graph(system, processed_data_list)
+            
+            # 追加写入图谱变更日志(只写本次增量，查询服务跟随日志更新)
+            if args.graph_log_dir and processed_data_list:
+                from mutation_log import new_items, open_graph
+                # 恢复日志中已有的图谱，只追加尚未包含的实体与关系(重复导入不产生重复关系)
+                log_kg, _ = open_graph(args.graph_log_dir)
+                for data in processed_data_list:
+                    if not data:
+                        continue
+                    delta = new_items(log_kg, data)
+                    if not delta['entities'] and not delta['relations']:
+                        continue
+                    try:
+                        log_kg.build_from_data(delta)
+                    except ValueError as e:
+                        print(f"跳过无效处理结果: {e}")
+                log_kg.mutation_log.close()
+                print(f"已写入图谱变更日志: {args.graph_log_dir} (序号 {log_kg.log_seq})")
         
             # 生成并保存向量索引
             if processed_data_list and system.components_status['embedding']:
@@ -403,9 +956,8 @@ def main():
 
         else:  # query
             print("\n== 检索阶段 ==")
-            # 加载处理结果
-            cached = []
-            for p in [args.processed_out_struct, args.processed_out_text]:
+            # 加载处理结果(纯JSON读取，无需初始化任何组件)
+            for p in [args.processed_out_struct, args.processed_out_text, args.processed_out_image]:
                 if os.path.exists(p):
                     try:
                         with open(p, 'r', encoding='utf-8') as f:
@@ -415,20 +967,23 @@ def main():
             if not cached:
                 print("未找到已保存的处理结果，请先使用 --mode=ingest 运行。")
             else:
-                # 加载向量索引
+                # 加载向量索引(仅初始化向量模型)
                 if system.components_status['embedding']:
                     try:
-                        system.embedding_manager.load_embeddings(args.embeddings_out)
+                        with profiler.stage("加载向量索引"):
+                            system.embedding_manager.load_embeddings(args.embeddings_out)
                         print(f"已加载向量索引: {args.embeddings_out}")
                     except Exception as e:
                         print(f"加载向量索引失败: {e}")
                 # 直接检索演示（不触发LLM）
                 demo_embedding_search(system, cached)
+                demo_hybrid_search(system, cached)
 
                 # LLM 辅助检索与回答（不重复数据处理）
-                questions = []
                 if args.question.strip():
-                    questions.append(args.question.strip())
+                    demo_llm_questions(system, [args.question.strip()])
+                # 批量问题文件并发回答，结果可断点续跑
+                questions = []
                 if args.questions_file and os.path.exists(args.questions_file):
                     try:
                         with open(args.questions_file, 'r', encoding='utf-8', errors='ignore') as f:
@@ -437,23 +992,41 @@ def main():
                         print(f"加载问题文件失败: {e}")
 
                 if questions:
-                    if not system.components_status['chatgpt']:
-                        print("❌ ChatGPT未配置，无法进行LLM回答。")
-                    else:
-                        print("\n== LLM 辅助问答 ==")
-                        for i, q in enumerate(questions, 1):
-                            print(f"\n❓ 问题 {i}: {q}")
-                            ans = system.answer_question(q, use_kg_context=True)
-                            if 'error' not in ans:
-                                print(f"💡 答案: {ans.get('answer', '')[:200]}{'...' if len(ans.get('answer',''))>200 else ''}")
-                            else:
-                                print(f"❌ 回答失败: {ans['error']}")
+                    run_batch_qa(system, questions, cached, args)
+        
+        # 显示系统状态(仅反映本次实际初始化的组件)
+        if system.loaded:
+            demo_system_status(system)
         
-        # 交互式问答
-        if system.components_status['chatgpt']:
+        # 交互式问答(确认后才初始化ChatGPT)
+        try:
             try_interactive = input("\n🤔 是否尝试交互式问答? (y/N): ").strip().lower()
-            if try_interactive in ['y', 'yes', '是', 'Y']:
+        except EOFError:
+            try_interactive = ''
+        if try_interactive in ['y', 'yes', '是', 'Y']:
+            streamer = None
+            if args.stream:
+                streamer = build_streamer(system, processed_data_list or cached, args.llm_config)
+            if streamer is not None:
+                try:
+                    interactive_qa_demo(system, streamer)
+                finally:
+                    streamer.close()
+            elif system.components_status['chatgpt']:
                 interactive_qa_demo(system)
+            else:
+                print("❌ ChatGPT集成未配置")
+        
+        profiler.report()
+        
+        if args.metrics_out:
+            try:
+                os.makedirs(os.path.dirname(args.metrics_out) or '.', exist_ok=True)
+                with open(args.metrics_out, 'w', encoding='utf-8') as f:
+                    f.write(system.tracer.to_prometheus())
+                print(f"已保存埋点指标: {args.metrics_out}")
+            except Exception as e:
+                print(f"保存埋点指标失败: {e}")
         
         print("\n" + "="*60)
         print("🎉 Agri-mGraphrag V2 演示完成!")
@@ -462,6 +1035,10 @@ def main():
         # 清理资源
         system.cleanup()
         
+    except SystemUnavailable as e:
+        print(e)
+        print("请确保所有模块都已正确安装")
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\n\n👋 演示被用户中断")
     except Exception as e:
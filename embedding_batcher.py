@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+查询向量微批调度
+并发请求各自提交的查询文本在最多 max_wait_ms 或 max_batch_size 条内合并为一次批量编码，
+再把结果分发回各等待方，减少小批量前向计算的浪费
+
+用法(与逐条编码对比 p50/p99 延迟):
+    python embedding_batcher.py --clients 32 --requests 20 --max_batch_size 32 --max_wait_ms 5
+    python embedding_batcher.py --model all-MiniLM-L6-v2   # 使用真实 sentence-transformers 模型
+"""
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from tracing import get_tracer
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """跨请求微批调度器
+
+    encode_batch(texts) 接收文本列表，返回等长的向量列表。
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """提交一条文本，返回 Future"""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        """编码单条文本(阻塞直到所在批次完成)"""
+        return self.submit(text).result(timeout)
+
+    def _collect(self, first):
+        """以第一条为起点收集一个批次，返回 (批次, 是否收到停止信号)"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stop = self._collect(item)
+            try:
+                self._run(batch)
+            except Exception as e:
+                # 任何异常都只让本批次失败，调度线程继续服务后续请求
+                self._fail(batch, e)
+            if stop:
+                return
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _run(self, batch):
+        # 同一批次内的重复文本只编码一次
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        tracer = get_tracer()
+        try:
+            with tracer.span("embedding_batch"):
+                vectors = list(self.encode_batch(unique))
+            if len(vectors) != len(unique):
+                # 无法确定向量与文本的对应关系，整批失败
+                raise ValueError(f"encode_batch 返回 {len(vectors)} 个向量，应为 {len(unique)} 个")
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        by_text = dict(zip(unique, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+        self.batches += 1
+        self.items += len(batch)
+        tracer.count("embedding_batches")
+        tracer.count("embedding_batched_items", len(batch))
+
+    @property
+    def avg_batch_size(self):
+        return self.items / self.batches if self.batches else 0.0
+
+    def close(self):
+        """处理完已提交的请求后停止"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+def install_batcher(embedding_manager, method="encode", max_batch_size=32, max_wait_ms=5.0):
+    """为嵌入管理器的单条/列表编码方法接入微批
+
+    method 指向的方法需同时接受 str 与 list[str]，与 SentenceTransformer.encode 一致。
+    只有不带额外参数的单条字符串调用进入微批，列表或带参数的调用仍直接编码；
+    系统内部若通过其他方法名编码查询，则不经过微批(可从 batcher.batches 是否增长确认)。
+    """
+    original = getattr(embedding_manager, method)
+    batcher = EmbeddingBatcher(lambda texts: list(original(texts)), max_batch_size, max_wait_ms)
+
+    def encode(texts, *args, **kwargs):
+        if isinstance(texts, str) and not args and not kwargs:
+            return batcher.encode(texts)
+        return original(texts, *args, **kwargs)
+
+    setattr(embedding_manager, method, encode)
+    return batcher
+
+
+def _simulated_encoder(overhead_ms, per_item_ms):
+    """模拟前向计算: 固定开销 + 每条开销(sleep 释放 GIL，与 torch 推理相同)"""
+    def encode_batch(texts):
+        time.sleep((overhead_ms + per_item_ms * len(texts)) / 1000.0)
+        return [[float(len(text))] for text in texts]
+    return encode_batch
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {'p50_ms': pick(0.50), 'p99_ms': pick(0.99)}
+
+
+def _run_clients(encode_one, clients, requests):
+    """并发客户端各发送 requests 条查询，返回单条延迟与总吞吐"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(cid):
+        for i in range(requests):
+            start = time.perf_counter()
+            encode_one(f"查询{cid}-{i}: 如何防治稻瘟病")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - start
+    result = _percentiles(latencies)
+    result['throughput_qps'] = len(latencies) / total
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询向量微批 vs 逐条编码 基准")
+    parser.add_argument("--clients", type=int, default=32, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=20, help="每个客户端的请求数")
+    parser.add_argument("--max_batch_size", type=int, default=32, help="最大批大小")
+    parser.add_argument("--max_wait_ms", type=float, default=5.0, help="最长等待合批时间(毫秒)")
+    parser.add_argument("--overhead_ms", type=float, default=8.0, help="模拟编码器每次调用的固定开销")
+    parser.add_argument("--per_item_ms", type=float, default=0.3, help="模拟编码器每条文本的开销")
+    parser.add_argument("--model", default="", help="使用真实 sentence-transformers 模型名")
+    args = parser.parse_args()
+
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+        encode_batch = lambda texts: list(model.encode(texts))
+    else:
+        encode_batch = _simulated_encoder(args.overhead_ms, args.per_item_ms)
+
+    # 逐条编码: 模型实例不可并发调用，按锁串行
+    model_lock = threading.Lock()
+
+    def encode_unbatched(text):
+        with model_lock:
+            return encode_batch([text])[0]
+
+    print(f"🚀 {args.clients} 个并发客户端 × {args.requests} 条查询")
+    unbatched = _run_clients(encode_unbatched, args.clients, args.requests)
+    print(f"   逐条编码: p50 {unbatched['p50_ms']:.1f} ms, p99 {unbatched['p99_ms']:.1f} ms, "
+          f"{unbatched['throughput_qps']:.0f} qps")
+
+    batcher = EmbeddingBatcher(encode_batch, args.max_batch_size, args.max_wait_ms)
+    batched = _run_clients(batcher.encode, args.clients, args.requests)
+    batcher.close()
+    print(f"   微批编码: p50 {batched['p50_ms']:.1f} ms, p99 {batched['p99_ms']:.1f} ms, "
+          f"{batched['throughput_qps']:.0f} qps (平均批大小 {batcher.avg_batch_size:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+只读图谱快照
+将图谱邻接表(CSR)、实体名表、节点重要度与实体向量矩阵写成定长二进制文件，
+各查询进程以只读 mmap 方式映射同一份快照，快照数据占用的内存不随进程数增长
+(嵌入模型等其他状态仍由各进程各自加载)
+"""
+import json
+import math
+import mmap
+import os
+from array import array
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # 未安装时向量检索退化为纯 Python 计算
+    np = None
+
+from demo_basic import MockAgriDataProcessor
+
+SNAPSHOT_VERSION = 2
+
+# 文件名 -> array 类型码
+_ARRAY_FILES = {
+    'name_offsets': 'q',
+    'search_offsets': 'q',
+    'id_offsets': 'q',
+    'node_types': 'H',
+    'importance': 'f',
+    'indptr': 'q',
+    'indices': 'i',
+    'edge_relations': 'H',
+    'edge_outgoing': 'b',
+    'vectors': 'f',
+}
+
+
+# 变长字符串表 -> 偏移数组
+_STRING_FILES = {
+    'names': 'name_offsets',
+    'search_names': 'search_offsets',
+    'ids': 'id_offsets',
+}
+
+
+def source_fingerprints(paths):
+    """源数据文件的 (修改时间, 大小)，用于判断快照是否过期"""
+    fingerprints = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprints[os.path.abspath(path)] = [stat.st_mtime_ns, stat.st_size]
+    return fingerprints
+
+
+def snapshot_is_stale(directory, source_paths):
+    """快照不存在、版本不符或源数据文件在构建后有变化时返回 True"""
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return True
+    return (meta.get('version') != SNAPSHOT_VERSION
+            or meta.get('sources') != source_fingerprints(source_paths))
+
+
+def write_snapshot(kg, directory, vectors=None, source_paths=()):
+    """将 MockKnowledgeGraph 写为快照
+
+    vectors 为 {实体名: 向量}，写入前归一化为单位向量；缺失的实体写零向量。
+    source_paths 为构建图谱所用的源数据文件，记录其指纹供 snapshot_is_stale 判断。
+    """
+    os.makedirs(directory, exist_ok=True)
+    types = {}
+    ids = {}
+    for entity in kg.entities.values():
+        types.setdefault(entity['name'], entity.get('type', 'unknown'))
+        ids.setdefault(entity['name'], entity.get('id', ''))
+    names = sorted(set(types) | set(kg._adjacency))
+    index = {name: i for i, name in enumerate(names)}
+    type_list = sorted(set(types.values()) | {'unknown'})
+    type_index = {t: i for i, t in enumerate(type_list)}
+    relation_index = {}
+
+    blobs = {key: bytearray() for key in _STRING_FILES}
+    arrays = {key: array(code) for key, code in _ARRAY_FILES.items()}
+    for offsets in _STRING_FILES.values():
+        arrays[offsets].append(0)
+    arrays['indptr'].append(0)
+    for name in names:
+        # 字符串以 \0 分隔，子串查找不会跨越两个实体名；
+        # 小写名称单独成表(小写后字节长度可能变化)，供大小写不敏感的搜索使用
+        for key, value in (('names', name), ('search_names', name.lower()), ('ids', ids.get(name, ''))):
+            blobs[key] += value.encode('utf-8') + b'\0'
+            arrays[_STRING_FILES[key]].append(len(blobs[key]))
+        arrays['node_types'].append(type_index[types.get(name, 'unknown')])
+        arrays['importance'].append(kg.get_importance(name))
+        # 邻接表保持图谱中的顺序(计算过节点指标后即按重要度排序)
+        for link in kg._adjacency.get(name, ()):
+            relation = kg.relations[link[0]][1]
+            arrays['indices'].append(index[kg._other_end(link)])
+            arrays['edge_relations'].append(relation_index.setdefault(relation, len(relation_index)))
+            arrays['edge_outgoing'].append(1 if link[1] == 'outgoing' else 0)
+        arrays['indptr'].append(len(arrays['indices']))
+
+    dim = 0
+    if vectors:
+        dim = len(next(iter(vectors.values())))
+        zero = [0.0] * dim
+        for name in names:
+            vector = list(vectors.get(name, zero))
+            norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+            arrays['vectors'].extend(x / norm for x in vector)
+
+    for key, blob in blobs.items():
+        with open(os.path.join(directory, f'{key}.bin'), 'wb') as f:
+            f.write(blob)
+    for key, values in arrays.items():
+        with open(os.path.join(directory, f'{key}.bin'), 'wb') as f:
+            values.tofile(f)
+
+    type_counts = {}
+    for entity_type in types.values():
+        type_counts[entity_type] = type_counts.get(entity_type, 0) + 1
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'num_nodes': len(names),
+        'num_relations': len(kg.relations),
+        'dim': dim,
+        'types': type_list,
+        'relations': sorted(relation_index, key=relation_index.get),
+        'type_counts': type_counts,
+        'sources': source_fingerprints(source_paths),
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+class GraphSnapshot:
+    """以只读 mmap 方式加载的图谱快照，查询接口与 MockKnowledgeGraph 一致"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"不支持的快照版本: {self.meta.get('version')}")
+        self._maps = []
+        self._names = self._map('names')
+        self._ids = self._map('ids')
+        # mmap 对象本身支持 C 实现的子串查找
+        self._search_names = self._map('search_names')
+        self._search_raw = self._maps[-1] if len(self._search_names) else b''
+        for key, code in _ARRAY_FILES.items():
+            setattr(self, f'_{key}', self._map(key).cast(code))
+        self.dim = self.meta['dim']
+        self.type_labels = MockAgriDataProcessor().entity_types
+
+        self._matrix = None
+        if self.dim and np is not None:
+            # 零拷贝视图，直接引用共享的页缓存
+            self._matrix = np.frombuffer(self._vectors, dtype=np.float32).reshape(-1, self.dim)
+
+    def _map(self, key):
+        path = os.path.join(self.directory, f'{key}.bin')
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'')
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)
+
+    @property
+    def num_nodes(self):
+        return self.meta['num_nodes']
+
+    @property
+    def has_vectors(self):
+        return self.dim > 0
+
+    @staticmethod
+    def _string(blob, offsets, node):
+        return bytes(blob[offsets[node]:offsets[node + 1] - 1]).decode('utf-8')
+
+    def name(self, node):
+        return self._string(self._names, self._name_offsets, node)
+
+    def node_type(self, node):
+        return self.meta['types'][self._node_types[node]]
+
+    def node_id(self, name):
+        """二分查找实体名(名称按码点排序，与 UTF-8 字节序一致)"""
+        target = name.encode('utf-8')
+        lo, hi = 0, self.num_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = self._name_offsets[mid], self._name_offsets[mid + 1] - 1
+            current = bytes(self._names[start:end])
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _entity(self, node):
+        name = self.name(node)
+        entity_type = self.node_type(node)
+        return {
+            # 仅出现在关系中、没有实体记录的节点使用合成 id
+            'id': self._string(self._ids, self._id_offsets, node) or f"{entity_type}_{node}",
+            'name': name,
+            'type': entity_type,
+            'description': f"{self.type_labels.get(entity_type, '未知')}: {name}",
+        }
+
+    def iter_neighbors(self, entity_name):
+        node = self.node_id(entity_name)
+        if node is None:
+            return
+        relations = self.meta['relations']
+        for i in range(self._indptr[node], self._indptr[node + 1]):
+            yield {
+                'entity': self.name(self._indices[i]),
+                'relation': relations[self._edge_relations[i]],
+                'direction': 'outgoing' if self._edge_outgoing[i] else 'incoming'
+            }
+
+    def get_neighbors(self, entity_name, limit=None):
+        neighbors = []
+        for neighbor in self.iter_neighbors(entity_name):
+            if limit is not None and len(neighbors) >= limit:
+                break
+            neighbors.append(neighbor)
+        return neighbors
+
+    def degree(self, entity_name):
+        node = self.node_id(entity_name)
+        return 0 if node is None else self._indptr[node + 1] - self._indptr[node]
+
+    def get_importance(self, entity_name):
+        node = self.node_id(entity_name)
+        return 0.0 if node is None else self._importance[node]
+
+    def search_entities(self, query, limit=5):
+        """搜索实体，打分规则与 MockKnowledgeGraph.search_entities 一致"""
+        query_lower = query.lower()
+        if not query_lower:
+            return []
+        scores = {}
+
+        # 名称匹配: 在 mmap 的小写名称表上做子串查找(名称命中时描述也命中，计 10 + 5 分)
+        names = self._search_raw
+        needle = query_lower.encode('utf-8')
+        pos = names.find(needle)
+        while pos != -1:
+            node = bisect_right(self._search_offsets, pos) - 1
+            scores[node] = 15
+            pos = names.find(needle, self._search_offsets[node + 1])
+        name_hits = set(scores)
+
+        # 类型/类型描述匹配
+        for type_id, entity_type in enumerate(self.meta['types']):
+            in_type = query_lower in entity_type.lower()
+            in_label = query_lower in self.type_labels.get(entity_type, '未知').lower()
+            if not (in_type or in_label):
+                continue
+            for node in range(self.num_nodes):
+                if self._node_types[node] != type_id:
+                    continue
+                bonus = 3 if in_type else 0
+                if in_label and node not in name_hits:
+                    bonus += 5
+                if bonus:
+                    scores[node] = scores.get(node, 0) + bonus
+
+        ranked = sorted(scores.items(), key=lambda x: (x[1], self._importance[x[0]]), reverse=True)
+        return [{'entity': self._entity(node), 'score': score} for node, score in ranked[:limit]]
+
+    def vector_search(self, vector, k=5):
+        """在共享向量矩阵上做余弦相似度检索，返回 search_similar_entities 格式"""
+        if not self.has_vectors:
+            return []
+        norm = math.sqrt(sum(float(x) * float(x) for x in vector)) or 1.0
+        if self._matrix is not None:
+            query = np.asarray(vector, dtype=np.float32) / norm
+            scores = self._matrix @ query
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            pairs = [(int(i), float(scores[i])) for i in top]
+        else:
+            query = [float(x) / norm for x in vector]
+            dim = self.dim
+            scores = []
+            for node in range(self.num_nodes):
+                row = self._vectors[node * dim:(node + 1) * dim]
+                scores.append((node, sum(a * b for a, b in zip(row, query))))
+            scores.sort(key=lambda x: x[1], reverse=True)
+            pairs = scores[:k]
+
+        results = []
+        for node, similarity in pairs:
+            entity = self._entity(node)
+            entity['similarity'] = similarity
+            results.append(entity)
+        return results
+
+    def get_stats(self):
+        return {
+            'total_entities': sum(self.meta['type_counts'].values()),
+            'total_relations': self.meta['num_relations'],
+            'entity_types': dict(self.meta['type_counts']),
+        }
+
+    def close(self):
+        for attr in [f'_{key}' for key in _STRING_FILES] + [f'_{key}' for key in _ARRAY_FILES]:
+            view = getattr(self, attr, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._matrix = None
+        self._search_raw = b''
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+混合检索
+并行执行关键词检索与向量检索，用倒数排名融合(RRF)或加权分数合并为一个排序列表
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+
+class HybridRetriever:
+    """关键词 + 向量混合检索器
+
+    keyword_search(query, limit) 返回 MockKnowledgeGraph.search_entities 格式
+    ([{'entity': {...}, 'score': ...}])；vector_search(query, k) 返回
+    search_similar_entities 格式([{'name': ..., 'type': ..., 'similarity': ...}])。
+    """
+
+    SOURCES = ('keyword', 'vector')
+
+    def __init__(self, keyword_search, vector_search, method="rrf", rrf_k=60,
+                 weights=None, candidate_multiplier=3):
+        if method not in ("rrf", "weighted"):
+            raise ValueError(f"不支持的融合方法: {method}")
+        self.searchers = {'keyword': keyword_search, 'vector': vector_search}
+        self.method = method
+        self.rrf_k = rrf_k
+        self.weights = {'keyword': 0.5, 'vector': 0.5}
+        if weights:
+            self.weights.update(weights)
+        self.candidate_multiplier = candidate_multiplier
+        # 复用线程池，避免每次查询创建线程
+        self._executor = ThreadPoolExecutor(max_workers=len(self.SOURCES),
+                                            thread_name_prefix="hybrid-search")
+
+    @staticmethod
+    def _normalize(item):
+        """统一两种检索结果格式为 (实体, 原始分数)"""
+        if isinstance(item.get('entity'), dict):
+            return item['entity'], float(item.get('score', 0))
+        return item, float(item.get('similarity', item.get('score', 0)))
+
+    def _run_source(self, source, query, limit):
+        try:
+            return [self._normalize(item) for item in self.searchers[source](query, limit) or []]
+        except Exception as e:
+            # 单路检索失败时仍返回另一路结果
+            logger.warning(f"{source} 检索失败: {e}")
+            return []
+
+    def retrieve(self, query, k=5):
+        """并行执行两路检索，返回各路的 (实体, 分数) 列表"""
+        limit = k * self.candidate_multiplier
+        futures = {source: self._executor.submit(self._run_source, source, query, limit)
+                   for source in self.SOURCES}
+        return {source: future.result() for source, future in futures.items()}
+
+    def fuse(self, results, k=5):
+        """融合多路结果，单次遍历累加分数"""
+        fused = {}
+        for source, items in results.items():
+            if not items:
+                continue
+            if self.method == "weighted":
+                # 每路分数做 min-max 归一化后再加权
+                scores = [score for _, score in items]
+                low, high = min(scores), max(scores)
+
+            for rank, (entity, score) in enumerate(items, 1):
+                key = entity.get('name') or entity.get('id')
+                if key is None:
+                    continue
+                if self.method == "rrf":
+                    contribution = self.weights[source] / (self.rrf_k + rank)
+                else:
+                    norm = (score - low) / (high - low) if high > low else 1.0
+                    contribution = self.weights[source] * norm
+
+                entry = fused.get(key)
+                if entry is None:
+                    entry = fused[key] = {
+                        'name': entity.get('name', key),
+                        'type': entity.get('type', ''),
+                        'entity': entity,
+                        'score': 0.0,
+                        'sources': {},
+                    }
+                if source in entry['sources']:
+                    # 同一路中重复出现的实体只计最高排名
+                    continue
+                entry['score'] += contribution
+                entry['sources'][source] = {'rank': rank, 'score': score}
+
+        ranked = sorted(fused.values(), key=lambda x: x['score'], reverse=True)
+        return ranked[:k]
+
+    def search(self, query, k=5):
+        """混合检索"""
+        tracer = get_tracer()
+        with tracer.span("hybrid_search"):
+            with tracer.span("retrieve"):
+                results = self.retrieve(query, k)
+            with tracer.span("fuse"):
+                return self.fuse(results, k)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
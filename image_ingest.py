@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+批量图像导入
+图像解码、缩略图与感知哈希(dHash)在进程池中并行计算；文件未变(路径、大小、修改时间相同)
+或与已描述图像近重复(哈希汉明距离不超过阈值)时直接复用缓存的描述，其余图像按批送入描述模型，
+模型调用与后续图像的解码重叠进行。结果为与 process_agricultural_data 相同形式的处理结果。
+
+用法:
+    python image_ingest.py data/raw/images --output data/processed/image_result.json
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装 pillow 时不可用批量图像导入
+    Image = None
+
+# 添加项目路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from demo_basic import relation_triple
+from llm_streaming import load_llm_config, stream_chat_completion
+from tracing import get_tracer
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff'}
+HASH_BITS = 64
+
+
+def scan_images(directory):
+    """递归列出目录下的图像文件(按路径排序)"""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def dhash(image, hash_size=8):
+    """差值哈希: 缩到 (hash_size+1) x hash_size 灰度图，比较相邻像素得到 64 位整数"""
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def load_image(path, thumb_size=512):
+    """进程池任务: 解码图像并生成 JPEG 缩略图与感知哈希"""
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            # JPEG 解码时直接按 1/2~1/8 降采样，大幅减少大尺寸照片的解码开销
+            image.draft('RGB', (thumb_size, thumb_size))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((thumb_size, thumb_size))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        return {'path': path, 'phash': dhash(image), 'width': width, 'height': height,
+                'thumbnail': buffer.getvalue()}
+    except Exception as e:
+        return {'path': path, 'error': f"{type(e).__name__}: {e}"}
+
+
+class PerceptualHashCache:
+    """感知哈希缓存(JSONL 追加写，path 为空时仅在内存中)
+
+    file 记录: 路径 + 大小 + 修改时间 -> 哈希，文件未变时无需重新解码；
+    hash 记录: 哈希 -> 描述结果，汉明距离不超过 max_distance 的图像视为重复。
+    64 位哈希分成 max_distance + 1 段建索引，距离不超过阈值的两个哈希至少有一段完全相同。
+    """
+
+    def __init__(self, path="", max_distance=4):
+        self.path = path
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self._bands = [(i * HASH_BITS // bands, (i + 1) * HASH_BITS // bands) for i in range(bands)]
+        self.files = {}
+        self.results = {}
+        self._index = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            if os.path.exists(path):
+                self._load()
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时写了一半的行
+                    continue
+                phash = int(record['phash'], 16)
+                if record['kind'] == 'file':
+                    self.files[record['path']] = (record['size'], record['mtime_ns'], phash,
+                                                  record['width'], record['height'])
+                else:
+                    self._add_result(phash, record['result'])
+
+    def _segments(self, phash):
+        return [(phash >> start) & ((1 << (end - start)) - 1) for start, end in self._bands]
+
+    def _add_result(self, phash, result):
+        if phash not in self.results:
+            for band, segment in zip(self._index, self._segments(phash)):
+                band.setdefault(segment, []).append(phash)
+        self.results[phash] = result
+
+    def _append(self, record):
+        if self._file:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def lookup_file(self, path, size, mtime_ns):
+        """文件未变时返回 (哈希, 宽, 高)，否则返回 None"""
+        entry = self.files.get(path)
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2:]
+        return None
+
+    def find(self, phash):
+        """返回已有描述结果的最近哈希(距离不超过阈值)，没有则返回 None"""
+        best, best_distance = None, self.max_distance + 1
+        with self._lock:
+            # 描述线程会同时写入 results，精确命中的检查也在锁内进行
+            if phash in self.results:
+                return phash
+            for band, segment in zip(self._index, self._segments(phash)):
+                for candidate in band.get(segment, ()):
+                    distance = (candidate ^ phash).bit_count()
+                    if distance < best_distance:
+                        best, best_distance = candidate, distance
+        return best
+
+    def put_file(self, path, size, mtime_ns, phash, width, height):
+        with self._lock:
+            self.files[path] = (size, mtime_ns, phash, width, height)
+            self._append({'kind': 'file', 'path': path, 'size': size, 'mtime_ns': mtime_ns,
+                          'phash': f"{phash:016x}", 'width': width, 'height': height})
+
+    def put_result(self, phash, result):
+        with self._lock:
+            self._add_result(phash, result)
+            self._append({'kind': 'hash', 'phash': f"{phash:016x}", 'result': result})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def parse_descriptions(text, count):
+    """解析模型返回的 JSON 数组，返回 count 个 {'description', 'entities'}"""
+    start, end = text.find('['), text.rfind(']')
+    if start < 0 or end <= start:
+        raise ValueError("模型输出中没有 JSON 数组")
+    items = json.loads(text[start:end + 1])
+    if len(items) != count:
+        raise ValueError(f"描述数量不符: 期望 {count}，得到 {len(items)}")
+    results = []
+    for item in items:
+        item = item if isinstance(item, dict) else {'description': str(item)}
+        entities = [{'name': e['name'], 'type': e.get('type', 'unknown')}
+                    for e in item.get('entities') or [] if isinstance(e, dict) and e.get('name')]
+        results.append({'description': str(item.get('description', '')), 'entities': entities})
+    return results
+
+
+class VisionDescriber:
+    """OpenAI 兼容视觉模型描述器: 一次请求发送一批缩略图，按顺序返回每张图的描述与实体"""
+
+    PROMPT = ("以下是{count}张农田调查照片。请按顺序为每张照片给出一个 JSON 对象，组成 JSON 数组输出: "
+              "[{{\"description\": \"简要描述作物、病虫害症状与生长状况\", "
+              "\"entities\": [{{\"name\": \"实体名\", \"type\": \"crop/disease/pest/pesticide/fertilizer\"}}]}}]。"
+              "只输出 JSON。")
+
+    def __init__(self, api_key="", base_url="", model="gpt-4o-mini", timeout=120.0, max_tokens_per_image=200):
+        self.api_key = api_key
+        self.base_url = base_url or "https://api.openai.com/v1"
+        self.model = model
+        self.timeout = timeout
+        self.max_tokens_per_image = max_tokens_per_image
+
+    def __call__(self, batch):
+        content = [{'type': 'text', 'text': self.PROMPT.format(count=len(batch))}]
+        for item in batch:
+            url = "data:image/jpeg;base64," + base64.b64encode(item['thumbnail']).decode('ascii')
+            content.append({'type': 'image_url', 'image_url': {'url': url}})
+        text = "".join(chunk for chunk, _ in stream_chat_completion(
+            [{'role': 'user', 'content': content}], self.api_key, self.base_url, self.model, self.timeout,
+            temperature=0, max_tokens=self.max_tokens_per_image * len(batch)))
+        return parse_descriptions(text, len(batch))
+
+
+def system_image_describer(system):
+    """逐张调用 system.process_agricultural_data(路径, "image")(未配置视觉模型时的回退，不做批量)"""
+    def describe(batch):
+        results = []
+        for item in batch:
+            data = system.process_agricultural_data(item['path'], "image") or {}
+            entities = data.get('entities', [])
+            description = next((e['description'] for e in entities if e.get('description')), '')
+            results.append({'description': description, 'entities': entities,
+                            'relations': data.get('relations', [])})
+        return results
+    return describe
+
+
+class EntityIndex:
+    """已有实体的 id 索引: 先按 (类型, 名称) 查找，类型不符时按名称唯一匹配"""
+
+    def __init__(self, entities=()):
+        self._by_key = {}
+        by_name = {}
+        for entity in entities:
+            if not isinstance(entity, dict) or not entity.get('id') or not entity.get('name'):
+                continue
+            self._by_key.setdefault((entity.get('type', 'unknown'), entity['name']), entity['id'])
+            by_name.setdefault(entity['name'], set()).add(entity['id'])
+        self._by_name = {name: next(iter(ids)) for name, ids in by_name.items() if len(ids) == 1}
+
+    def lookup(self, name, entity_type='unknown'):
+        return self._by_key.get((entity_type, name)) or self._by_name.get(name)
+
+
+def _decode_stream(pool, paths, thumb_size, window):
+    """按输入顺序产出解码结果；同时在途的任务不超过 window 个，缩略图不会在内存中堆积"""
+    pending = deque()
+    task = partial(load_image, thumb_size=thumb_size)
+    for path in paths:
+        pending.append(pool.submit(task, path))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ImageIngestPipeline:
+    """批量图像导入流水线
+
+    describe_batch(items) 接收一批 {'path', 'phash', 'width', 'height', 'thumbnail'(JPEG字节)}，
+    返回等长的 {'description', 'entities'[, 'relations']} 列表。
+    encode_batch(texts) 提供时，描述文本按 embed_batch_size 成批编码为向量，写入描述结果(随缓存保存)
+    与图像实体的 embedding 字段；图像实体名是文件路径，按名称编码的向量没有意义。
+    """
+
+    def __init__(self, describe_batch, cache=None, workers=None, batch_size=8,
+                 describe_concurrency=2, thumb_size=512, encode_batch=None, embed_batch_size=64):
+        self.describe_batch = describe_batch
+        self.cache = cache if cache is not None else PerceptualHashCache()
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self.describe_concurrency = max(1, describe_concurrency)
+        self.thumb_size = thumb_size
+        self.encode_batch = encode_batch
+        self.embed_batch_size = max(1, embed_batch_size)
+
+    def _describe(self, batch, errors):
+        tracer = get_tracer()
+        start = time.perf_counter()
+        try:
+            results = self.describe_batch(batch)
+            if len(results) != len(batch):
+                raise ValueError(f"描述数量不符: 期望 {len(batch)}，得到 {len(results)}")
+        except Exception as e:
+            tracer.count("image_describe_errors")
+            for item in batch:
+                errors[item['path']] = f"描述失败: {e}"
+            return 0
+        for item, result in zip(batch, results):
+            self.cache.put_result(item['phash'], result)
+        tracer.observe("image_describe_batch", time.perf_counter() - start)
+        return len(batch)
+
+    def _embed(self, hashes):
+        """为尚无向量的描述结果(含此前运行缓存的结果)成批编码，返回编码条数；失败时保留无向量的描述"""
+        tracer = get_tracer()
+        todo = []
+        for phash in dict.fromkeys(hashes):
+            result = self.cache.results.get(phash)
+            if result and result.get('description') and 'embedding' not in result:
+                todo.append((phash, result))
+        embedded = 0
+        for offset in range(0, len(todo), self.embed_batch_size):
+            part = todo[offset:offset + self.embed_batch_size]
+            try:
+                with tracer.span("image_embed_batch"):
+                    vectors = list(self.encode_batch([result['description'] for _, result in part]))
+                if len(vectors) != len(part):
+                    raise ValueError(f"向量数量不符: 期望 {len(part)}，得到 {len(vectors)}")
+            except Exception as e:
+                tracer.count("image_embed_errors")
+                print(f"⚠️  图像描述向量编码失败: {e}")
+                continue
+            for (phash, result), vector in zip(part, vectors):
+                self.cache.put_result(phash, dict(result, embedding=[float(x) for x in vector]))
+            embedded += len(part)
+        return embedded
+
+    def run(self, paths, root=None, existing_entities=()):
+        """导入全部图像，返回 (处理结果, 统计)
+
+        root 用于生成图像实体名(相对路径)；existing_entities 为图谱中已有的实体，
+        描述中出现的同名实体复用其 id，不再生成重复节点。
+        """
+        if Image is None:
+            raise RuntimeError("批量图像导入需要 pillow: pip install pillow")
+        tracer = get_tracer()
+        start = time.perf_counter()
+        stats = {'images': len(paths), 'file_cache_hits': 0, 'decoded': 0,
+                 'duplicates': 0, 'described': 0, 'embedded': 0, 'errors': 0}
+        # 路径 -> (描述结果所在哈希, 本图哈希, 宽, 高)
+        sources = {}
+        errors = {}
+        to_decode = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                errors[path] = str(e)
+                continue
+            cached = self.cache.lookup_file(path, st.st_size, st.st_mtime_ns)
+            match = self.cache.find(cached[0]) if cached else None
+            if match is not None:
+                sources[path] = (match,) + tuple(cached)
+                stats['file_cache_hits'] += 1
+            else:
+                to_decode.append((path, st))
+
+        # 本次运行中已送去描述、尚未返回的哈希，其近重复图像等待复用而不重复描述
+        inflight = PerceptualHashCache(max_distance=self.cache.max_distance)
+        described = []
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.workers) as decoders, \
+                ThreadPoolExecutor(max_workers=self.describe_concurrency,
+                                   thread_name_prefix="image-describe") as describers:
+            def submit(items):
+                # 在途批次有上限，解码结果不会因描述慢而无限堆积
+                while True:
+                    running = [future for future in described if not future.done()]
+                    if len(running) < self.describe_concurrency * 2:
+                        break
+                    wait(running, return_when=FIRST_COMPLETED)
+                described.append(describers.submit(self._describe, items, errors))
+
+            file_stats = dict(to_decode)
+            with tracer.span("image_decode"):
+                for item in _decode_stream(decoders, [path for path, _ in to_decode],
+                                           self.thumb_size, self.workers * 4):
+                    path = item['path']
+                    if 'error' in item:
+                        errors[path] = item['error']
+                        continue
+                    stats['decoded'] += 1
+                    st = file_stats[path]
+                    phash = item['phash']
+                    self.cache.put_file(path, st.st_size, st.st_mtime_ns, phash, item['width'], item['height'])
+                    match = self.cache.find(phash)
+                    if match is None:
+                        match = inflight.find(phash)
+                    if match is not None:
+                        stats['duplicates'] += 1
+                        sources[path] = (match, phash, item['width'], item['height'])
+                        continue
+                    inflight.put_result(phash, True)
+                    sources[path] = (phash, phash, item['width'], item['height'])
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        submit(batch)
+                        batch = []
+                if batch:
+                    submit(batch)
+            stats['described'] = sum(future.result() for future in described)
+
+        if self.encode_batch is not None:
+            stats['embedded'] = self._embed(source for source, *_ in sources.values())
+        processed = self._to_processed(paths, sources, errors, root, EntityIndex(existing_entities))
+        stats['errors'] = len(errors)
+        stats['wall_s'] = time.perf_counter() - start
+        stats['images_per_s'] = len(paths) / stats['wall_s'] if stats['wall_s'] > 0 else 0.0
+        tracer.count("images_ingested", len(paths) - len(errors))
+        return processed, stats
+
+    def _to_processed(self, paths, sources, errors, root, known):
+        """每张图像一个 image 实体，并以 depicts 关系连到描述中的实体(已有实体只加关系)"""
+        entities = {}
+        relations = {}
+        for path in paths:
+            if path in errors or path not in sources:
+                continue
+            source, phash, width, height = sources[path]
+            result = self.cache.results.get(source)
+            if result is None:
+                # 近重复的源图像描述失败
+                errors[path] = "描述失败(重复图像的源图像)"
+                continue
+            name = os.path.relpath(path, root) if root else path
+            entities[f"image:{name}"] = {
+                'id': f"image:{name}",
+                'name': name,
+                'type': 'image',
+                'description': result.get('description', ''),
+                'path': path,
+                'phash': f"{phash:016x}",
+                'width': width,
+                'height': height,
+            }
+            if 'embedding' in result:
+                entities[f"image:{name}"]['embedding'] = result['embedding']
+            for entity in result.get('entities', []):
+                if not known.lookup(entity['name'], entity.get('type', 'unknown')):
+                    entity_id = entity.get('id') or f"{entity.get('type', 'unknown')}:{entity['name']}"
+                    entities.setdefault(entity_id, dict(entity, id=entity_id))
+                relations.setdefault((name, 'depicts', entity['name']), None)
+            # 近重复图像共用描述结果，其中的关系只保留一份
+            for relation in result.get('relations', []):
+                triple = relation_triple(relation)
+                if triple is not None:
+                    relations.setdefault(triple, None)
+        return {'entities': list(entities.values()), 'relations': [list(r) for r in relations]}
+
+
+def build_describer(system=None, config_path="config/config_v2.yaml", vision_model="gpt-4o-mini"):
+    """配置了 OpenAI 兼容接口时使用视觉模型批量描述，否则回退到系统的逐张图像处理"""
+    config = load_llm_config(config_path)
+    if config['api_key'] or config['base_url']:
+        return VisionDescriber(config['api_key'], config['base_url'], vision_model)
+    if system is not None:
+        return system_image_describer(system)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量图像导入")
+    parser.add_argument("directory", nargs="?", default="data/raw/images", help="图像目录")
+    parser.add_argument("--output", default="data/processed/image_result.json", help="处理结果输出")
+    parser.add_argument("--cache", default="data/processed/image_cache.jsonl", help="感知哈希缓存(空为不缓存)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="解码进程数")
+    parser.add_argument("--batch_size", type=int, default=8, help="每次描述请求的图像数")
+    parser.add_argument("--describe_concurrency", type=int, default=2, help="并发描述请求数")
+    parser.add_argument("--thumb_size", type=int, default=512, help="缩略图最长边(像素)")
+    parser.add_argument("--max_distance", type=int, default=4, help="近重复判定的哈希汉明距离")
+    parser.add_argument("--llm_config", default="config/config_v2.yaml", help="OpenAI 兼容接口配置")
+    parser.add_argument("--vision_model", default="gpt-4o-mini", help="视觉模型名")
+    parser.add_argument("--existing", default="data/processed/structured_result.json,data/processed/unstructured_result.json",
+                        help="已有处理结果(逗号分隔)，描述中的同名实体复用其 id")
+    args = parser.parse_args()
+
+    if Image is None:
+        print("❌ 未安装 pillow，请运行: pip install pillow")
+        sys.exit(1)
+    describer = build_describer(config_path=args.llm_config, vision_model=args.vision_model)
+    if describer is None:
+        print("❌ 未配置 OpenAI 兼容接口(OPENAI_API_KEY / OPENAI_BASE_URL)，无法生成图像描述")
+        sys.exit(1)
+
+    existing = []
+    for path in args.existing.split(','):
+        if path.strip() and os.path.exists(path.strip()):
+            with open(path.strip(), 'r', encoding='utf-8') as f:
+                existing.extend(json.load(f).get('entities', []))
+
+    paths = scan_images(args.directory)
+    cache = PerceptualHashCache(args.cache, args.max_distance)
+    pipeline = ImageIngestPipeline(describer, cache, args.workers, args.batch_size,
+                                   args.describe_concurrency, args.thumb_size)
+    try:
+        processed, stats = pipeline.run(paths, root=args.directory, existing_entities=existing)
+    finally:
+        cache.close()
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(processed, f, ensure_ascii=False)
+    print(f"✓ {stats['images']} 张图像: 解码 {stats['decoded']}, 缓存命中 {stats['file_cache_hits']}, "
+          f"近重复 {stats['duplicates']}, 描述 {stats['described']}, 失败 {stats['errors']} "
+          f"({stats['images_per_s']:.1f} 张/秒)")
+    print(f"已保存图像处理结果: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+知识图谱上下文构建
+从问题中链接到的实体出发做有界 k 跳扩展，按关系权重与节点重要度给路径打分，
+并在 token 预算内打包成 LLM 提示词上下文
+"""
+import math
+from itertools import islice
+
+from tracing import get_tracer
+
+try:
+    import tiktoken
+except ImportError:  # 未安装时退化为字符估算
+    tiktoken = None
+
+
+# 默认关系权重(越大越优先进入上下文)
+DEFAULT_RELATION_WEIGHTS = {
+    'prevents': 1.0,
+    'infected_by': 0.9,
+    'damaged_by': 0.9,
+    'uses': 0.8,
+    'suitable_for': 0.6,
+    'grows_in': 0.6,
+}
+
+
+class TokenCounter:
+    """token 计数器，优先使用 tiktoken，不可用时按字符估算"""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            self._loaded = True
+            if tiktoken is not None:
+                try:
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception:
+                    # 离线环境下可能无法下载编码表
+                    self._encoding = None
+        return self._encoding
+
+    def count(self, text):
+        """计算文本 token 数"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        # 估算: 中日韩字符约 1 token/字，其余约 4 字符/token
+        cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class EntityLinker:
+    """实体链接: 按首字符索引实体名，每个问题只检查以其字符开头的实体名"""
+
+    def __init__(self, names):
+        self._by_first = {}
+        for name in set(names):
+            if name:
+                self._by_first.setdefault(name[0], []).append(name)
+        for bucket in self._by_first.values():
+            bucket.sort(key=len, reverse=True)
+
+    def link(self, question):
+        """返回问题中出现的实体名(名称越长越优先)"""
+        found = {}
+        for pos, char in enumerate(question):
+            for name in self._by_first.get(char, ()):
+                if question.startswith(name, pos):
+                    found[name] = len(name)
+        return sorted(found, key=found.get, reverse=True)
+
+    def link_batch(self, questions):
+        return [self.link(question) for question in questions]
+
+
+class KHopContextBuilder:
+    """有界 k 跳子图上下文构建器
+
+    kg 需提供 entities、node_metrics、iter_neighbors()、degree() 与 get_importance()，
+    即 MockKnowledgeGraph 的接口。kg 提供 get_neighbors_many(names, limit) 时(如分片图谱)
+    每跳只发一次批量邻居查询，邻居带 importance 字段时排序直接使用，不再逐个查询重要度。
+    """
+
+    def __init__(self, kg, max_hops=2, max_fanout=20, max_nodes=200,
+                 token_budget=800, relation_weights=None, importance=None,
+                 hop_decay=0.7, token_counter=None):
+        self.kg = kg
+        self.max_hops = max_hops
+        self.max_fanout = max_fanout
+        self.max_nodes = max_nodes
+        self.token_budget = token_budget
+        self.relation_weights = dict(DEFAULT_RELATION_WEIGHTS)
+        if relation_weights:
+            self.relation_weights.update(relation_weights)
+        # 权重限制在 [0, 1]，使路径得分沿扩展单调不增，种子实体的得分不会被覆盖
+        self.relation_weights = {k: min(1.0, max(0.0, w)) for k, w in self.relation_weights.items()}
+        self.default_relation_weight = 0.5
+        self.importance = importance or self._node_importance
+        self.hop_decay = hop_decay
+        self.token_counter = token_counter or TokenCounter()
+        self._linker = None
+        self._linker_key = None
+
+    def _node_importance(self, entity_name):
+        """默认节点重要度: 优先使用预计算的 PageRank 重要度，否则为 log(1 + 度数)"""
+        if entity_name in self.kg.node_metrics:
+            return self.kg.get_importance(entity_name)
+        return math.log1p(self.kg.degree(entity_name))
+
+    def link_entities(self, question):
+        """从问题中链接图谱实体(名称越长越优先)；实体名索引在图谱变化后重建
+
+        有 version 的图谱(MockKnowledgeGraph)按版本判断是否变化，同数量的实体替换也会重建；
+        其他图谱退回按实体数判断。
+        """
+        key = (id(self.kg), getattr(self.kg, 'version', None), len(self.kg.entities))
+        if self._linker_key != key:
+            self._linker = EntityLinker(entity.get('name') for entity in self.kg.entities.values())
+            self._linker_key = key
+        return self._linker.link(question)
+
+    def _neighbors_of(self, nodes):
+        """一跳内各节点的前 max_fanout 个邻居(保证高度数节点如水稻的扩展时间有界)"""
+        get_many = getattr(self.kg, 'get_neighbors_many', None)
+        if get_many is not None:
+            return get_many(nodes, self.max_fanout)
+        return {node: list(islice(self.kg.iter_neighbors(node), self.max_fanout)) for node in nodes}
+
+    def expand(self, seeds):
+        """从种子实体出发逐跳扩展，返回每个可达节点的最佳路径
+
+        每跳按得分取前若干个节点(总数不超过 max_nodes)，一次取回它们的邻居。
+        """
+        best = {}
+        for seed in seeds:
+            best[seed] = {'score': 1.0, 'path': []}
+
+        frontier = list(best)
+        expanded = 0
+        for _ in range(self.max_hops):
+            # 得分高的节点优先占用扩展预算
+            frontier.sort(key=lambda node: best[node]['score'], reverse=True)
+            frontier = frontier[:self.max_nodes - expanded]
+            if not frontier:
+                break
+            expanded += len(frontier)
+            # 使用本跳开始时的路径；本跳内得分被改进的节点留到下一跳再扩展，路径长度不超过 max_hops
+            entries = {node: best[node] for node in frontier}
+            neighbors = self._neighbors_of(frontier)
+
+            improved = {}
+            for node in frontier:
+                entry = entries[node]
+                for neighbor in neighbors.get(node, ()):
+                    target = neighbor['entity']
+                    weight = self.relation_weights.get(neighbor['relation'], self.default_relation_weight)
+                    # 每多一跳乘一次衰减系数
+                    score = entry['score'] * weight * self.hop_decay
+                    if target in best and (not best[target]['path'] or best[target]['score'] >= score):
+                        continue
+                    if neighbor['direction'] == 'outgoing':
+                        edge = (node, neighbor['relation'], target)
+                    else:
+                        edge = (target, neighbor['relation'], node)
+                    best[target] = {'score': score, 'path': entry['path'] + [edge]}
+                    if 'importance' in neighbor:
+                        best[target]['importance'] = neighbor['importance']
+                    improved[target] = None
+            frontier = list(improved)
+
+        return best, expanded
+
+    def rank_paths(self, best):
+        """按路径得分与终点重要度排序"""
+        ranked = []
+        for node, entry in best.items():
+            if not entry['path']:
+                continue
+            ranked.append({
+                'entity': node,
+                'path': entry['path'],
+                'hops': len(entry['path']),
+                'score': entry['score'] * (1.0 + (entry['importance'] if 'importance' in entry
+                                                  else self.importance(node))),
+            })
+        ranked.sort(key=lambda x: x['score'], reverse=True)
+        return ranked
+
+    @staticmethod
+    def format_edge(edge):
+        source, relation, target = edge
+        return f"{source} -[{relation}]-> {target}"
+
+    def build(self, question="", seeds=None):
+        """构建问题的图谱上下文"""
+        tracer = get_tracer()
+        with tracer.span("kg_context"):
+            return self._build(question, seeds, tracer)
+
+    def _build(self, question, seeds, tracer):
+        with tracer.span("link"):
+            seeds = list(seeds) if seeds else self.link_entities(question)
+        with tracer.span("expand"):
+            best, expanded = self.expand(seeds)
+            ranked = self.rank_paths(best)
+        tracer.count("kg_context_expanded_nodes", expanded)
+
+        lines = []
+        packed = []
+        seen_edges = set()
+        used_tokens = 0
+        truncated = False
+        for item in ranked:
+            new_edges = [edge for edge in item['path'] if edge not in seen_edges]
+            if not new_edges:
+                continue
+            # 路径前缀已在上下文中时只写新增的边
+            line = "; ".join(self.format_edge(edge) for edge in new_edges)
+            tokens = self.token_counter.count(line + "\n")
+            if used_tokens + tokens > self.token_budget:
+                truncated = True
+                continue
+            lines.append(line)
+            packed.append(item)
+            seen_edges.update(new_edges)
+            used_tokens += tokens
+
+        return {
+            'context': "\n".join(lines),
+            'seeds': seeds,
+            'paths': packed,
+            'token_count': used_tokens,
+            'token_budget': self.token_budget,
+            'truncated': truncated,
+            'expanded_nodes': expanded,
+        }
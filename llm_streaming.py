@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+流式问答
+先返回检索到的实体与图谱上下文，再把 OpenAI 兼容接口(stream=true)生成的 token 逐个转发，
+用户感知延迟从完整生成时间降为首 token 时间(TTFT)
+
+事件序列:
+    {'type': 'context', ...}  检索结果(立即返回)
+    {'type': 'token', 'text': ...}  回答片段(可多次)
+    {'type': 'done', ...} 或 {'type': 'error', 'error': ...}
+"""
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+try:
+    import yaml
+except ImportError:  # 未安装时仅从环境变量读取配置
+    yaml = None
+
+from tracing import get_tracer
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+DEFAULT_SYSTEM_PROMPT = (
+    "你是一名农业技术专家。请依据提供的知识图谱上下文回答用户的农业问题，"
+    "回答准确、简洁；上下文不足以回答时请明确说明。"
+)
+
+
+def load_llm_config(config_path="config/config_v2.yaml"):
+    """读取 openai 配置段；环境变量 OPENAI_API_KEY / OPENAI_BASE_URL / OPENAI_MODEL 优先"""
+    config = {}
+    if yaml is not None and config_path and os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = (yaml.safe_load(f) or {}).get('openai') or {}
+    return {
+        'api_key': os.environ.get('OPENAI_API_KEY') or config.get('api_key', ''),
+        'base_url': os.environ.get('OPENAI_BASE_URL') or config.get('base_url', ''),
+        'model': os.environ.get('OPENAI_MODEL') or config.get('model', ''),
+    }
+
+
+def stream_chat_completion(messages, api_key="", base_url=DEFAULT_BASE_URL, model=DEFAULT_MODEL,
+                           timeout=60.0, **params):
+    """调用 /chat/completions(stream=true)，逐个产出 (文本片段, usage)
+
+    请求 stream_options.include_usage，OpenAI 接口据此在最后一个分片返回 usage(流式默认不返回)；
+    usage 仅在该分片中不为 None。
+    """
+    body = dict(params, model=model, messages=messages, stream=True)
+    body.setdefault('stream_options', {'include_usage': True})
+    request = urllib.request.Request(
+        base_url.rstrip('/') + "/chat/completions",
+        data=json.dumps(body, ensure_ascii=False).encode('utf-8'),
+        headers={
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "Authorization": f"Bearer {api_key}",
+        },
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for raw in response:
+            line = raw.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            choices = chunk.get('choices') or [{}]
+            text = (choices[0].get('delta') or {}).get('content') or ''
+            usage = chunk.get('usage')
+            if text or usage:
+                yield text, usage
+
+
+def graph_retrieve(retriever, context_builder, k=5):
+    """组合混合检索与 k 跳图谱上下文，返回 retrieve(question) 函数"""
+    def retrieve(question):
+        hits = retriever.search(question, k=k)
+        seeds = [hit['name'] for hit in hits]
+        if hasattr(context_builder.kg, 'entities'):
+            # 关键词检索按整句匹配，补充问题中直接出现的实体名
+            seeds += [name for name in context_builder.link_entities(question) if name not in seeds]
+        elif hasattr(context_builder.kg, 'link_entities'):
+            # 分片图谱由各分片并行链接
+            seeds += [name for name in context_builder.kg.link_entities(question) if name not in seeds]
+        built = context_builder.build(question, seeds) if seeds else {}
+        return {
+            'entities': [{'name': hit['name'], 'type': hit['type'], 'score': hit['score']} for hit in hits],
+            'seeds': seeds,
+            'context': built.get('context', ''),
+            'paths': len(built.get('paths', [])),
+            'token_count': built.get('token_count', 0),
+            'truncated': built.get('truncated', False),
+        }
+    # 问答器关闭时一并关闭检索器的线程池
+    retrieve.close = retriever.close
+    return retrieve
+
+
+class StreamingAnswerer:
+    """流式问答器
+
+    retrieve(question) 返回含 entities 与 context 的字典，见 graph_retrieve()。
+    """
+
+    def __init__(self, retrieve, api_key="", base_url="", model="", system_prompt=DEFAULT_SYSTEM_PROMPT,
+                 temperature=0.3, max_tokens=1000, timeout=60.0):
+        self.retrieve = retrieve
+        self.api_key = api_key
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.model = model or DEFAULT_MODEL
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+    def build_messages(self, question, retrieved):
+        parts = []
+        if retrieved.get('entities'):
+            names = "、".join(f"{e['name']}({e['type']})" for e in retrieved['entities'])
+            parts.append(f"相关实体: {names}")
+        if retrieved.get('context'):
+            parts.append(f"图谱关系:\n{retrieved['context']}")
+        context = "\n".join(parts) or "(未检索到相关知识)"
+        return [
+            {'role': 'system', 'content': self.system_prompt},
+            {'role': 'user', 'content': f"知识图谱上下文:\n{context}\n\n问题: {question}"},
+        ]
+
+    def stream(self, question, retrieved=None):
+        """流式回答问题，产出事件字典；retrieved 为预先(如批量)检索的结果时跳过检索"""
+        tracer = get_tracer()
+        start = time.perf_counter()
+        if retrieved is None:
+            with tracer.span("stream_retrieve"):
+                retrieved = self.retrieve(question)
+        yield dict(retrieved, type='context', question=question,
+                   retrieval_ms=(time.perf_counter() - start) * 1000)
+
+        parts = []
+        usage = None
+        ttft = None
+        try:
+            for text, chunk_usage in stream_chat_completion(
+                    self.build_messages(question, retrieved), self.api_key, self.base_url, self.model,
+                    self.timeout, temperature=self.temperature, max_tokens=self.max_tokens):
+                usage = chunk_usage or usage
+                if not text:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    tracer.observe("stream_ttft", ttft)
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            tracer.count("qa_errors")
+            yield {'type': 'error', 'error': f"LLM流式调用失败: {e}"}
+            return
+
+        total = time.perf_counter() - start
+        tracer.observe("stream_total", total)
+        tracer.count("stream_answers")
+        if usage:
+            tracer.count("llm_tokens", usage.get('total_tokens', 0))
+        yield {
+            'type': 'done',
+            'answer': "".join(parts),
+            'usage': usage or {},
+            'ttft_ms': ttft * 1000 if ttft is not None else None,
+            'total_ms': total * 1000,
+        }
+
+    def close(self):
+        """释放检索函数持有的资源(graph_retrieve 的混合检索线程池)"""
+        close = getattr(self.retrieve, 'close', None)
+        if close is not None:
+            close()
+
+    def answer(self, question, retrieved=None):
+        """非流式调用: 消费全部事件后返回与 answer_question 相同形式的字典"""
+        result = {}
+        for event in self.stream(question, retrieved):
+            if event['type'] == 'context':
+                result['entities'] = event['entities']
+            elif event['type'] == 'error':
+                return {'error': event['error']}
+            elif event['type'] == 'done':
+                result.update(answer=event['answer'], usage=event['usage'],
+                              ttft_ms=event['ttft_ms'], total_ms=event['total_ms'])
+        return result
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测
+以本地替身代替付费 API 与 Neo4j: 进程内模拟 OpenAI 兼容接口(首 token 延迟与输出速率可配置)
+与 NetworkX 图存储；按目标 QPS 开环回放问题文件，报告 p50/p95/p99 延迟、吞吐与各阶段耗时占比。
+延迟从计划发送时刻算起，包含排队时间，服务跟不上时不会被低估。
+
+用法:
+    python load_test.py --questions_file questions.txt --qps 20 --duration 30
+    python load_test.py --entities 100000 --qps 50 --llm_first_token_ms 300 --llm_tokens_per_s 40
+    python load_test.py --backend system --qps 5     # 经 answer_question 全链路(OPENAI_BASE_URL 指向模拟接口)
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+try:
+    import networkx as nx
+except ImportError:  # 未安装时退回内存图谱 MockKnowledgeGraph
+    nx = None
+
+# 添加项目路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from benchmark import SyntheticAgriCorpus, summarize
+from demo_basic import MockKnowledgeGraph, normalize_relation
+from hybrid_retrieval import HybridRetriever
+from kg_context import KHopContextBuilder
+from llm_streaming import StreamingAnswerer, graph_retrieve
+from mock_llm_server import MockLLMServer
+from tracing import get_tracer
+
+# 报告中的阶段(单位毫秒，均来自每个请求的记录)；排队之外的阶段只有 direct 后端能按请求拆分
+STAGES = ('queue_ms', 'retrieval_ms', 'llm_first_token_ms', 'llm_generation_ms')
+STAGES_NOTE = "检索/LLM 阶段耗时仅 direct 后端按请求给出；system 后端的 answer_question 不返回阶段耗时，请参考埋点 span"
+
+
+class NetworkXGraphStore:
+    """基于 NetworkX 的图存储(Neo4j 的本地替身)，接口与 MockKnowledgeGraph 一致"""
+
+    def __init__(self):
+        if nx is None:
+            raise RuntimeError("NetworkX 图存储需要 networkx: pip install networkx")
+        self.graph = nx.MultiDiGraph()
+        self.entities = {}
+        self.node_metrics = {}
+
+    def add_entity(self, entity):
+        self.entities[entity['id']] = entity
+        self.graph.add_node(entity['name'], type=entity.get('type', 'unknown'))
+
+    def add_relation(self, relation):
+        # 字典形式的关系与 MockKnowledgeGraph 一样先转为 [起点, 关系, 终点]
+        relation = normalize_relation(relation)
+        if len(relation) >= 3:
+            self.graph.add_edge(relation[0], relation[2], relation=relation[1])
+
+    def build_from_data(self, processed_data):
+        relations = [normalize_relation(relation) for relation in processed_data.get('relations', [])]
+        for entity in processed_data.get('entities', []):
+            self.add_entity(entity)
+        for relation in relations:
+            self.add_relation(relation)
+        return True
+
+    def search_entities(self, query, limit=5):
+        """与 MockKnowledgeGraph 相同的文本匹配打分，同分按度数排序"""
+        query_lower = query.lower()
+        results = []
+        for entity in self.entities.values():
+            score = 0
+            if query_lower in entity['name'].lower():
+                score += 10
+            if query_lower in entity.get('description', '').lower():
+                score += 5
+            if query_lower in entity.get('type', '').lower():
+                score += 3
+            if score:
+                results.append({'entity': entity, 'score': score})
+        results.sort(key=lambda x: (x['score'], self.degree(x['entity']['name'])), reverse=True)
+        return results[:limit]
+
+    def iter_neighbors(self, entity_name):
+        if entity_name not in self.graph:
+            return
+        for _, target, data in self.graph.out_edges(entity_name, data=True):
+            yield {'entity': target, 'relation': data['relation'], 'direction': 'outgoing'}
+        for source, _, data in self.graph.in_edges(entity_name, data=True):
+            if source != entity_name:
+                yield {'entity': source, 'relation': data['relation'], 'direction': 'incoming'}
+
+    def get_neighbors(self, entity_name, limit=None):
+        return list(islice(self.iter_neighbors(entity_name), limit))
+
+    def degree(self, entity_name):
+        return self.graph.degree(entity_name) if entity_name in self.graph else 0
+
+    def get_importance(self, entity_name):
+        metrics = self.node_metrics.get(entity_name)
+        return metrics['importance'] if metrics else 0.0
+
+    def get_stats(self):
+        entity_type_counts = {}
+        for entity in self.entities.values():
+            entity_type = entity.get('type', 'unknown')
+            entity_type_counts[entity_type] = entity_type_counts.get(entity_type, 0) + 1
+        return {
+            'total_entities': len(self.entities),
+            'total_relations': self.graph.number_of_edges(),
+            'entity_types': entity_type_counts,
+        }
+
+
+def load_graph_store(processed_paths, n_entities):
+    """从处理结果构建图存储；没有处理结果时使用 n_entities 规模的合成语料"""
+    store = NetworkXGraphStore() if nx is not None else MockKnowledgeGraph()
+    if nx is None:
+        print("⚠️  未安装 networkx，使用内存图谱 MockKnowledgeGraph")
+    loaded = False
+    for path in processed_paths:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                store.build_from_data(json.load(f))
+            loaded = True
+    corpus = None
+    if not loaded:
+        corpus = SyntheticAgriCorpus(n_entities)
+        for chunk in corpus.processed_chunks():
+            store.build_from_data(chunk)
+    return store, corpus
+
+
+def direct_answerer(store, base_url, model="mock-gpt", k=5):
+    """检索 -> k 跳上下文 -> 流式 LLM，与 answer_question 相同的链路，按阶段记录耗时"""
+    retriever = HybridRetriever(lambda q, limit: store.search_entities(q, limit), lambda q, limit: [])
+    streamer = StreamingAnswerer(graph_retrieve(retriever, KHopContextBuilder(store), k),
+                                 api_key="mock", base_url=base_url, model=model)
+
+    def answer(question):
+        record = {}
+        for event in streamer.stream(question):
+            if event['type'] == 'context':
+                record['retrieval_ms'] = event['retrieval_ms']
+            elif event['type'] == 'error':
+                record['error'] = event['error']
+            elif event['type'] == 'done':
+                ttft = event['ttft_ms'] if event['ttft_ms'] is not None else event['total_ms']
+                record['llm_first_token_ms'] = ttft - record['retrieval_ms']
+                record['llm_generation_ms'] = event['total_ms'] - ttft
+                record['tokens'] = event['usage'].get('completion_tokens', 0)
+        return record
+    return answer
+
+
+def system_answerer(system):
+    """经系统 answer_question 全链路；不拆分检索/LLM 阶段(见 STAGES_NOTE)，只记录输出 token 数"""
+    def answer(question):
+        result = system.answer_question(question, use_kg_context=True)
+        if 'error' in result:
+            return {'error': result['error']}
+        usage = result.get('usage') or {}
+        return {'tokens': usage.get('completion_tokens', 0)}
+    return answer
+
+
+def load_questions(path):
+    """读取问题文件(每行一问，忽略空行)；没有问题时抛出 ValueError"""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        questions = [q.strip() for q in f if q.strip()]
+    if not questions:
+        raise ValueError(f"问题文件中没有问题: {path}")
+    return questions
+
+
+class LoadGenerator:
+    """开环负载生成: 按计划时刻发送请求，不因前一个请求未完成而推迟
+
+    arrival='poisson' 时请求间隔服从指数分布，'uniform' 时等间隔。
+    """
+
+    def __init__(self, answer_fn, qps, concurrency=64, arrival='poisson', seed=42):
+        self.answer_fn = answer_fn
+        self.qps = qps
+        self.concurrency = concurrency
+        self.arrival = arrival
+        self.rng = random.Random(seed)
+
+    def _offsets(self, count):
+        offsets = []
+        t = 0.0
+        for _ in range(count):
+            offsets.append(t)
+            t += self.rng.expovariate(self.qps) if self.arrival == 'poisson' else 1.0 / self.qps
+        return offsets
+
+    def _one(self, index, question, scheduled):
+        begin = time.perf_counter()
+        try:
+            record = self.answer_fn(question)
+        except Exception as e:
+            record = {'error': str(e)}
+        end = time.perf_counter()
+        record.update(id=index, question=question, queue_ms=(begin - scheduled) * 1000,
+                      service_ms=(end - begin) * 1000, latency_ms=(end - scheduled) * 1000, end=end)
+        return record
+
+    def run(self, questions, count):
+        """循环回放问题共 count 次，返回 (每个请求的记录, 起始时刻)"""
+        if not questions:
+            raise ValueError("没有可回放的问题")
+        offsets = self._offsets(count)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as pool:
+            start = time.perf_counter()
+            for index, offset in enumerate(offsets):
+                scheduled = start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(self._one, index, questions[index % len(questions)], scheduled))
+            records = [future.result() for future in futures]
+        return records, start
+
+
+def build_report(records, start, offered_qps):
+    """汇总延迟分位数、吞吐、各阶段耗时与埋点 span"""
+    ok = [r for r in records if 'error' not in r]
+    wall = max((r['end'] for r in records), default=start) - start
+    latency = summarize([r['latency_ms'] / 1000 for r in ok])
+    report = {
+        'requests': len(records),
+        'errors': len(records) - len(ok),
+        'offered_qps': offered_qps,
+        'throughput_qps': len(ok) / wall if wall > 0 else 0.0,
+        'wall_s': wall,
+        'latency': {key: latency.get(key) for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')},
+        'service': {key: summarize([r['service_ms'] / 1000 for r in ok]).get(key)
+                    for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')},
+        'stages': {},
+    }
+    mean_latency = latency.get('mean_ms') or 0.0
+    for stage in STAGES:
+        values = [r[stage] for r in ok if stage in r]
+        if not values:
+            continue
+        stats = summarize([value / 1000 for value in values])
+        report['stages'][stage[:-3]] = {
+            'mean_ms': stats['mean_ms'],
+            'p50_ms': stats['p50_ms'],
+            'p95_ms': stats['p95_ms'],
+            'p99_ms': stats['p99_ms'],
+            'share': stats['mean_ms'] / mean_latency if mean_latency else 0.0,
+        }
+    if not any(stage in r for r in ok for stage in STAGES[1:]):
+        report['stages_note'] = STAGES_NOTE
+    spans = get_tracer().snapshot()['spans']
+    report['spans'] = {name: {'count': s['count'], 'mean_ms': s['mean_ms']} for name, s in sorted(spans.items())}
+    tokens = sum(r.get('tokens', 0) for r in ok)
+    if tokens:
+        report['tokens_per_s'] = tokens / wall
+    return report
+
+
+def print_report(report):
+    print(f"\n📊 {report['requests']} 个请求, 失败 {report['errors']}, 用时 {report['wall_s']:.1f} s")
+    print(f"   目标 {report['offered_qps']:.1f} qps, 实际吞吐 {report['throughput_qps']:.1f} qps"
+          + (f", {report['tokens_per_s']:.0f} tokens/s" if 'tokens_per_s' in report else ""))
+    if report['throughput_qps'] < report['offered_qps'] * 0.9:
+        print("   ⚠️  吞吐低于目标 QPS，服务已饱和(可增大 --concurrency 或降低 --qps)")
+    for label, key in (("端到端延迟", 'latency'), ("服务时间", 'service')):
+        stats = report[key]
+        if stats['p50_ms'] is None:
+            continue
+        print(f"   {label}: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+              f"p99 {stats['p99_ms']:.1f} ms (均值 {stats['mean_ms']:.1f} ms)")
+    if report['stages']:
+        print("   阶段耗时:")
+        for stage, stats in report['stages'].items():
+            print(f"     {stage:<18} 均值 {stats['mean_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+                  f"p99 {stats['p99_ms']:8.1f} ms  占比 {stats['share'] * 100:5.1f}%")
+    if 'stages_note' in report:
+        print(f"   ℹ️  {report['stages_note']}")
+    if report['spans']:
+        print("   埋点 span(均值):")
+        for name, stats in report['spans'].items():
+            print(f"     {name:<40} {stats['mean_ms']:8.2f} ms  x{stats['count']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测(本地 LLM 与图存储替身)")
+    parser.add_argument("--questions_file", default="", help="问题文件(每行一问)，为空时用合成问题")
+    parser.add_argument("--qps", type=float, default=10.0, help="目标每秒请求数")
+    parser.add_argument("--duration", type=float, default=20.0, help="压测时长(秒)")
+    parser.add_argument("--requests", type=int, default=0, help="请求总数(优先于 --duration)")
+    parser.add_argument("--concurrency", type=int, default=64, help="最大并发请求数")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson", help="请求到达分布")
+    parser.add_argument("--backend", choices=["direct", "system"], default="direct",
+                        help="direct: 本地图存储 + 模拟接口; system: 经系统 answer_question")
+    parser.add_argument("--processed", nargs="*", default=["data/processed/structured_result.json",
+                                                           "data/processed/unstructured_result.json"],
+                        help="用于构建图存储的处理结果")
+    parser.add_argument("--entities", type=int, default=10000, help="没有处理结果时的合成实体数")
+    parser.add_argument("--llm_base_url", default="", help="使用已有的 OpenAI 兼容接口(为空则启动进程内模拟接口)")
+    parser.add_argument("--llm_first_token_ms", type=float, default=300.0, help="模拟接口首 token 延迟(毫秒)")
+    parser.add_argument("--llm_tokens_per_s", type=float, default=50.0, help="模拟接口每个请求的输出速率")
+    parser.add_argument("--llm_answer_tokens", type=int, default=60, help="模拟回答长度(token)")
+    parser.add_argument("--output", default="", help="报告输出路径(JSON)")
+    args = parser.parse_args()
+
+    questions = None
+    if args.questions_file:
+        # 启动模拟接口与构建图存储之前先检查问题文件
+        try:
+            questions = load_questions(args.questions_file)
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+    tracer = get_tracer()
+    tracer.enabled = True
+    server = None
+    base_url = args.llm_base_url
+    if not base_url:
+        server = MockLLMServer(first_token_ms=args.llm_first_token_ms, tokens_per_s=args.llm_tokens_per_s,
+                               answer_tokens=args.llm_answer_tokens).start()
+        base_url = server.base_url
+        print(f"🔧 模拟 LLM 接口: {base_url} (首 token {args.llm_first_token_ms:.0f} ms, "
+              f"{args.llm_tokens_per_s:.0f} tokens/s)")
+
+    system = None
+    try:
+        if args.backend == "system":
+            # 系统的 OpenAI 客户端按环境变量指向模拟接口
+            os.environ['OPENAI_API_KEY'] = os.environ.get('OPENAI_API_KEY') or "mock"
+            os.environ['OPENAI_BASE_URL'] = base_url
+            from demo_v2 import LazyAgriSystem
+            system = LazyAgriSystem(tracer=tracer)
+            system.ensure('chatgpt')
+            answer_fn = system_answerer(system)
+            corpus = None
+        else:
+            start = time.perf_counter()
+            store, corpus = load_graph_store(args.processed, args.entities)
+            stats = store.get_stats()
+            print(f"🔧 {type(store).__name__}: {stats['total_entities']} 实体 / {stats['total_relations']} 关系 "
+                  f"({time.perf_counter() - start:.1f} s)")
+            answer_fn = direct_answerer(store, base_url)
+
+        if questions is None:
+            questions = list((corpus or SyntheticAgriCorpus(1000)).questions(200))
+        count = args.requests or max(1, int(args.qps * args.duration))
+        print(f"🚀 回放 {count} 个请求, 目标 {args.qps} qps ({args.arrival}), 并发上限 {args.concurrency}")
+
+        # 预热一次(建立连接、首次导入等)，不计入结果
+        answer_fn(questions[0])
+        tracer.reset()
+        records, start = LoadGenerator(answer_fn, args.qps, args.concurrency, args.arrival).run(questions, count)
+        report = build_report(records, start, args.qps)
+        print_report(report)
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"已保存压测报告: {args.output}")
+    finally:
+        if system is not None:
+            system.cleanup()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
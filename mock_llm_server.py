@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟 OpenAI 兼容接口
+实现 /v1/chat/completions(含 stream=true 的 SSE 流式输出)，首 token 延迟与输出速率可配置，
+用于在不调用真实 API 的情况下测试流式问答与压测
+
+用法:
+    python mock_llm_server.py --port 8001 --first_token_ms 300 --tokens_per_s 40
+    # config/config_v2.yaml 中 openai.base_url 设为 http://127.0.0.1:8001/v1
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from kg_context import TokenCounter
+
+# 多模态消息中每张图像计入的提示 token 数(与 OpenAI 低精度图像计费一致)
+IMAGE_PROMPT_TOKENS = 85
+
+
+def message_text(content):
+    """消息内容的文本部分(多模态消息只取 text 分片)"""
+    if isinstance(content, list):
+        return "\n".join(part.get('text', '') for part in content if part.get('type') == 'text')
+    return content or ''
+
+
+class MockLLMServer:
+    """可在进程内启动的模拟 LLM 服务"""
+
+    def __init__(self, host="127.0.0.1", port=0, first_token_ms=200.0, tokens_per_s=50.0,
+                 answer_tokens=60, model="mock-gpt"):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.model = model
+        self.requests = 0
+        self.token_counter = TokenCounter()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def answer_for(self, messages):
+        """根据问题生成确定性的回答 token 序列"""
+        question = message_text(messages[-1].get('content')) if messages else ''
+        seed = question.strip().splitlines()[-1].split(':')[-1].strip() if question.strip() else ''
+        seed = seed or '农业问题'
+        tokens = ["根据", "知识", "图谱", "，"]
+        while len(tokens) < self.answer_tokens:
+            tokens.append(seed[len(tokens) % len(seed)])
+        return tokens[:self.answer_tokens]
+
+    def prompt_tokens(self, messages):
+        """估算提示 token 数: 文本按 TokenCounter 计，图像按固定数计"""
+        total = 0
+        for message in messages:
+            content = message.get('content')
+            total += self.token_counter.count(message_text(content))
+            if isinstance(content, list):
+                total += IMAGE_PROMPT_TOKENS * sum(1 for part in content if part.get('type') == 'image_url')
+        return total
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send_json(404, {'error': {'message': 'not found'}})
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                with server._lock:
+                    server.requests += 1
+
+                tokens = server.answer_for(request.get('messages', []))
+                usage = {
+                    'prompt_tokens': server.prompt_tokens(request.get('messages', [])),
+                    'completion_tokens': len(tokens),
+                }
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+                time.sleep(server.first_token_ms / 1000.0)
+                interval = 1.0 / server.tokens_per_s if server.tokens_per_s > 0 else 0.0
+
+                if not request.get('stream'):
+                    time.sleep(interval * max(0, len(tokens) - 1))
+                    self._send_json(200, {
+                        'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                        'object': 'chat.completion',
+                        'model': server.model,
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                        'usage': usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(interval)
+                    self._send_event({'id': chunk_id, 'object': 'chat.completion.chunk', 'model': server.model,
+                                      'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]})
+                self._send_event({'id': chunk_id, 'object': 'chat.completion.chunk', 'model': server.model,
+                                  'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+                if (request.get('stream_options') or {}).get('include_usage'):
+                    # 与 OpenAI 一致: 只有请求 include_usage 时才在末尾单独发送一个带 usage、choices 为空的分片
+                    self._send_event({'id': chunk_id, 'object': 'chat.completion.chunk', 'model': server.model,
+                                      'choices': [], 'usage': usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _send_event(self, payload):
+                self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self):
+        """后台线程启动"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 OpenAI 兼容 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument("--first_token_ms", type=float, default=200.0, help="首 token 延迟(毫秒)")
+    parser.add_argument("--tokens_per_s", type=float, default=50.0, help="输出速率(token/秒)")
+    parser.add_argument("--answer_tokens", type=int, default=60, help="每个回答的 token 数")
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, args.first_token_ms, args.tokens_per_s, args.answer_tokens)
+    print(f"🚀 模拟LLM服务已启动: {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
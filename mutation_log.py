@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+图谱变更日志
+MockKnowledgeGraph 的每次变更校验通过后先以带 CRC32 校验的记录追加写入日志段，再修改内存；
+日志积累到一定条数后把当前图谱压缩为快照并轮换日志段。
+恢复时加载最新快照并只重放其后的记录(O(增量))，只读副本可持续跟随(tail)日志，
+并以写时复制方式整体替换图谱对象，正在读取旧图谱的查询不受影响。
+
+目录结构:
+    snapshot-<seq>.json   截至 seq 的完整图谱
+    wal-<first_seq>.log   从 first_seq 开始的日志段，每行: <seq>\\t<crc32>\\t<json>
+
+用法(离线压缩与查看状态):
+    python mutation_log.py data/graph_log --compact
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+from demo_basic import MockKnowledgeGraph, normalize_relation
+from tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_PATTERN = re.compile(r"^wal-(\d+)\.log$")
+_SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d+)\.json$")
+
+
+def _checksum(seq, body):
+    return zlib.crc32(f"{seq}\t{body}".encode('utf-8'))
+
+
+def encode_record(seq, op, data):
+    body = json.dumps({'op': op, 'data': data}, ensure_ascii=False, separators=(',', ':'))
+    return f"{seq}\t{_checksum(seq, body):08x}\t{body}\n"
+
+
+def decode_record(line):
+    """解析一行日志，返回 (seq, op, data)；行不完整或校验失败时返回 None"""
+    if not line.endswith('\n'):
+        return None
+    try:
+        seq_text, crc_text, body = line.rstrip('\n').split('\t', 2)
+        seq = int(seq_text)
+        if int(crc_text, 16) != _checksum(seq, body):
+            return None
+        record = json.loads(body)
+    except ValueError:
+        return None
+    return seq, record['op'], record['data']
+
+
+def _list_files(directory, pattern):
+    """返回 [(序号, 路径)]，按序号升序"""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def latest_snapshot(directory):
+    snapshots = _list_files(directory, _SNAPSHOT_PATTERN)
+    return snapshots[-1] if snapshots else (0, None)
+
+
+def read_segment(path, offset=0):
+    """从 offset 起读取日志段，返回 ([(seq, op, data)], 最后一条有效记录之后的偏移)"""
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            record = decode_record(raw.decode('utf-8', errors='replace'))
+            if record is None:
+                # 写了一半的尾部记录(或损坏)之后的内容都不可信
+                break
+            records.append(record)
+            offset += len(raw)
+    return records, offset
+
+
+def apply_record(kg, op, data):
+    """把一条日志记录应用到图谱(不再写日志)"""
+    if op == 'add_entity':
+        kg.add_entity(data)
+    elif op == 'add_relation':
+        kg.add_relation(data)
+    elif op == 'build':
+        kg.build_from_data(data)
+    else:
+        raise ValueError(f"未知的日志操作: {op}")
+
+
+def _relation_key(relation):
+    # 字典形式的关系按图谱中保存的 [起点, 关系, 终点] 形式比较
+    relation = normalize_relation(relation)
+    return json.dumps(list(relation) if isinstance(relation, tuple) else relation,
+                      ensure_ascii=False, sort_keys=True)
+
+
+def new_items(kg, processed_data):
+    """处理结果中图谱尚未包含的部分: 新增或内容有变化的实体，以及尚不存在的关系
+
+    重复导入同一份数据时只把增量写入日志，避免重放后出现重复关系。
+    """
+    known = {_relation_key(relation) for relation in kg.relations}
+    entities = [entity for entity in processed_data.get('entities', [])
+                if not isinstance(entity, dict) or kg.entities.get(entity.get('id')) != entity]
+    relations = []
+    for relation in processed_data.get('relations', []):
+        key = _relation_key(relation)
+        if key not in known:
+            known.add(key)
+            relations.append(relation)
+    return {'entities': entities, 'relations': relations}
+
+
+def load_snapshot(path):
+    """从快照文件构建图谱"""
+    kg = MockKnowledgeGraph()
+    with open(path, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    kg.build_from_data(snapshot)
+    kg.log_seq = snapshot['seq']
+    return kg
+
+
+class MutationLog:
+    """追加写变更日志(单写者)
+
+    fsync=True 时每条记录落盘后才返回；compact_every 条记录后压缩为快照(0 为不自动压缩)。
+    """
+
+    def __init__(self, directory, fsync=True, compact_every=10000):
+        self.directory = directory
+        self.fsync = fsync
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_seq, _ = latest_snapshot(directory)
+        self.last_seq = self.snapshot_seq
+        self.records_since_snapshot = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._open_tail()
+
+    def _open_tail(self):
+        """打开最新日志段，截掉崩溃时写了一半的尾部记录"""
+        segments = _list_files(self.directory, _SEGMENT_PATTERN)
+        if not segments:
+            self._start_segment(self.snapshot_seq + 1)
+            return
+        for _, path in segments:
+            records, end = read_segment(path)
+            if records:
+                self.last_seq = max(self.last_seq, records[-1][0])
+                self.records_since_snapshot += sum(1 for r in records if r[0] > self.snapshot_seq)
+        path = segments[-1][1]
+        if os.path.getsize(path) != end:
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _start_segment(self, first_seq):
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.directory, f"wal-{first_seq:012d}.log")
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def append(self, op, data):
+        """追加一条记录，返回其序号"""
+        with self._lock:
+            seq = self.last_seq + 1
+            self._file.write(encode_record(seq, op, data))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.last_seq = seq
+            self.records_since_snapshot += 1
+            return seq
+
+    def maybe_compact(self, kg):
+        if self.compact_every and self.records_since_snapshot >= self.compact_every:
+            self.compact(kg)
+
+    def compact(self, kg):
+        """把图谱写为快照并轮换日志段，删除已被快照覆盖的旧段与旧快照"""
+        with self._lock:
+            seq = kg.log_seq
+            path = os.path.join(self.directory, f"snapshot-{seq:012d}.json")
+            tmp = path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'seq': seq, 'entities': list(kg.entities.values()), 'relations': kg.relations},
+                          f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # 原子替换，崩溃时不会留下半个快照
+            os.replace(tmp, path)
+            self._start_segment(self.last_seq + 1)
+
+            for snapshot_seq, old in _list_files(self.directory, _SNAPSHOT_PATTERN):
+                if snapshot_seq < seq:
+                    os.remove(old)
+            segments = _list_files(self.directory, _SEGMENT_PATTERN)
+            for (first, old), (next_first, _) in zip(segments, segments[1:]):
+                # 段内记录全部不晚于快照时可删除
+                if next_first - 1 <= seq:
+                    os.remove(old)
+            self.snapshot_seq = seq
+            self.records_since_snapshot = self.last_seq - seq
+            return path
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def open_graph(directory, fsync=True, compact_every=10000, writable=True):
+    """从快照 + 增量日志恢复图谱；writable 时挂上日志，之后的变更继续追加"""
+    _, snapshot_path = latest_snapshot(directory)
+    kg = load_snapshot(snapshot_path) if snapshot_path else MockKnowledgeGraph()
+    replayed = LogTailer(directory, kg).poll()
+    if writable:
+        kg.mutation_log = MutationLog(directory, fsync=fsync, compact_every=compact_every)
+    return kg, replayed
+
+
+def compact_directory(directory):
+    """离线压缩: 恢复图谱后写出快照并清理旧日志段"""
+    kg, _ = open_graph(directory, compact_every=0)
+    path = kg.mutation_log.compact(kg)
+    kg.mutation_log.close()
+    return path
+
+
+class LogTailer:
+    """跟随日志更新只读副本
+
+    落后于压缩(所需日志段已被删除)时重新加载最新快照；
+    copy_on_write=True 时新记录应用到图谱副本上，完成后整体替换，不修改其他线程正在读取的图谱。
+    on_reload(kg) 在图谱对象被替换时回调(调用方据此切换引用)。
+
+    写时复制每次替换都要复制整个图谱，调用方通常还要重算指标；swap_interval 秒内的多次拉取
+    累积到同一个副本上，距上次替换满 swap_interval 秒才替换一次(首次更新立即替换)。
+    self.kg 为正在应用记录的图谱，尚未替换时与调用方持有的图谱不同。
+    """
+
+    def __init__(self, directory, kg=None, on_reload=None, copy_on_write=False, swap_interval=0.0):
+        self.directory = directory
+        self.kg = kg if kg is not None else MockKnowledgeGraph()
+        self.on_reload = on_reload
+        self.copy_on_write = copy_on_write
+        self.swap_interval = swap_interval
+        self._private = not copy_on_write
+        self._segment = None
+        self._offset = 0
+        # 最近一次替换出去(调用方持有)的图谱、替换时间与对应的读取位置
+        self._published = self.kg
+        self._published_at = float('-inf')
+        self._published_position = (None, 0)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _reload(self):
+        _, path = latest_snapshot(self.directory)
+        if path is None:
+            return
+        # 新加载的图谱尚未被其他线程引用，可直接修改；poll 结束时统一回调 on_reload
+        self.kg = load_snapshot(path)
+        self._private = True
+        self._segment, self._offset = None, 0
+
+    def poll(self):
+        """应用新增记录并按 swap_interval 替换图谱，返回应用条数"""
+        position = (self._segment, self._offset)
+        try:
+            applied = self._poll()
+        except Exception:
+            if self.copy_on_write and self.kg is not self._published:
+                # 丢弃尚未替换的副本(含应用了一半的记录)，下次从上次替换时的位置重新应用
+                self.kg = self._published
+                self._private = False
+                self._segment, self._offset = self._published_position
+            else:
+                # 下次从同一位置重试；原地修改时已应用的记录序号不大于 log_seq，重读时跳过
+                self._segment, self._offset = position
+            raise
+        self._publish()
+        return applied
+
+    def _publish(self):
+        if self.kg is self._published:
+            return
+        now = time.monotonic()
+        if self.copy_on_write and now - self._published_at < self.swap_interval:
+            return
+        # on_reload 抛出异常时副本保持未替换状态，下次拉取时重试
+        if self.on_reload:
+            self.on_reload(self.kg)
+        self._published = self.kg
+        self._published_at = now
+        self._published_position = (self._segment, self._offset)
+        # 已交给调用方的图谱不再原地修改
+        self._private = not self.copy_on_write
+
+    def _writable(self):
+        """返回可修改的图谱: 写时复制模式下首次修改前复制当前图谱"""
+        if not self._private:
+            self.kg = self.kg.copy()
+            self._private = True
+        return self.kg
+
+    def _poll(self):
+        applied = 0
+        while True:
+            wanted = self.kg.log_seq + 1
+            # 包含下一条所需记录的日志段(当前段读完后自然转到下一段)
+            segments = [s for s in _list_files(self.directory, _SEGMENT_PATTERN) if s[0] <= wanted]
+            if not segments:
+                # 所需记录已被压缩进快照
+                if latest_snapshot(self.directory)[0] >= wanted:
+                    self._reload()
+                    continue
+                return applied
+            path = segments[-1][1]
+            if self._segment != path:
+                self._segment, self._offset = path, 0
+            try:
+                records, self._offset = read_segment(path, self._offset)
+            except FileNotFoundError:
+                # 读取前被压缩删除
+                continue
+            new = 0
+            for seq, op, data in records:
+                if seq <= self.kg.log_seq:
+                    continue
+                kg = self._writable()
+                apply_record(kg, op, data)
+                kg.log_seq = seq
+                new += 1
+            if not new:
+                return applied
+            applied += new
+
+    def follow(self, interval=1.0, on_update=None):
+        """后台线程定期拉取新记录；on_update(条数) 在有更新时回调
+
+        单次拉取失败(如读取日志段出错、on_reload 抛出异常)只记录日志并计数，下个周期重试，不终止跟随线程。
+        """
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    applied = self.poll()
+                except Exception as e:
+                    logger.error(f"跟随变更日志失败，{interval} 秒后重试: {e}", exc_info=True)
+                    get_tracer().count("log_tail_errors")
+                    continue
+                if applied and on_update:
+                    on_update(applied)
+        self._thread = threading.Thread(target=loop, name="log-tailer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图谱变更日志工具")
+    parser.add_argument("directory", help="日志目录")
+    parser.add_argument("--compact", action="store_true", help="压缩为快照")
+    args = parser.parse_args()
+
+    if args.compact:
+        print(f"✓ 已写入快照: {compact_directory(args.directory)}")
+    log = MutationLog(args.directory, compact_every=0)
+    log.close()
+    segments = _list_files(args.directory, _SEGMENT_PATTERN)
+    print(f"最新序号: {log.last_seq}, 快照序号: {log.snapshot_seq}, "
+          f"快照后记录: {log.records_since_snapshot}, 日志段: {len(segments)}")
+
+
+if __name__ == "__main__":
+    main()
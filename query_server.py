@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+"""
+Agri-mGraphrag 常驻查询服务
+启动时一次性加载图谱、向量索引与嵌入模型，通过 HTTP 提供检索、邻居查询与问答接口。
+阻塞调用在有界线程池中执行，排队请求超过上限时直接返回 503(背压)。
+多进程模式下各进程以只读 mmap 共享同一份图谱/向量快照(嵌入模型仍由各进程各自加载)。
+
+用法:
+    python query_server.py --port 8000 --workers 4 --queue_size 32
+    python query_server.py --processes 4 --snapshot_dir data/snapshot
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+# 添加项目路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from demo_basic import MockKnowledgeGraph
+from demo_v2 import LazyAgriSystem, SystemUnavailable, build_answer_cache
+from embedding_batcher import install_batcher
+from graph_analytics import GraphAnalytics
+from graph_snapshot import GraphSnapshot, snapshot_is_stale, write_snapshot
+from hybrid_retrieval import HybridRetriever
+from kg_context import KHopContextBuilder
+from llm_streaming import StreamingAnswerer, graph_retrieve, load_llm_config
+from mutation_log import LogTailer, open_graph
+from sharded_graph import ShardedKnowledgeGraph
+from tracing import get_tracer
+
+
+class ServiceOverloaded(Exception):
+    """排队请求已满"""
+
+
+class QueryService:
+    """常驻查询服务: 持有模型与索引，并限制并发"""
+
+    def __init__(self, processed_paths, embeddings_prefix="", workers=4, queue_size=32,
+                 system=None, embed_batch_size=1, embed_max_wait_ms=5.0, embed_method="encode",
+                 snapshot_dir="", answer_cache_size=1024, answer_cache_ttl=3600.0,
+                 semantic_cache_threshold=0.0, llm_config="config/config_v2.yaml",
+                 graph_log_dir="", log_poll_interval=1.0, graph_swap_interval=10.0, graph_shards=0, shard_partition="hash"):
+        self.processed_paths = list(processed_paths)
+        self.embeddings_prefix = embeddings_prefix
+        self.snapshot_dir = snapshot_dir
+        self.workers = workers
+        self.queue_size = queue_size
+        self.embed_batch_size = embed_batch_size
+        self.embed_max_wait_ms = embed_max_wait_ms
+        self.embed_method = embed_method
+        self.llm_config = llm_config
+        self.graph_log_dir = graph_log_dir
+        self.log_poll_interval = log_poll_interval
+        self.graph_swap_interval = graph_swap_interval
+        self.graph_shards = graph_shards
+        self.shard_partition = shard_partition
+        self.tailer = None
+        self._analytics = None
+        self._context_builder = None
+        self.batcher = None
+        self.system = system or LazyAgriSystem()
+        self.system.answer_cache = build_answer_cache(self.system, answer_cache_size, answer_cache_ttl,
+                                                      semantic_cache_threshold, embed_method)
+        # 重新导入会更新处理结果/快照文件，以其修改时间作为图谱版本使缓存失效
+        self.system.kg_version_fn = self._data_version
+        self.kg = MockKnowledgeGraph()
+        self.retriever = None
+        self.streamer = None
+        self.vector_ready = False
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-worker")
+        # 正在执行 + 排队中的请求数上限
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._inflight = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        # 系统 answer_question 使用的向量索引是否已加载(快照模式下在首次问答时加载)
+        self._qa_index_loaded = False
+        self._qa_index_lock = threading.Lock()
+
+    def load(self):
+        """一次性加载图谱、向量索引与嵌入模型"""
+        if self.snapshot_dir:
+            # 共享快照: 图谱与向量矩阵均为只读 mmap，不再加载进程私有的向量索引
+            self.kg = GraphSnapshot(self.snapshot_dir)
+        elif self.graph_log_dir:
+            # 从图谱变更日志恢复(最新快照 + 增量记录)，并持续跟随新导入的数据
+            self.kg, replayed = open_graph(self.graph_log_dir, writable=False)
+            print(f"已从变更日志恢复图谱: 序号 {self.kg.log_seq} (重放 {replayed} 条)")
+            self._analytics = GraphAnalytics(self.kg)
+            self._analytics.compute()
+            # 写时复制: 新记录应用到副本并算好指标后整体替换，请求线程读取的图谱不会被就地修改；
+            # 复制与重算指标都与图谱规模成正比，graph_swap_interval 秒内的更新合并为一次替换
+            self.tailer = LogTailer(self.graph_log_dir, self.kg, on_reload=self._replace_graph,
+                                    copy_on_write=True, swap_interval=self.graph_swap_interval)
+            self.tailer.follow(self.log_poll_interval)
+        elif self.graph_shards > 1:
+            self.kg = load_sharded_graph(self.processed_paths, self.graph_shards, self.shard_partition)
+        else:
+            self.kg = load_graph(self.processed_paths)
+
+        if isinstance(self.kg, GraphSnapshot):
+            if self.kg.has_vectors and self._embedding_available():
+                self.vector_ready = callable(getattr(self.system.embedding_manager, self.embed_method, None))
+        elif self.embeddings_prefix and self._embedding_available():
+            try:
+                self.system.embedding_manager.load_embeddings(self.embeddings_prefix)
+                self.vector_ready = True
+            except Exception as e:
+                print(f"加载向量索引失败: {e}")
+            self._qa_index_loaded = True
+
+        if self.vector_ready and self.embed_batch_size > 1:
+            manager = self.system.embedding_manager
+            if callable(getattr(manager, self.embed_method, None)):
+                self.batcher = install_batcher(manager, self.embed_method,
+                                               self.embed_batch_size, self.embed_max_wait_ms)
+            else:
+                print(f"⚠️  嵌入管理器没有 {self.embed_method}() 方法，未启用查询微批")
+
+        vector_search = self._vector_search if self.vector_ready else (lambda q, k: [])
+        # 跟随日志时图谱对象可能被整体替换，检索总是访问当前的 self.kg
+        self.retriever = HybridRetriever(lambda q, k: self.kg.search_entities(q, k), vector_search)
+
+        config = load_llm_config(self.llm_config)
+        if config['api_key'] or config['base_url']:
+            importance = self.kg.get_importance if isinstance(self.kg, (GraphSnapshot, ShardedKnowledgeGraph)) else None
+            self._context_builder = KHopContextBuilder(self.kg, importance=importance)
+            self.streamer = StreamingAnswerer(graph_retrieve(self.retriever, self._context_builder), **config)
+        return self
+
+    def _embedding_available(self):
+        """系统模块不可用时只提供图谱检索，不中断服务启动"""
+        try:
+            return self.system.components_status['embedding']
+        except SystemUnavailable as e:
+            print(f"⚠️  系统模块不可用，向量检索与问答关闭: {e}")
+            return False
+
+    def _replace_graph(self, kg):
+        """日志跟随产生新图谱(应用增量的副本或重新加载的快照)时，计算指标后切换引用
+
+        以上一版图谱的 PageRank 为初值(热启动)，小批增量后只需少量迭代。
+        """
+        self._analytics.rebind(kg).refresh()
+        self.kg = kg
+        if self._context_builder is not None:
+            self._context_builder.kg = kg
+
+    def _data_version(self):
+        if self.graph_log_dir and not self.snapshot_dir:
+            return self.kg.log_seq
+        paths = [os.path.join(self.snapshot_dir, 'meta.json')] if self.snapshot_dir else self.processed_paths
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else 0 for p in paths)
+
+    def _vector_search(self, query, k):
+        if isinstance(self.kg, GraphSnapshot):
+            encode = getattr(self.system.embedding_manager, self.embed_method)
+            return self.kg.vector_search(encode(query), k)
+        return self.system.search_similar_entities(query, k=k)
+
+    async def run(self, fn, *args, **kwargs):
+        """在线程池中执行阻塞调用；排队已满时抛出 ServiceOverloaded"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            get_tracer().count("server_rejected")
+            raise ServiceOverloaded()
+        with self._lock:
+            self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            self._slots.release()
+
+    def open_stream(self, question):
+        """占用一个请求槽位，返回 (流式问答事件生成器, release)；排队已满时抛出 ServiceOverloaded
+
+        生成器结束或被关闭时释放槽位；生成器可能从未开始迭代(客户端在响应开始前断开)，
+        调用方须在响应结束后再调用一次 release(可重复调用，只释放一次)。
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            get_tracer().count("server_rejected")
+            raise ServiceOverloaded()
+        with self._lock:
+            self._inflight += 1
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self._inflight -= 1
+            self._slots.release()
+
+        return self._stream(question, release), release
+
+    def _stream(self, question, release):
+        try:
+            if self.streamer is None:
+                yield {'type': 'error', 'error': '未配置 OpenAI 兼容接口，无法流式回答'}
+                return
+            yield from self.streamer.stream(question)
+        finally:
+            release()
+
+    def search(self, query, k=5):
+        return self.retriever.search(query, k=k)
+
+    def neighbors(self, entity, limit=50):
+        return self.kg.get_neighbors(entity, limit=limit)
+
+    def answer(self, question):
+        if not self.system.components_status['chatgpt']:
+            return {'error': 'ChatGPT未配置'}
+        self._load_qa_index()
+        return self.system.answer_question(question, use_kg_context=True)
+
+    def _load_qa_index(self):
+        """快照模式下检索使用共享向量矩阵，但 answer_question 仍依赖系统的向量索引，首次问答时加载"""
+        if self._qa_index_loaded:
+            return
+        with self._qa_index_lock:
+            if self._qa_index_loaded:
+                return
+            if self.embeddings_prefix and self._embedding_available():
+                try:
+                    self.system.embedding_manager.load_embeddings(self.embeddings_prefix)
+                except Exception as e:
+                    print(f"加载问答向量索引失败: {e}")
+            self._qa_index_loaded = True
+
+    def status(self):
+        stats = self.kg.get_stats()
+        with self._lock:
+            stats['server'] = {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'inflight': self._inflight,
+                'rejected': self._rejected,
+                'vector_index': self.vector_ready,
+                'streaming': self.streamer is not None,
+            }
+        if self.batcher:
+            stats['server']['embedding_batches'] = self.batcher.batches
+            stats['server']['avg_embedding_batch_size'] = self.batcher.avg_batch_size
+        if self.system.answer_cache is not None:
+            stats['answer_cache'] = self.system.answer_cache.stats()
+        if self.system.loaded:
+            stats['system'] = self.system.get_system_status()
+        return stats
+
+    def close(self):
+        if self.tailer:
+            self.tailer.stop()
+        if self.retriever:
+            self.retriever.close()
+        if self.batcher:
+            self.batcher.close()
+        if isinstance(self.kg, (GraphSnapshot, ShardedKnowledgeGraph)):
+            self.kg.close()
+        self._executor.shutdown(wait=False)
+        self.system.cleanup()
+
+
+def load_graph(processed_paths):
+    """从处理结果构建内存图谱并预计算节点重要度"""
+    kg = MockKnowledgeGraph()
+    for path in processed_paths:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                kg.build_from_data(json.load(f))
+    GraphAnalytics(kg).compute()
+    return kg
+
+
+def load_sharded_graph(processed_paths, num_shards, partition="hash"):
+    """从处理结果构建多进程分片图谱"""
+    kg = ShardedKnowledgeGraph(num_shards, partition)
+    for path in processed_paths:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                kg.build_from_data(json.load(f))
+    kg.compute_analytics()
+    return kg
+
+
+def build_snapshot(processed_paths, snapshot_dir, embed_method="encode", batch_size=256):
+    """构建共享快照；嵌入管理器提供批量编码方法时一并写入实体向量矩阵"""
+    kg = load_graph(processed_paths)
+    vectors = None
+    system = LazyAgriSystem()
+    try:
+        embedding_ready = system.components_status['embedding']
+    except SystemUnavailable as e:
+        print(f"⚠️  系统模块不可用，快照不含向量: {e}")
+        embedding_ready = False
+    if embedding_ready:
+        encode = getattr(system.embedding_manager, embed_method, None)
+        if callable(encode):
+            # 导入时已用 encode 编码的实体(如按描述编码的图像实体)直接使用其向量
+            vectors = {}
+            if embed_method == 'encode':
+                vectors = {entity['name']: list(map(float, entity['embedding']))
+                           for entity in kg.entities.values() if entity.get('embedding')}
+            names = sorted({entity['name'] for entity in kg.entities.values()} - set(vectors))
+            for start in range(0, len(names), batch_size):
+                part = names[start:start + batch_size]
+                vectors.update(zip(part, (list(map(float, v)) for v in encode(part))))
+        else:
+            print(f"⚠️  嵌入管理器没有 {embed_method}() 方法，快照不含向量")
+    meta = write_snapshot(kg, snapshot_dir, vectors, source_paths=processed_paths)
+    system.cleanup()
+    print(f"✓ 快照已写入 {snapshot_dir}: {meta['num_nodes']} 个节点, 向量维度 {meta['dim']}")
+    return meta
+
+
+def create_app(service: QueryService):
+    """创建 FastAPI 应用"""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from pydantic import BaseModel
+    from starlette.background import BackgroundTask
+    from starlette.concurrency import run_in_threadpool
+
+    class QuestionRequest(BaseModel):
+        question: str
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        service.close()
+
+    app = FastAPI(title="Agri-mGraphrag Query Service", lifespan=lifespan)
+
+    async def call(fn, *args, **kwargs):
+        try:
+            return await service.run(fn, *args, **kwargs)
+        except ServiceOverloaded:
+            raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试",
+                                headers={"Retry-After": "1"})
+        except SystemUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"问答系统不可用: {e}")
+
+    @app.get("/health")
+    async def health():
+        return {'status': 'ok'}
+
+    @app.get("/search")
+    async def search(q: str, k: int = 5):
+        return {'query': q, 'results': await call(service.search, q, k)}
+
+    @app.get("/neighbors")
+    async def neighbors(entity: str, limit: int = 50):
+        return {'entity': entity, 'neighbors': await call(service.neighbors, entity, limit)}
+
+    @app.post("/qa")
+    async def qa(request: QuestionRequest):
+        return await call(service.answer, request.question)
+
+    @app.post("/qa/stream")
+    async def qa_stream(request: QuestionRequest):
+        """以 Server-Sent Events 推送检索上下文与回答 token"""
+        try:
+            events, release = service.open_stream(request.question)
+        except ServiceOverloaded:
+            raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试",
+                                headers={"Retry-After": "1"})
+        try:
+            lines = (f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events)
+            # 客户端在开始迭代前断开时生成器不会运行，由响应结束后的后台任务释放槽位
+            return StreamingResponse(lines, media_type="text/event-stream", background=BackgroundTask(release))
+        except Exception:
+            release()
+            raise
+
+    @app.get("/status")
+    async def status():
+        # 分片图谱统计需跨进程通信、系统状态可能访问 Neo4j，不在事件循环中阻塞
+        return await run_in_threadpool(service.status)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return get_tracer().to_prometheus()
+
+    return app
+
+
+# 多进程模式下通过环境变量把服务参数传给各工作进程
+_CONFIG_ENV = "AGRI_QUERY_SERVER_CONFIG"
+
+
+def create_app_from_env():
+    """uvicorn 多进程工作进程的应用工厂"""
+    config = json.loads(os.environ[_CONFIG_ENV])
+    get_tracer().enabled = config.pop('trace', False)
+    return create_app(QueryService(**config).load())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agri-mGraphrag 查询服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=4, help="工作线程数")
+    parser.add_argument("--queue_size", type=int, default=32, help="最大排队请求数，超出返回503")
+    parser.add_argument("--processed_out_struct", default="data/processed/structured_result.json", help="结构化处理结果")
+    parser.add_argument("--processed_out_text", default="data/processed/unstructured_result.json", help="文本处理结果")
+    parser.add_argument("--processed_out_image", default="data/processed/image_result.json", help="图像处理结果")
+    parser.add_argument("--embeddings_out", default="data/embeddings/index", help="向量索引前缀")
+    parser.add_argument("--embed_batch_size", type=int, default=32, help="查询向量微批最大批大小(1为关闭)")
+    parser.add_argument("--embed_max_wait_ms", type=float, default=5.0, help="查询向量合批最长等待(毫秒)")
+    parser.add_argument("--embed_method", default="encode", help="嵌入管理器的编码方法名")
+    parser.add_argument("--answer_cache_size", type=int, default=1024, help="问答缓存条目数(0为关闭)")
+    parser.add_argument("--answer_cache_ttl", type=float, default=3600.0, help="问答缓存有效期(秒)")
+    parser.add_argument("--semantic_cache_threshold", type=float, default=0.0, help="语义缓存相似度阈值(0为仅精确匹配)")
+    parser.add_argument("--processes", type=int, default=1, help="工作进程数(>1 时共享只读快照)")
+    parser.add_argument("--snapshot_dir", default="", help="共享快照目录(多进程模式默认 data/snapshot)")
+    parser.add_argument("--rebuild_snapshot", action="store_true", help="强制重新构建共享快照(处理结果变化时会自动重建)")
+    parser.add_argument("--graph_log_dir", default="", help="从图谱变更日志加载并跟随更新(替代处理结果JSON)")
+    parser.add_argument("--log_poll_interval", type=float, default=1.0, help="跟随变更日志的间隔(秒)")
+    parser.add_argument("--graph_swap_interval", type=float, default=10.0,
+                        help="跟随变更日志时替换图谱并重算指标的最短间隔(秒)，期间的更新合并为一次替换")
+    parser.add_argument("--graph_shards", type=int, default=0, help="图谱分片进程数(>1 时按分片并行查询)")
+    parser.add_argument("--shard_partition", choices=["hash", "type"], default="hash", help="分片方式: 实体名哈希或实体类型")
+    parser.add_argument("--llm_config", default="config/config_v2.yaml", help="OpenAI 兼容接口配置(流式问答)")
+    parser.add_argument("--trace", action="store_true", help="启用埋点(/metrics)")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ 未安装 uvicorn/fastapi，请运行: pip install -r requirements.txt")
+        sys.exit(1)
+
+    processed_paths = [args.processed_out_struct, args.processed_out_text, args.processed_out_image]
+    snapshot_dir = args.snapshot_dir or ("data/snapshot" if args.processes > 1 else "")
+    # 快照缺失或处理结果文件在其构建后有变化时自动重建
+    if snapshot_dir and (args.rebuild_snapshot or snapshot_is_stale(snapshot_dir, processed_paths)):
+        print(f"🔧 构建共享快照: {snapshot_dir}")
+        # 在子进程中构建，避免主进程常驻嵌入模型
+        builder = multiprocessing.Process(target=build_snapshot,
+                                          args=(processed_paths, snapshot_dir, args.embed_method))
+        builder.start()
+        builder.join()
+        if builder.exitcode != 0:
+            print("❌ 快照构建失败")
+            sys.exit(1)
+
+    config = {
+        'processed_paths': processed_paths,
+        'embeddings_prefix': args.embeddings_out,
+        'workers': args.workers,
+        'queue_size': args.queue_size,
+        'embed_batch_size': args.embed_batch_size,
+        'embed_max_wait_ms': args.embed_max_wait_ms,
+        'embed_method': args.embed_method,
+        'snapshot_dir': snapshot_dir,
+        'answer_cache_size': args.answer_cache_size,
+        'answer_cache_ttl': args.answer_cache_ttl,
+        'semantic_cache_threshold': args.semantic_cache_threshold,
+        'llm_config': args.llm_config,
+        'graph_log_dir': args.graph_log_dir,
+        'log_poll_interval': args.log_poll_interval,
+        'graph_swap_interval': args.graph_swap_interval,
+        'graph_shards': args.graph_shards,
+        'shard_partition': args.shard_partition,
+    }
+
+    if args.processes > 1:
+        os.environ[_CONFIG_ENV] = json.dumps(dict(config, trace=args.trace), ensure_ascii=False)
+        print(f"🚀 查询服务已启动: http://{args.host}:{args.port} ({args.processes} 个进程)")
+        uvicorn.run("query_server:create_app_from_env", factory=True, workers=args.processes,
+                    host=args.host, port=args.port, app_dir=str(project_root))
+        return
+
+    get_tracer().enabled = args.trace
+    print("🔧 加载图谱与向量索引...")
+    service = QueryService(**config).load()
+    service.system.profiler.report()
+    print(f"🚀 查询服务已启动: http://{args.host}:{args.port}")
+    uvicorn.run(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
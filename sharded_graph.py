@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+分片知识图谱
+实体按名称哈希或实体类型划分到多个工作进程，每个进程持有一个 MockKnowledgeGraph 分片；
+跨分片的关系在两端所在分片各存一份(只在起点分片计数)，邻居结果标注对端所在分片。
+search_entities / 统计并行分发到各分片再合并(scatter-gather)，邻居查询路由到实体所在分片。
+请求带编号经各分片的接收线程分发结果，多个线程的查询可同时在各分片排队，互不阻塞。
+
+用法(与单进程图谱对比结果一致性与查询吞吐):
+    python sharded_graph.py --entities 200000 --shards 4 --partition hash
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+# 添加项目路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from demo_basic import MockKnowledgeGraph, normalize_relation
+from graph_analytics import GraphAnalytics
+from tracing import get_tracer
+
+
+def _shard_worker(conn):
+    """分片进程: 循环处理 (编号, 方法, 参数) 请求，返回 (编号, 是否成功, 结果)"""
+    kg = MockKnowledgeGraph()
+    owned = {'relations': 0}
+
+    def build(entities, relations, owned_relations):
+        kg.build_from_data({'entities': entities, 'relations': relations})
+        owned['relations'] += owned_relations
+        return True
+
+    def stats():
+        result = kg.get_stats()
+        # 跨分片关系只在起点分片计数，汇总时不重复
+        result['stored_relations'] = result['total_relations']
+        result['total_relations'] = owned['relations']
+        return result
+
+    def search(query, limit):
+        return [dict(item, importance=kg.get_importance(item['entity']['name']))
+                for item in kg.search_entities(query, limit)]
+
+    def neighbors_many(names, limit):
+        # 邻居附带对端重要度(本分片的值，远端实体为近似值)，k 跳扩展后排序无需再逐个查询
+        return {name: [dict(neighbor, importance=kg.get_importance(neighbor['entity']))
+                       for neighbor in kg.get_neighbors(name, limit)]
+                for name in names}
+
+    def analyze():
+        # 本分片实体的边都在本地，但远端端点的度数不完整，PageRank 为近似值
+        GraphAnalytics(kg).compute()
+        return True
+
+    handlers = {
+        'build': build,
+        'analyze': analyze,
+        'stats': stats,
+        'search': search,
+        'link': lambda question: [entity['name'] for entity in kg.entities.values()
+                                  if entity.get('name') and entity['name'] in question],
+        'neighbors': lambda name, limit: kg.get_neighbors(name, limit),
+        'neighbors_many': neighbors_many,
+        'degree': kg.degree,
+        'importance': kg.get_importance,
+    }
+    while True:
+        try:
+            request_id, method, args = conn.recv()
+        except EOFError:
+            break
+        if method == 'close':
+            break
+        try:
+            conn.send((request_id, True, handlers[method](*args)))
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class _ShardChannel:
+    """到一个分片进程的连接
+
+    发送加锁，接收由专门线程按请求编号分发到 Future，
+    多个线程的请求可同时在途，不必等前一个请求返回。
+    """
+
+    def __init__(self, conn, name):
+        self.conn = conn
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read, name=name, daemon=True)
+        self._reader.start()
+
+    def submit(self, method, args):
+        """发送请求，返回结果为 (是否成功, 结果) 的 Future"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("分片进程连接已关闭")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self.conn.send((request_id, method, args))
+        return future
+
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id)
+            future.set_result((ok, result))
+        # 分片进程退出: 尚未返回的请求全部失败
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("分片进程连接已断开"))
+
+    def close(self):
+        """通知分片进程退出，等待接收线程结束"""
+        with self._lock:
+            if not self._closed:
+                try:
+                    self.conn.send((None, 'close', ()))
+                except (BrokenPipeError, OSError):
+                    pass
+        self._reader.join(timeout=5)
+        self.conn.close()
+
+
+class ShardedKnowledgeGraph:
+    """多进程分片图谱，查询接口与 MockKnowledgeGraph 一致
+
+    partition='hash' 按实体名的 CRC32 分片，无需全局目录；
+    partition='type' 同类型实体放在同一分片(分片数不宜超过类型数)，协调端保存 实体名 -> 分片 目录
+    以路由关系端点。名称首次出现即固定分片: 先作为关系端点出现的名称按哈希分片，
+    之后再添加的同名实体也放在该分片，与已写入的边在一起。
+    """
+
+    def __init__(self, num_shards=4, partition='hash', start_method=None):
+        if partition not in ('hash', 'type'):
+            raise ValueError(f"不支持的分片方式: {partition}")
+        self.num_shards = num_shards
+        self.partition = partition
+        context = multiprocessing.get_context(start_method)
+        self._channels = []
+        self._procs = []
+        for shard in range(num_shards):
+            parent, child = context.Pipe()
+            proc = context.Process(target=_shard_worker, args=(child,), daemon=True)
+            proc.start()
+            child.close()
+            self._channels.append(_ShardChannel(parent, f"shard-{shard}-reader"))
+            self._procs.append(proc)
+        self._type_shards = {}
+        self._directory = {}
+
+    def _hash_shard(self, name):
+        return zlib.crc32(name.encode('utf-8')) % self.num_shards
+
+    def shard_of(self, name):
+        """实体所在分片"""
+        if self.partition == 'type':
+            shard = self._directory.get(name)
+            if shard is not None:
+                return shard
+        return self._hash_shard(name)
+
+    def _place(self, name, entity_type=None):
+        """写入时确定名称所在分片并记入目录(按类型分片时)"""
+        if self.partition != 'type':
+            return self._hash_shard(name)
+        shard = self._directory.get(name)
+        if shard is None:
+            if entity_type is None:
+                shard = self._hash_shard(name)
+            else:
+                shard = self._type_shards.setdefault(entity_type, len(self._type_shards) % self.num_shards)
+            self._directory[name] = shard
+        return shard
+
+    def _scatter(self, requests):
+        """并行发送 {分片: (方法, 参数)} 并收集结果"""
+        futures = {shard: self._channels[shard].submit(*request) for shard, request in requests.items()}
+        results = {}
+        for shard, future in futures.items():
+            ok, result = future.result()
+            if not ok:
+                raise RuntimeError(f"分片 {shard} 执行 {requests[shard][0]} 失败: {result}")
+            results[shard] = result
+        return results
+
+    def _call(self, shard, method, *args):
+        return self._scatter({shard: (method, args)})[shard]
+
+    def _broadcast(self, method, *args):
+        return self._scatter({shard: (method, args) for shard in range(self.num_shards)})
+
+    @staticmethod
+    def _validate(processed_data):
+        """在协调进程中校验整批数据，返回 (实体, 统一为 [起点, 关系, 终点] 的关系)
+
+        校验失败时抛出 ValueError，任何分片都不会写入，也不会在分片目录中留下记录。
+        """
+        entities = processed_data.get('entities', [])
+        for entity in entities:
+            MockKnowledgeGraph._check_entity(entity)
+            if not entity.get('name'):
+                raise ValueError(f"实体缺少 name，无法确定分片: {entity!r}")
+        relations = [normalize_relation(relation) for relation in processed_data.get('relations', [])]
+        return entities, relations
+
+    def build_from_data(self, processed_data):
+        """校验整批数据后按分片拆分并行写入"""
+        entities, relations = self._validate(processed_data)
+        parts = [{'entities': [], 'relations': [], 'owned': 0} for _ in range(self.num_shards)]
+        for entity in entities:
+            parts[self._place(entity['name'], entity.get('type', 'unknown'))]['entities'].append(entity)
+        for relation in relations:
+            if len(relation) < 3:
+                continue
+            source, target = self._place(relation[0]), self._place(relation[2])
+            parts[source]['relations'].append(relation)
+            parts[source]['owned'] += 1
+            if target != source:
+                # 跨分片边在终点分片也存一份，使终点的邻居查询无需再访问其他分片
+                parts[target]['relations'].append(relation)
+        requests = {shard: ('build', (part['entities'], part['relations'], part['owned']))
+                    for shard, part in enumerate(parts) if part['entities'] or part['relations']}
+        if requests:
+            self._scatter(requests)
+        return True
+
+    def compute_analytics(self):
+        """各分片并行计算节点重要度(用于搜索同分排序与邻居排序)"""
+        self._broadcast('analyze')
+
+    def add_entity(self, entity):
+        self.build_from_data({'entities': [entity]})
+
+    def add_relation(self, relation):
+        self.build_from_data({'relations': [relation]})
+
+    def search_entities(self, query, limit=5):
+        """各分片返回本地前 limit 个结果，合并后取全局前 limit 个"""
+        with get_tracer().span("shard_search"):
+            results = []
+            for shard_results in self._broadcast('search', query, limit).values():
+                results.extend(shard_results)
+        results.sort(key=lambda x: (x['score'], x['importance']), reverse=True)
+        return [{'entity': item['entity'], 'score': item['score']} for item in results[:limit]]
+
+    def link_entities(self, question):
+        """各分片查找问题中出现的实体名，合并后按名称长度降序"""
+        names = set()
+        for shard_names in self._broadcast('link', question).values():
+            names.update(shard_names)
+        return sorted(names, key=len, reverse=True)
+
+    def _annotate(self, neighbors):
+        for neighbor in neighbors:
+            neighbor['shard'] = self.shard_of(neighbor['entity'])
+        return neighbors
+
+    def get_neighbors(self, entity_name, limit=None):
+        """路由到实体所在分片；邻居带 shard 字段指明对端所在分片"""
+        return self._annotate(self._call(self.shard_of(entity_name), 'neighbors', entity_name, limit))
+
+    def get_neighbors_many(self, entity_names, limit=None):
+        """批量邻居查询: 按分片分组后每个分片一次请求，limit 在分片内截断
+
+        邻居另带 importance 字段(对端重要度)，k 跳扩展每跳只需一轮请求。
+        """
+        groups = {}
+        for name in dict.fromkeys(entity_names):
+            groups.setdefault(self.shard_of(name), []).append(name)
+        merged = {}
+        for result in self._scatter({shard: ('neighbors_many', (names, limit))
+                                     for shard, names in groups.items()}).values():
+            merged.update({name: self._annotate(neighbors) for name, neighbors in result.items()})
+        return merged
+
+    def iter_neighbors(self, entity_name):
+        yield from self.get_neighbors(entity_name)
+
+    def degree(self, entity_name):
+        return self._call(self.shard_of(entity_name), 'degree', entity_name)
+
+    def get_importance(self, entity_name):
+        return self._call(self.shard_of(entity_name), 'importance', entity_name)
+
+    def get_stats(self):
+        """汇总各分片统计，附带各分片实体数以观察负载是否均衡"""
+        per_shard = self._broadcast('stats')
+        stats = {'total_entities': 0, 'total_relations': 0, 'entity_types': {}, 'shards': []}
+        for shard in sorted(per_shard):
+            shard_stats = per_shard[shard]
+            stats['total_entities'] += shard_stats['total_entities']
+            stats['total_relations'] += shard_stats['total_relations']
+            for entity_type, count in shard_stats['entity_types'].items():
+                stats['entity_types'][entity_type] = stats['entity_types'].get(entity_type, 0) + count
+            stats['shards'].append({'entities': shard_stats['total_entities'],
+                                    'relations': shard_stats['stored_relations']})
+        return stats
+
+    def close(self):
+        for channel in self._channels:
+            channel.close()
+        for proc in self._procs:
+            proc.join(timeout=5)
+        self._channels, self._procs = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _throughput(search, queries, clients):
+    """clients 个线程并发执行全部查询，返回每秒查询数"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(lambda q: search(q, 5), queries))
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    from benchmark import SyntheticAgriCorpus
+
+    parser = argparse.ArgumentParser(description="分片图谱 vs 单进程图谱")
+    parser.add_argument("--entities", type=int, default=100000, help="合成实体数")
+    parser.add_argument("--shards", type=int, default=max(2, min(4, os.cpu_count() or 2)), help="分片(进程)数")
+    parser.add_argument("--partition", choices=["hash", "type"], default="hash", help="分片方式")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数")
+    args = parser.parse_args()
+
+    corpus = SyntheticAgriCorpus(args.entities)
+    single = MockKnowledgeGraph()
+    sharded = ShardedKnowledgeGraph(args.shards, args.partition)
+    try:
+        start = time.perf_counter()
+        for chunk in corpus.processed_chunks():
+            single.build_from_data(chunk)
+        single_build = time.perf_counter() - start
+        start = time.perf_counter()
+        for chunk in corpus.processed_chunks():
+            sharded.build_from_data(chunk)
+        sharded_build = time.perf_counter() - start
+
+        stats = sharded.get_stats()
+        print(f"🚀 {stats['total_entities']} 实体 / {stats['total_relations']} 关系, "
+              f"{args.shards} 个分片({args.partition}): " + ", ".join(str(s['entities']) for s in stats['shards']))
+        print(f"   构建: 单进程 {single_build:.2f} s, 分片 {sharded_build:.2f} s")
+
+        # 一致性: 合并后的得分序列与单进程一致，邻居集合一致
+        terms = [corpus.name(t, i) for t in corpus.counts for i in range(3)] + ['病', '虫', 'disease']
+        mismatches = 0
+        for term in terms:
+            expected = [r['score'] for r in single.search_entities(term, 10)]
+            mismatches += expected != [r['score'] for r in sharded.search_entities(term, 10)]
+            expected = sorted((n['entity'], n['relation'], n['direction']) for n in single.get_neighbors(term))
+            actual = sorted((n['entity'], n['relation'], n['direction']) for n in sharded.get_neighbors(term))
+            mismatches += expected != actual
+        assert stats['total_relations'] == len(single.relations)
+        print(f"   一致性检查: {len(terms) * 2} 项, 不一致 {mismatches}")
+
+        queries = [terms[i % len(terms)] for i in range(args.queries)]
+        single_qps = _throughput(single.search_entities, queries, args.clients)
+        sharded_qps = _throughput(sharded.search_entities, queries, args.clients)
+        print(f"   search_entities 吞吐({args.clients} 并发): 单进程 {single_qps:.1f} qps, "
+              f"分片 {sharded_qps:.1f} qps ({sharded_qps / single_qps:.1f}x)")
+    finally:
+        sharded.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""问答结果缓存测试"""
+from itertools import chain, repeat
+
+import answer_cache
+from answer_cache import AnswerCache, cached_answer, normalize_question
+
+# 以关键词出现与否作为简易问题向量
+_KEYWORDS = ['稻瘟病', '纹枯病', '防治', '小麦']
+
+
+def _encode(text):
+    return [1.0 if word in text else 0.0 for word in _KEYWORDS]
+
+
+def test_normalize_question():
+    assert normalize_question(" 如何防治 稻瘟病？ ") == normalize_question("如何防治稻瘟病?")
+
+
+def test_exact_and_semantic_hits():
+    cache = AnswerCache(encode=_encode, semantic_threshold=0.99)
+    cache.put("如何防治稻瘟病？", {'answer': 'A'}, version=1)
+    assert cache.get("如何防治稻瘟病", version=1) == ({'answer': 'A'}, 'exact')
+    assert cache.get("稻瘟病怎么防治", version=1) == ({'answer': 'A'}, 'semantic')
+    assert cache.get("如何防治纹枯病", version=1) == (None, None)
+    assert cache.stats()['semantic_hits'] == 1
+
+
+def test_semantic_lookup_without_numpy(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'np', None)
+    cache = AnswerCache(encode=_encode, semantic_threshold=0.99)
+    cache.put("如何防治稻瘟病？", {'answer': 'A'})
+    cache.put("如何防治纹枯病？", {'answer': 'B'})
+    assert cache.get("纹枯病怎么防治") == ({'answer': 'B'}, 'semantic')
+
+
+def test_semantic_index_tracks_new_and_evicted_entries():
+    cache = AnswerCache(max_entries=1, encode=_encode, semantic_threshold=0.99)
+    cache.put("如何防治稻瘟病？", {'answer': 'A'})
+    assert cache.get("稻瘟病怎么防治")[1] == 'semantic'
+    # 新条目写入后索引重建；被淘汰的旧条目不再命中
+    cache.put("小麦纹枯病", {'answer': 'B'})
+    assert cache.get("稻瘟病怎么防治") == (None, None)
+    assert cache.get("纹枯病 小麦") == ({'answer': 'B'}, 'semantic')
+
+
+def test_version_change_clears_and_stale_put_is_dropped():
+    cache = AnswerCache()
+    cache.put("q", {'answer': 'old'}, version=1)
+    assert cache.get("q", version=2) == (None, None)
+    # 版本 1 下算出的答案在缓存切换到版本 2 后写入，应被丢弃
+    assert not cache.put("q", {'answer': 'old'}, version=1)
+    assert cache.get("q", version=2) == (None, None)
+
+
+def test_cached_answer_skips_put_when_graph_changes_mid_answer():
+    cache = AnswerCache()
+    versions = chain([1], repeat(2))
+
+    def answer_fn(question):
+        return {'answer': question}
+
+    answer = cached_answer(answer_fn, cache, version_fn=lambda: next(versions))
+    assert answer("q") == {'answer': 'q'}
+    assert cache.stats()['entries'] == 0
+    assert answer("q") == {'answer': 'q'}
+    assert answer("q")['cache_hit'] == 'exact'
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""批量问答引擎测试"""
+import json
+from argparse import Namespace
+
+from batch_qa import BatchQAEngine, RateLimiter, load_completed
+from demo_v2 import demo_llm_questions, run_batch_qa
+
+
+class _FakeSystem:
+    def __init__(self, fail=()):
+        self.components_status = {'chatgpt': True, 'embedding': False}
+        self.calls = []
+        self.fail = set(fail)
+
+    def answer_question(self, question, use_kg_context=True):
+        self.calls.append(question)
+        if question in self.fail:
+            return {'error': 'LLM超时'}
+        return {'answer': f"答: {question}"}
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_engine_resume_skips_only_successful(tmp_path):
+    output = str(tmp_path / 'answers.jsonl')
+    system = _FakeSystem(fail={'q2'})
+    engine = BatchQAEngine(lambda q, retrieved: system.answer_question(q), concurrency=2, batch_size=2)
+    summary = engine.run(['q1', 'q2', 'q3'], output)
+    assert (summary['answered'], summary['errors'], summary['skipped']) == (2, 1, 0)
+    assert load_completed(output) == {(0, 'q1'), (2, 'q3')}
+
+    system.fail.clear()
+    summary = engine.run(['q1', 'q2', 'q3'], output)
+    assert (summary['answered'], summary['skipped']) == (1, 2)
+    assert sorted(system.calls) == ['q1', 'q2', 'q2', 'q3']
+    assert sum(1 for record in _read(output) if 'error' not in record) == 3
+
+
+def test_engine_passes_batch_retrieval(tmp_path):
+    seen = []
+    engine = BatchQAEngine(lambda q, retrieved: seen.append((q, retrieved)) or {'answer': ''},
+                           retrieve_batch=lambda qs: [{'entities': [{'name': q}]} for q in qs],
+                           batch_size=2)
+    engine.run(['a', 'b', 'c'], str(tmp_path / 'answers.jsonl'), resume=False)
+    assert sorted(seen, key=lambda x: x[0]) == [(q, {'entities': [{'name': q}]}) for q in 'abc']
+
+
+def test_rate_limiter_unlimited():
+    assert RateLimiter(0).acquire() == 0.0
+
+
+def test_single_question_always_answered(capsys):
+    system = _FakeSystem()
+    demo_llm_questions(system, ['如何防治稻瘟病？'])
+    demo_llm_questions(system, ['如何防治稻瘟病？'])
+    assert system.calls == ['如何防治稻瘟病？'] * 2
+    assert capsys.readouterr().out.count('💡 答案') == 2
+
+
+def test_batch_defaults_to_system_backend(tmp_path, monkeypatch):
+    # 即使配置了 OpenAI 兼容接口，默认也经系统 answer_question(缓存与埋点)回答
+    monkeypatch.setenv('OPENAI_BASE_URL', 'http://127.0.0.1:9/v1')
+    system = _FakeSystem()
+    args = Namespace(qa_backend='system', llm_config='', qa_concurrency=2, qa_rate_limit=0.0,
+                     qa_batch_size=8, answers_out=str(tmp_path / 'answers.jsonl'), no_resume=False,
+                     snapshot_dir='')
+    run_batch_qa(system, ['q1', 'q2'], [], args)
+    assert sorted(system.calls) == ['q1', 'q2']
+    assert {record['answer'] for record in _read(args.answers_out)} == {'答: q1', '答: q2'}
+
+
+def test_resume_rewrites_output_without_duplicate_ids(tmp_path):
+    output = str(tmp_path / 'answers.jsonl')
+    system = _FakeSystem(fail={'q2'})
+    engine = BatchQAEngine(lambda q, retrieved: system.answer_question(q), concurrency=2, batch_size=2)
+    engine.run(['q1', 'q2', 'q3'], output)
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write('{"id": 0, "question": "q1", "answer": "重复"}\n{"id": 2, "quest')
+
+    system.fail.clear()
+    engine.run(['q1', 'q2', 'q3'], output)
+    records = _read(output)
+    assert sorted(record['id'] for record in records) == [0, 1, 2]
+    assert all('error' not in record for record in records)
+    # 保留第一条成功记录，后追加的重复行被去掉
+    assert {record['id']: record['answer'] for record in records}[0] == '答: q1'
+
+
+def test_answer_fn_returning_none_is_recorded_as_error(tmp_path):
+    output = str(tmp_path / 'answers.jsonl')
+    engine = BatchQAEngine(lambda q, retrieved: None if q == 'q1' else {'answer': q})
+    summary = engine.run(['q1', 'q2'], output, resume=False)
+    assert (summary['answered'], summary['errors']) == (1, 1)
+    assert 'NoneType' in {record['id']: record for record in _read(output)}[0]['error']
+
+
+def test_retrieval_failure_marks_only_that_batch(tmp_path):
+    output = str(tmp_path / 'answers.jsonl')
+
+    def retrieve(questions):
+        if 'b' in questions:
+            raise RuntimeError("图谱未加载")
+        return [{'entities': []} for _ in questions]
+
+    seen = []
+    engine = BatchQAEngine(lambda q, retrieved: seen.append(q) or {'answer': q}, retrieve_batch=retrieve,
+                           batch_size=2)
+    summary = engine.run(['a', 'b', 'c', 'd', 'e'], output)
+    assert (summary['answered'], summary['errors']) == (3, 2)
+    assert sorted(seen) == ['c', 'd', 'e']
+    failed = sorted(record['question'] for record in _read(output) if 'error' in record)
+    assert failed == ['a', 'b']
+    assert load_completed(output) == {(2, 'c'), (3, 'd'), (4, 'e')}
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""微基准测试脚本自检"""
+from benchmark import SyntheticAgriCorpus, run_scale
+
+
+def test_corpus_is_deterministic():
+    a = SyntheticAgriCorpus(200, seed=7)
+    b = SyntheticAgriCorpus(200, seed=7)
+    assert list(a.relations()) == list(b.relations())
+    assert list(a.questions(10)) == list(b.questions(10))
+
+
+def test_run_scale_sample_counts():
+    results = run_scale(200, samples=50)
+    # samples 不是 4 的倍数时也应执行完整的查询次数
+    assert results['search_entities']['count'] == 50
+    assert results['get_neighbors']['count'] == 50
+    build = results['build_from_data']
+    assert build['entities_per_s'] > 0 and build['relations_per_s'] > 0
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""查询向量微批调度测试"""
+import threading
+
+import pytest
+
+from embedding_batcher import EmbeddingBatcher, install_batcher
+
+
+def test_concurrent_requests_are_batched_and_deduplicated():
+    calls = []
+
+    def encode_batch(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(encode_batch, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(text) for text in ['稻瘟病', '水稻', '稻瘟病']]
+    assert [f.result(timeout=2) for f in futures] == [[3.0], [2.0], [3.0]]
+    batcher.close()
+    assert calls == [['稻瘟病', '水稻']]
+    assert batcher.avg_batch_size == 3
+
+
+def test_short_result_fails_batch_and_keeps_loop_alive():
+    short = threading.Event()
+    short.set()
+
+    def encode_batch(texts):
+        if short.is_set():
+            short.clear()
+            return [[0.0]] * (len(texts) - 1)
+        return [[1.0]] * len(texts)
+
+    batcher = EmbeddingBatcher(encode_batch, max_batch_size=8, max_wait_ms=20)
+    futures = [batcher.submit(text) for text in ['a', 'b']]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=2)
+    # 调度线程仍在运行，后续请求正常返回
+    assert batcher.encode('c', timeout=2) == [1.0]
+    batcher.close()
+
+
+def test_encoder_exception_propagates():
+    def encode_batch(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = EmbeddingBatcher(encode_batch, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.encode('a', timeout=2)
+    batcher.close()
+
+
+def test_install_batcher_only_batches_single_strings():
+    class Manager:
+        def __init__(self):
+            self.calls = []
+
+        def encode(self, texts, **kwargs):
+            self.calls.append(texts)
+            if isinstance(texts, str):
+                return [0.0]
+            return [[float(i)] for i, _ in enumerate(texts)]
+
+    manager = Manager()
+    batcher = install_batcher(manager, "encode", max_batch_size=4, max_wait_ms=1)
+    assert manager.encode('稻瘟病') == [0.0]
+    assert manager.encode(['a', 'b']) == [[0.0], [1.0]]
+    batcher.close()
+    assert manager.calls == [['稻瘟病'], ['a', 'b']]
+    assert batcher.batches == 1
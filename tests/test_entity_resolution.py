@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""实体消解测试"""
+from itertools import permutations
+
+import pytest
+
+from entity_resolution import EntityResolver
+
+
+@pytest.mark.parametrize("names", [['赤霉病', '霜霉病', '霉病'], ['小麦锈病', '玉米锈病', '锈病']])
+def test_distinct_diseases_not_merged_in_any_order(names):
+    for order in permutations(names):
+        resolver = EntityResolver()
+        resolved = resolver.resolve_batch([(name, 'disease') for name in order])
+        assert resolved == list(order), order
+        assert resolver.aliases == {}
+
+
+def test_stem_and_spacing_variants_merge():
+    resolver = EntityResolver()
+    resolved = resolver.resolve_batch([('稻瘟病', 'disease'), ('稻瘟', 'disease'), ('　稻瘟病 ', 'disease')])
+    assert resolved == ['稻瘟病', '稻瘟病', '稻瘟病']
+    assert resolver.aliases == {('disease', '稻瘟'): '稻瘟病'}
+
+
+def test_crop_qualified_names_stay_separate():
+    resolver = EntityResolver()
+    resolved = resolver.resolve_batch([('稻瘟病', 'disease'), ('水稻稻瘟病', 'disease'), ('小麦稻瘟病', 'disease')])
+    assert resolved == ['稻瘟病', '水稻稻瘟病', '小麦稻瘟病']
+
+
+def test_contained_names_merge_with_embedding_agreement():
+    vectors = {'锈病': [1.0, 0.0], '小麦锈病': [0.99, 0.1], '玉米锈病': [0.0, 1.0]}
+    resolver = EntityResolver(encode=lambda texts: [vectors[t] for t in texts], embedding_threshold=0.9)
+    resolved = resolver.resolve_batch([(name, 'disease') for name in ['锈病', '小麦锈病', '玉米锈病']])
+    assert resolved == ['锈病', '锈病', '玉米锈病']
+
+
+def test_aliases_keyed_by_type():
+    resolver = EntityResolver()
+    resolver.resolve_batch([('稻瘟病', 'disease'), ('稻瘟', 'disease'), ('稻瘟', 'pest')])
+    assert resolver.canonical_name('稻瘟', 'disease') == '稻瘟病'
+    assert resolver.canonical_name('稻瘟', 'pest') == '稻瘟'
+    # 无类型时两种映射冲突，保持原名
+    assert resolver.canonical_name('稻瘟') == '稻瘟'
+
+
+def test_resolve_data_rewrites_relations():
+    resolver = EntityResolver()
+    resolver.resolve_data({'entities': [{'name': '稻瘟病', 'type': 'disease'}], 'relations': []})
+    data = resolver.resolve_data({
+        'entities': [{'name': '稻瘟', 'type': 'disease'}, {'name': '三环唑', 'type': 'pesticide'}],
+        'relations': [['三环唑', 'prevents', '稻瘟'], ['三环唑', 'prevents', '稻瘟病']],
+    })
+    assert [e['name'] for e in data['entities']] == ['三环唑']
+    assert data['relations'] == [('三环唑', 'prevents', '稻瘟病')]
+    assert data['entity_resolution']['relations_removed'] == 1
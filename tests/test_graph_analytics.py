@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""图谱中心性预计算测试"""
+from demo_basic import MockKnowledgeGraph
+from graph_analytics import GraphAnalytics
+
+
+def _star_graph():
+    """水稻连接多种病害，其中稻瘟病还与多种农药相连(重要度更高)"""
+    kg = MockKnowledgeGraph()
+    kg.build_from_data({
+        'entities': [{'id': f"e{i}", 'name': name, 'type': 'x'}
+                     for i, name in enumerate(['水稻', '稻瘟病', '纹枯病', '三环唑', '稻瘟灵'])],
+        'relations': [
+            ['水稻', 'infected_by', '纹枯病'],
+            ['水稻', 'infected_by', '稻瘟病'],
+            ['三环唑', 'prevents', '稻瘟病'],
+            ['稻瘟灵', 'prevents', '稻瘟病'],
+        ],
+    })
+    return kg
+
+
+def test_neighbors_sorted_by_importance():
+    kg = _star_graph()
+    GraphAnalytics(kg).compute()
+    assert [n['entity'] for n in kg.get_neighbors('水稻', limit=1)] == ['稻瘟病']
+
+
+def test_relations_added_after_metrics_keep_order():
+    kg = _star_graph()
+    GraphAnalytics(kg).compute()
+    kg.add_relation(['稻瘟病', 'infected_by_alias', '水稻'])
+    kg.add_relation(['水稻', 'grows_in', '新地块'])
+    neighbors = [n['entity'] for n in kg.get_neighbors('水稻')]
+    importance = [kg.get_importance(name) for name in neighbors]
+    assert importance == sorted(importance, reverse=True)
+    assert neighbors[-1] == '新地块'
+
+
+def test_stale_tracks_entities_and_relations():
+    kg = _star_graph()
+    analytics = GraphAnalytics(kg)
+    assert analytics.stale
+    analytics.compute()
+    assert not analytics.stale
+    kg.add_entity({'id': 'e9', 'name': '孤立节点', 'type': 'x'})
+    assert analytics.stale
+    metrics = analytics.refresh()
+    assert '孤立节点' in metrics and not analytics.stale
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    kg = _star_graph()
+    GraphAnalytics(kg).compute()
+    path = tmp_path / 'metrics.json'
+    GraphAnalytics(kg).save(str(path))
+
+    other = _star_graph()
+    analytics = GraphAnalytics(other)
+    analytics.load(str(path))
+    assert not analytics.stale
+    assert other.get_importance('稻瘟病') == kg.get_importance('稻瘟病')
+
+
+def test_rebind_warm_starts_on_copy():
+    kg = _star_graph()
+    analytics = GraphAnalytics(kg, max_iter=500)
+    analytics.compute()
+
+    copy = kg.copy()
+    copy.add_relation(['稻瘟病', 'occurs_in', '稻田'])
+    metrics = analytics.rebind(copy).refresh()
+    assert analytics.kg is copy and '稻田' in metrics and not analytics.stale
+    # 以上一版 PageRank 为初值，比在副本上从头计算收敛更快
+    cold = GraphAnalytics(copy, max_iter=500)
+    cold.compute()
+    assert analytics.iterations < cold.iterations
+    assert abs(metrics['稻瘟病']['pagerank'] - cold.pagerank['稻瘟病']) < 1e-5
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""只读图谱快照测试"""
+import json
+import os
+
+import pytest
+
+from demo_basic import MockKnowledgeGraph
+from graph_analytics import GraphAnalytics
+from graph_snapshot import GraphSnapshot, snapshot_is_stale, write_snapshot
+
+
+@pytest.fixture
+def kg():
+    kg = MockKnowledgeGraph()
+    kg.build_from_data({
+        'entities': [
+            {'id': 'crop_001', 'name': '水稻', 'type': 'crop', 'description': '作物: 水稻'},
+            {'id': 'disease_003', 'name': 'Rice Blast', 'type': 'disease', 'description': '病害: Rice Blast'},
+            {'id': 'pesticide_007', 'name': '三环唑', 'type': 'pesticide', 'description': '农药: 三环唑'},
+        ],
+        'relations': [
+            ['水稻', 'infected_by', 'Rice Blast'],
+            ['三环唑', 'prevents', 'Rice Blast'],
+        ],
+    })
+    GraphAnalytics(kg).compute()
+    return kg
+
+
+@pytest.fixture
+def snapshot(kg, tmp_path):
+    write_snapshot(kg, str(tmp_path / 'snap'))
+    snapshot = GraphSnapshot(str(tmp_path / 'snap'))
+    yield snapshot
+    snapshot.close()
+
+
+def test_search_is_case_insensitive_like_mock_graph(kg, snapshot):
+    for query in ['rice', 'BLAST', 'Rice Blast', '稻']:
+        expected = [(r['entity']['id'], r['score']) for r in kg.search_entities(query)]
+        actual = [(r['entity']['id'], r['score']) for r in snapshot.search_entities(query)]
+        assert actual == expected, query
+
+
+def test_original_entity_ids_are_kept(snapshot):
+    assert snapshot.search_entities('三环唑')[0]['entity']['id'] == 'pesticide_007'
+    assert snapshot.search_entities('rice blast')[0]['entity']['id'] == 'disease_003'
+
+
+def test_neighbors_match_mock_graph(kg, snapshot):
+    assert snapshot.get_neighbors('Rice Blast') == kg.get_neighbors('Rice Blast')
+    assert snapshot.get_importance('水稻') == pytest.approx(kg.get_importance('水稻'))
+
+
+def test_snapshot_goes_stale_when_sources_change(kg, tmp_path):
+    source = tmp_path / 'processed.json'
+    source.write_text(json.dumps({'entities': []}), encoding='utf-8')
+    directory = str(tmp_path / 'snap')
+    assert snapshot_is_stale(directory, [str(source)])
+    write_snapshot(kg, directory, source_paths=[str(source)])
+    assert not snapshot_is_stale(directory, [str(source)])
+
+    source.write_text(json.dumps({'entities': [{'id': 'x'}]}), encoding='utf-8')
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert snapshot_is_stale(directory, [str(source)])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""混合检索测试"""
+import logging
+
+import pytest
+
+from hybrid_retrieval import HybridRetriever
+from llm_streaming import StreamingAnswerer, graph_retrieve
+
+
+def _entity(name, entity_type='disease'):
+    return {'id': name, 'name': name, 'type': entity_type}
+
+
+def _keyword(query, limit):
+    # 稻瘟病在同一路中重复出现，只计最高排名
+    return [{'entity': _entity(name), 'score': score}
+            for name, score in [('稻瘟病', 15), ('纹枯病', 10), ('稻瘟病', 8), ('白粉病', 5)]][:limit]
+
+
+def _vector(query, k):
+    return [{'name': '纹枯病', 'type': 'disease', 'similarity': 0.9},
+            {'name': '赤霉病', 'type': 'disease', 'similarity': 0.5}][:k]
+
+
+@pytest.fixture
+def make_retriever():
+    retrievers = []
+
+    def make(*args, **kwargs):
+        retriever = HybridRetriever(*args, **kwargs)
+        retrievers.append(retriever)
+        return retriever
+    yield make
+    for retriever in retrievers:
+        retriever.close()
+
+
+def test_rrf_orders_by_reciprocal_rank(make_retriever):
+    results = make_retriever(_keyword, _vector).search('稻', k=5)
+    assert [r['name'] for r in results] == ['纹枯病', '稻瘟病', '赤霉病', '白粉病']
+    top = results[0]
+    assert top['score'] == pytest.approx(0.5 / 62 + 0.5 / 61)
+    assert top['sources'] == {'keyword': {'rank': 2, 'score': 10.0}, 'vector': {'rank': 1, 'score': 0.9}}
+    # 重复出现的稻瘟病只按第 1 名计分
+    assert results[1]['sources'] == {'keyword': {'rank': 1, 'score': 15.0}}
+    assert results[1]['score'] == pytest.approx(0.5 / 61)
+
+
+def test_weighted_fusion_uses_normalized_scores(make_retriever):
+    retriever = make_retriever(_keyword, _vector, method='weighted', weights={'keyword': 0.4, 'vector': 0.6})
+    results = retriever.search('稻', k=3)
+    # 关键词分数 15/10/5 归一化为 1/0.5/0，向量 0.9/0.5 归一化为 1/0
+    assert [r['name'] for r in results] == ['纹枯病', '稻瘟病', '白粉病']
+    assert results[0]['score'] == pytest.approx(0.4 * 0.5 + 0.6 * 1.0)
+    assert results[1]['score'] == pytest.approx(0.4 * 1.0)
+
+
+def test_failing_source_falls_back_to_other(make_retriever, caplog):
+    def broken(query, k):
+        raise RuntimeError("向量模型未加载")
+
+    with caplog.at_level(logging.WARNING, logger='hybrid_retrieval'):
+        results = make_retriever(_keyword, broken).search('稻', k=5)
+    assert [r['name'] for r in results] == ['稻瘟病', '纹枯病', '白粉病']
+    assert all(set(r['sources']) == {'keyword'} for r in results)
+    assert 'vector 检索失败' in caplog.text
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError):
+        HybridRetriever(_keyword, _vector, method='max')
+
+
+def test_streamer_close_shuts_down_retriever_pool():
+    retriever = HybridRetriever(_keyword, _vector)
+    streamer = StreamingAnswerer(graph_retrieve(retriever, context_builder=None))
+    streamer.close()
+    with pytest.raises(RuntimeError):
+        retriever.search('稻')
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""批量图像导入测试"""
+import shutil
+
+import pytest
+
+from demo_basic import MockKnowledgeGraph
+from image_ingest import EntityIndex, ImageIngestPipeline, PerceptualHashCache, relation_triple, scan_images
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _write_images(directory):
+    directory.mkdir()
+    gradient = Image.new('RGB', (64, 48))
+    gradient.putdata([(x * 4, y * 5, 0) for y in range(48) for x in range(64)])
+    gradient.save(directory / 'a.png')
+    # 与 a.png 内容相同的近重复图像
+    shutil.copy(directory / 'a.png', directory / 'a_copy.png')
+    checker = Image.new('RGB', (64, 48))
+    checker.putdata([(255, 255, 255) if (x // 8 + y // 8) % 2 else (0, 0, 0) for y in range(48) for x in range(64)])
+    checker.save(directory / 'b.png')
+    return scan_images(str(directory))
+
+
+def _describer(calls):
+    def describe(batch):
+        calls.append(len(batch))
+        return [{'description': '水稻叶片病斑',
+                 'entities': [{'name': '稻瘟病', 'type': 'disease'}, {'name': '叶瘟', 'type': 'disease'}],
+                 'relations': [{'source': '水稻', 'type': 'infected_by', 'target': '稻瘟病'},
+                               {'source': '水稻', 'type': 'infected_by'},
+                               ('叶瘟', 'is_a', '稻瘟病')]}
+                for _ in batch]
+    return describe
+
+
+def test_relation_triple():
+    assert relation_triple({'from': '水稻', 'relation': 'uses', 'to': '尿素'}) == ('水稻', 'uses', '尿素')
+    assert relation_triple(['水稻', 'infected_by', '稻瘟病', {'weight': 1}]) == ('水稻', 'infected_by', '稻瘟病')
+    assert relation_triple({'source': '水稻', 'type': 'uses'}) is None
+    assert relation_triple(['水稻']) is None
+
+
+def test_entity_index_prefers_type_then_unique_name():
+    index = EntityIndex([{'id': 'disease_003', 'name': '稻瘟病', 'type': 'disease'},
+                         {'id': 'crop_001', 'name': '水稻', 'type': 'crop'},
+                         {'id': 'pest_001', 'name': '水稻', 'type': 'pest'}])
+    assert index.lookup('稻瘟病', 'disease') == 'disease_003'
+    assert index.lookup('稻瘟病', 'unknown') == 'disease_003'
+    assert index.lookup('水稻', 'crop') == 'crop_001'
+    # 同名不同类型且类型不符时无法确定
+    assert index.lookup('水稻', 'unknown') is None
+
+
+def test_pipeline_reuses_existing_entities_and_normalizes_relations(tmp_path):
+    paths = _write_images(tmp_path / 'images')
+    calls = []
+    cache = PerceptualHashCache(str(tmp_path / 'cache.jsonl'))
+    pipeline = ImageIngestPipeline(_describer(calls), cache, workers=1, batch_size=8)
+    existing = [{'id': 'disease_003', 'name': '稻瘟病', 'type': 'disease'}]
+    processed, stats = pipeline.run(paths, root=str(tmp_path / 'images'), existing_entities=existing)
+    cache.close()
+
+    assert stats['errors'] == 0 and stats['duplicates'] == 1
+    assert calls == [2]
+    ids = {entity['id'] for entity in processed['entities']}
+    # 已有的稻瘟病不再生成 disease:稻瘟病 节点，新实体仍按 类型:名称 生成
+    assert ids == {'image:a.png', 'image:a_copy.png', 'image:b.png', 'disease:叶瘟'}
+    assert ['水稻', 'infected_by', '稻瘟病'] in processed['relations']
+    assert ['叶瘟', 'is_a', '稻瘟病'] in processed['relations']
+    assert ['a.png', 'depicts', '稻瘟病'] in processed['relations']
+    assert all(isinstance(r, list) and len(r) == 3 for r in processed['relations'])
+
+    kg = MockKnowledgeGraph()
+    kg.build_from_data({'entities': existing, 'relations': []})
+    kg.build_from_data(processed)
+    assert len(kg.entities) == 5
+    assert {n['entity'] for n in kg.get_neighbors('稻瘟病')} == {'水稻', '叶瘟', 'a.png', 'a_copy.png', 'b.png'}
+
+    # 再次导入时文件未变，全部命中缓存
+    cache = PerceptualHashCache(str(tmp_path / 'cache.jsonl'))
+    again, stats = ImageIngestPipeline(_describer(calls), cache, workers=1).run(
+        paths, root=str(tmp_path / 'images'), existing_entities=existing)
+    cache.close()
+    assert stats['file_cache_hits'] == 3 and calls == [2]
+    assert again == processed
+
+
+def test_descriptions_batch_embedded_and_cached(tmp_path):
+    paths = _write_images(tmp_path / 'images')
+    root = str(tmp_path / 'images')
+    cache_path = str(tmp_path / 'cache.jsonl')
+    calls = []
+    cache = PerceptualHashCache(cache_path)
+    ImageIngestPipeline(_describer(calls), cache, workers=1).run(paths, root=root)
+    cache.close()
+
+    encoded = []
+
+    def encode_batch(texts):
+        encoded.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    # 此前缓存的描述结果没有向量，命中缓存时补编码，两张不同的图像在同一批中编码
+    cache = PerceptualHashCache(cache_path)
+    processed, stats = ImageIngestPipeline(_describer(calls), cache, workers=1,
+                                           encode_batch=encode_batch).run(paths, root=root)
+    cache.close()
+    assert stats['file_cache_hits'] == 3 and stats['embedded'] == 2 and calls == [2]
+    assert encoded == [['水稻叶片病斑', '水稻叶片病斑']]
+    images = [entity for entity in processed['entities'] if entity['type'] == 'image']
+    assert len(images) == 3 and all(entity['embedding'] == [6.0, 1.0] for entity in images)
+
+    # 向量随缓存保存，再次导入不重复编码
+    cache = PerceptualHashCache(cache_path)
+    again, stats = ImageIngestPipeline(_describer(calls), cache, workers=1,
+                                       encode_batch=encode_batch).run(paths, root=root)
+    cache.close()
+    assert stats['embedded'] == 0 and len(encoded) == 1 and again == processed
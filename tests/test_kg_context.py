@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""k 跳图谱上下文构建测试"""
+import pytest
+
+from demo_basic import MockKnowledgeGraph
+from demo_v2 import build_query_graph
+from kg_context import EntityLinker, KHopContextBuilder
+
+
+def _graph():
+    kg = MockKnowledgeGraph()
+    kg.build_from_data({
+        'entities': [
+            {'id': 'c1', 'name': '水稻', 'type': 'crop'},
+            {'id': 'd1', 'name': '稻瘟病', 'type': 'disease'},
+            {'id': 'p1', 'name': '三环唑', 'type': 'pesticide'},
+        ],
+        'relations': [
+            ['水稻', 'infected_by', '稻瘟病'],
+            ['三环唑', 'prevents', '稻瘟病'],
+        ],
+    })
+    return kg
+
+
+def test_dict_relations_are_indexed():
+    data = {
+        'entities': [{'id': 'c1', 'name': '水稻', 'type': 'crop'}, {'id': 'd1', 'name': '稻瘟病', 'type': 'disease'}],
+        'relations': [{'source': '水稻', 'type': 'infected_by', 'target': '稻瘟病', 'confidence': 0.9},
+                      {'from': '三环唑', 'relation': 'prevents', 'to': '稻瘟病'}],
+    }
+    kg = build_query_graph([data])
+    assert kg.relations == [['水稻', 'infected_by', '稻瘟病', {'confidence': 0.9}], ['三环唑', 'prevents', '稻瘟病']]
+    assert {n['entity'] for n in kg.get_neighbors('稻瘟病')} == {'水稻', '三环唑'}
+    with pytest.raises(ValueError):
+        kg.add_relation({'source': '水稻', 'type': 'uses'})
+    assert len(kg.relations) == 2
+
+
+def test_hop_decay_applied_once_per_hop():
+    builder = KHopContextBuilder(_graph(), hop_decay=0.5)
+    best, _ = builder.expand(['水稻'])
+    assert best['稻瘟病']['score'] == pytest.approx(0.9 * 0.5)
+    assert best['三环唑']['score'] == pytest.approx(0.9 * 0.5 * 1.0 * 0.5)
+
+
+def test_relation_weights_clamped_and_seeds_kept():
+    builder = KHopContextBuilder(_graph(), relation_weights={'infected_by': 5.0}, hop_decay=1.0)
+    assert builder.relation_weights['infected_by'] == 1.0
+    best, _ = builder.expand(['水稻', '稻瘟病'])
+    assert best['稻瘟病'] == {'score': 1.0, 'path': []}
+    assert best['水稻'] == {'score': 1.0, 'path': []}
+
+
+def test_link_entities_longest_first_and_refreshes():
+    kg = _graph()
+    builder = KHopContextBuilder(kg)
+    assert builder.link_entities('水稻稻瘟病怎么用三环唑') == ['稻瘟病', '三环唑', '水稻']
+    kg.add_entity({'id': 'd2', 'name': '水稻稻瘟病', 'type': 'disease'})
+    assert builder.link_entities('水稻稻瘟病怎么办')[0] == '水稻稻瘟病'
+
+
+def test_link_entities_refreshes_when_entity_replaced():
+    kg = _graph()
+    builder = KHopContextBuilder(kg)
+    assert builder.link_entities('三环唑怎么用') == ['三环唑']
+    # 替换同 id 实体，实体数不变
+    kg.add_entity({'id': 'p1', 'name': '井冈霉素', 'type': 'pesticide'})
+    assert builder.link_entities('三环唑还是井冈霉素') == ['井冈霉素']
+
+
+def test_entity_linker_batch():
+    linker = EntityLinker(['稻瘟', '稻瘟病', ''])
+    assert linker.link_batch(['稻瘟病', '玉米']) == [['稻瘟病', '稻瘟'], []]
+
+
+def test_build_respects_token_budget():
+    builder = KHopContextBuilder(_graph(), token_budget=12)
+    result = builder.build('三环唑', seeds=['三环唑'])
+    assert result['token_count'] <= 12
+    assert result['truncated']
+    assert result['context'].startswith('三环唑 -[prevents]-> 稻瘟病')
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""延迟加载系统包装测试(以替身系统模块代替 AgriMGraphragV2)"""
+import sys
+import types
+
+import pytest
+
+from demo_v2 import LazyAgriSystem, StartupProfiler
+from tracing import Tracer
+
+
+class _FakeSystem:
+    instances = 0
+
+    def __init__(self):
+        type(self).instances += 1
+        self.components_status = {'data_processing': False, 'embedding': False, 'neo4j': False, 'chatgpt': False}
+        self.initialized = []
+
+    def _init(self, name):
+        self.initialized.append(name)
+        self.components_status[name] = True
+
+    def initialize_data_processing(self):
+        self._init('data_processing')
+
+    def initialize_embedding(self):
+        self._init('embedding')
+
+    def initialize_neo4j(self):
+        self._init('neo4j')
+
+    def initialize_chatgpt(self):
+        self._init('chatgpt')
+
+    def process_agricultural_data(self, path, kind):
+        return {'entities': [{'id': 'd1', 'name': '稻瘟病'}], 'relations': []}
+
+    def answer_question(self, question, use_kg_context=True):
+        return {'answer': f"答:{question}", 'usage': {'total_tokens': 7}}
+
+
+@pytest.fixture
+def fake_module(monkeypatch):
+    _FakeSystem.instances = 0
+    module = types.ModuleType('src.core.agri_system_v2')
+    module.AgriMGraphragV2 = _FakeSystem
+    monkeypatch.setitem(sys.modules, 'src', types.ModuleType('src'))
+    monkeypatch.setitem(sys.modules, 'src.core', types.ModuleType('src.core'))
+    monkeypatch.setitem(sys.modules, 'src.core.agri_system_v2', module)
+    return module
+
+
+def test_system_created_on_first_attribute_access(fake_module):
+    profiler = StartupProfiler()
+    system = LazyAgriSystem(profiler=profiler, tracer=Tracer())
+    assert not system.loaded and _FakeSystem.instances == 0 and profiler.stages == []
+
+    assert system.components_status.get('embedding')
+    assert system.loaded and _FakeSystem.instances == 1
+    # 只初始化被访问的组件
+    assert system.system.initialized == ['embedding']
+    assert [name for name, _ in profiler.stages] == ["导入 AgriMGraphragV2", "创建系统实例", "初始化组件 embedding"]
+
+
+def test_ensure_and_method_access_build_required_components(fake_module):
+    system = LazyAgriSystem(tracer=Tracer())
+    system.ensure('neo4j')
+    assert system.system.initialized == ['neo4j']
+    system.answer_question("如何防治稻瘟病？")
+    # answer_question 依赖的其余组件在首次调用前初始化，已初始化的不重复
+    assert system.system.initialized == ['neo4j', 'embedding', 'chatgpt']
+    system.ensure('neo4j', 'chatgpt')
+    assert system.system.initialized == ['neo4j', 'embedding', 'chatgpt']
+
+
+def test_fallback_to_initialize_all_components(fake_module, capsys):
+    class _Monolithic(_FakeSystem):
+        initialize_neo4j = None
+
+        def initialize_all_components(self):
+            self.initialized.append('all')
+
+    fake_module.AgriMGraphragV2 = _Monolithic
+    system = LazyAgriSystem(tracer=Tracer())
+    system.ensure('neo4j')
+    system.ensure('embedding', 'chatgpt')
+    assert system.system.initialized == ['all']
+    assert 'initialize_neo4j' in capsys.readouterr().out
+
+
+def test_traced_methods_are_wrapped(fake_module):
+    tracer = Tracer(enabled=True)
+    system = LazyAgriSystem(tracer=tracer)
+    answer = system.answer_question
+    assert answer.__wrapped__ is not None
+    answer("水稻容易得什么病？")
+    system.process_agricultural_data("data.csv", "structured")
+    snapshot = tracer.snapshot()
+    assert snapshot['counters']['answer_question_calls'] == 1
+    assert snapshot['counters']['llm_tokens'] == 7
+    assert snapshot['counters']['entities'] == 1
+    assert set(snapshot['spans']) == {'answer_question', 'process_agricultural_data'}
+
+    # 关闭埋点时直接返回系统方法
+    untraced = LazyAgriSystem(tracer=Tracer())
+    assert not hasattr(untraced.answer_question, '__wrapped__')
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""流式问答测试(通过本地模拟 LLM 服务)"""
+import json
+import urllib.request
+
+import pytest
+
+from llm_streaming import StreamingAnswerer, stream_chat_completion
+from mock_llm_server import IMAGE_PROMPT_TOKENS, MockLLMServer
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer(first_token_ms=0, tokens_per_s=0, answer_tokens=12) as server:
+        yield server
+
+
+def _retrieve(question):
+    return {'entities': [{'name': '稻瘟病', 'type': 'disease', 'score': 15}],
+            'context': '三环唑 -[prevents]-> 稻瘟病'}
+
+
+def test_stream_chunks_and_token_accounting(server):
+    answerer = StreamingAnswerer(_retrieve, api_key="mock", base_url=server.base_url)
+    question = "如何防治稻瘟病？"
+    events = list(answerer.stream(question))
+
+    assert events[0]['type'] == 'context' and events[0]['context']
+    tokens = [event['text'] for event in events if event['type'] == 'token']
+    messages = answerer.build_messages(question, _retrieve(question))
+    assert tokens == server.answer_for(messages)
+
+    done = events[-1]
+    assert done['type'] == 'done'
+    assert done['answer'] == "".join(tokens)
+    assert done['ttft_ms'] is not None and done['ttft_ms'] <= done['total_ms']
+    usage = done['usage']
+    assert usage['completion_tokens'] == len(tokens) == 12
+    assert usage['prompt_tokens'] == server.prompt_tokens(messages) > 0
+    assert usage['total_tokens'] == usage['prompt_tokens'] + usage['completion_tokens']
+    assert server.requests == 1
+
+
+def test_answer_collects_stream(server):
+    result = StreamingAnswerer(_retrieve, base_url=server.base_url).answer("什么是稻瘟病？")
+    assert len(result['answer']) > 0 and result['usage']['completion_tokens'] == 12
+    assert result['entities'][0]['name'] == '稻瘟病'
+
+
+def test_multimodal_prompt_tokens(server):
+    messages = [{'role': 'user', 'content': [
+        {'type': 'text', 'text': '描述图像'},
+        {'type': 'image_url', 'image_url': {'url': 'data:image/png;base64,AAAA'}},
+    ]}]
+    chunks = list(stream_chat_completion(messages, base_url=server.base_url))
+    usage = chunks[-1][1]
+    assert usage['prompt_tokens'] == server.token_counter.count('描述图像') + IMAGE_PROMPT_TOKENS
+
+    request = urllib.request.Request(server.base_url + "/chat/completions",
+                                     data=json.dumps({'messages': messages}).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        body = json.load(response)
+    assert body['usage']['prompt_tokens'] == usage['prompt_tokens']
+
+
+def test_connection_error_yields_error_event():
+    answerer = StreamingAnswerer(_retrieve, base_url="http://127.0.0.1:9/v1", timeout=1)
+    events = list(answerer.stream("q"))
+    assert [event['type'] for event in events] == ['context', 'error']
+
+
+def test_usage_requires_include_usage(server):
+    messages = [{'role': 'user', 'content': '稻瘟病'}]
+    # 与 OpenAI 一致，未请求 include_usage 时流式响应不带 usage
+    chunks = list(stream_chat_completion(messages, base_url=server.base_url, stream_options={}))
+    assert all(usage is None for _, usage in chunks)
+    assert "".join(text for text, _ in chunks) == "".join(server.answer_for(messages))
+
+    chunks = list(stream_chat_completion(messages, base_url=server.base_url))
+    text, usage = chunks[-1]
+    assert text == '' and usage['completion_tokens'] == 12
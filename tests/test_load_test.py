@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""端到端压测工具测试"""
+import json
+import sys
+
+import pytest
+
+import load_test
+from load_test import LoadGenerator, build_report, direct_answerer, load_graph_store, load_questions
+from mock_llm_server import MockLLMServer
+
+
+def test_load_questions_rejects_empty_file(tmp_path):
+    path = tmp_path / 'questions.txt'
+    path.write_text("\n  \n", encoding='utf-8')
+    with pytest.raises(ValueError, match='没有问题'):
+        load_questions(str(path))
+    path.write_text("如何防治稻瘟病？\n\n水稻容易得什么病？\n", encoding='utf-8')
+    assert load_questions(str(path)) == ['如何防治稻瘟病？', '水稻容易得什么病？']
+
+
+def test_main_exits_on_empty_questions_file(tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'questions.txt'
+    path.write_text("", encoding='utf-8')
+    monkeypatch.setattr(sys, 'argv', ['load_test.py', '--questions_file', str(path), '--requests', '1'])
+    with pytest.raises(SystemExit) as exc:
+        load_test.main()
+    assert exc.value.code == 1
+    assert '没有问题' in capsys.readouterr().out
+
+
+def test_load_generator_rejects_empty_questions():
+    with pytest.raises(ValueError):
+        LoadGenerator(lambda q: {}, qps=100).run([], 1)
+
+
+def test_replay_against_mock_llm(tmp_path):
+    processed = tmp_path / 'processed.json'
+    processed.write_text(json.dumps({
+        'entities': [{'id': 'd1', 'name': '稻瘟病', 'type': 'disease', 'description': '病害: 稻瘟病'},
+                     {'id': 'p1', 'name': '三环唑', 'type': 'pesticide', 'description': '农药: 三环唑'}],
+        'relations': [['三环唑', 'prevents', '稻瘟病']],
+    }, ensure_ascii=False), encoding='utf-8')
+    store, corpus = load_graph_store([str(processed)], n_entities=0)
+    assert corpus is None and store.get_stats()['total_entities'] == 2
+
+    with MockLLMServer(first_token_ms=0, tokens_per_s=0, answer_tokens=5) as server:
+        answer = direct_answerer(store, server.base_url)
+        records, start = LoadGenerator(answer, qps=200, concurrency=4).run(['稻瘟病'], 6)
+    report = build_report(records, start, 200)
+    assert report['requests'] == 6 and report['errors'] == 0
+    assert report['tokens_per_s'] > 0
+    assert set(report['stages']) == {'queue', 'retrieval', 'llm_first_token', 'llm_generation'}
+    assert 'stages_note' not in report
+    assert sorted(r['id'] for r in records) == list(range(6))
+
+
+def test_graph_store_accepts_dict_relations():
+    pytest.importorskip('networkx')
+    store = load_test.NetworkXGraphStore()
+    store.build_from_data({
+        'entities': [{'id': 'd1', 'name': '稻瘟病', 'type': 'disease'}],
+        'relations': [{'source': '三环唑', 'type': 'prevents', 'target': '稻瘟病'}, ['水稻', 'infected_by', '稻瘟病']],
+    })
+    assert {n['entity'] for n in store.get_neighbors('稻瘟病')} == {'三环唑', '水稻'}
+    with pytest.raises(ValueError):
+        store.add_relation({'source': '水稻', 'type': 'uses'})
+
+
+def test_system_backend_report_notes_missing_stages():
+    class _System:
+        def answer_question(self, question, use_kg_context=True):
+            return {'answer': '答', 'usage': {'completion_tokens': 4, 'total_tokens': 9}}
+
+    records, start = LoadGenerator(load_test.system_answerer(_System()), qps=200).run(['稻瘟病'], 3)
+    report = build_report(records, start, 200)
+    assert set(report['stages']) == {'queue'}
+    assert report['stages_note'] == load_test.STAGES_NOTE
+    assert report['tokens_per_s'] > 0
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""图谱变更日志测试"""
+import logging
+import threading
+
+import pytest
+
+import mutation_log
+import tracing
+from mutation_log import LogTailer, MutationLog, new_items, open_graph
+from tracing import Tracer
+
+DATA = {
+    'entities': [
+        {'id': 'crop_001', 'name': '水稻', 'type': 'crop'},
+        {'id': 'disease_001', 'name': '稻瘟病', 'type': 'disease'},
+    ],
+    'relations': [('水稻', 'infected_by', '稻瘟病')],
+}
+
+
+def _writable(directory, compact_every=10000):
+    kg, _ = open_graph(str(directory), fsync=False, compact_every=compact_every)
+    return kg
+
+
+def test_invalid_mutation_is_not_logged(tmp_path):
+    kg = _writable(tmp_path)
+    kg.add_entity({'id': 'crop_001', 'name': '水稻'})
+    with pytest.raises(ValueError):
+        kg.add_entity({'name': '缺少id'})
+    with pytest.raises(ValueError):
+        kg.build_from_data({'entities': [{'id': 'pest_001', 'name': '稻飞虱'}, {'name': '缺少id'}]})
+    kg.add_relation(['水稻', 'damaged_by', '稻飞虱'])
+    kg.mutation_log.close()
+
+    # 无效记录未写入日志，重放不会失败，也不会留下半个批次
+    replica, replayed = open_graph(str(tmp_path), writable=False)
+    assert replayed == 2
+    assert set(replica.entities) == {'crop_001'}
+    assert replica.relations == [['水稻', 'damaged_by', '稻飞虱']]
+
+
+def test_reingest_logs_only_new_items(tmp_path):
+    kg = _writable(tmp_path)
+    kg.build_from_data(new_items(kg, DATA))
+    kg.mutation_log.close()
+
+    kg = _writable(tmp_path)
+    changed = {
+        'entities': [{'id': 'crop_001', 'name': '水稻', 'type': 'crop', 'description': '作物'}] + DATA['entities'][1:],
+        'relations': DATA['relations'] + [('稻瘟病', 'treated_by', '三环唑')],
+    }
+    delta = new_items(kg, changed)
+    assert [e.get('description') for e in delta['entities']] == ['作物']
+    assert delta['relations'] == [('稻瘟病', 'treated_by', '三环唑')]
+    kg.build_from_data(delta)
+    kg.build_from_data(new_items(kg, changed))
+    kg.mutation_log.close()
+
+    replica, _ = open_graph(str(tmp_path), writable=False)
+    assert len(replica.relations) == 2
+    assert replica.entities['crop_001']['description'] == '作物'
+
+
+def test_dict_relations_logged_as_triples(tmp_path):
+    kg = _writable(tmp_path)
+    dict_data = dict(DATA, relations=[{'source': '水稻', 'type': 'infected_by', 'target': '稻瘟病'}])
+    kg.build_from_data(new_items(kg, dict_data))
+    # 与已有的三元组形式相同，重复导入不再写日志
+    assert new_items(kg, DATA)['relations'] == []
+    kg.mutation_log.close()
+
+    replica, _ = open_graph(str(tmp_path), writable=False)
+    assert replica.relations == [['水稻', 'infected_by', '稻瘟病']]
+
+
+def test_copy_on_write_tailer_swaps_graph(tmp_path):
+    writer = _writable(tmp_path)
+    writer.build_from_data(DATA)
+
+    swapped = []
+    tailer = LogTailer(str(tmp_path), on_reload=swapped.append, copy_on_write=True)
+    assert tailer.poll() == 1
+    first = tailer.kg
+    assert swapped == [first]
+
+    # 无新记录时不复制也不回调
+    assert tailer.poll() == 0
+    assert tailer.kg is first and len(swapped) == 1
+
+    writer.add_relation(['三环唑', 'prevents', '稻瘟病'])
+    writer.mutation_log.close()
+    assert tailer.poll() == 1
+    second = tailer.kg
+    assert second is not first and swapped == [first, second]
+    # 旧图谱保持原样，正在读取它的请求不受影响
+    assert len(first.relations) == 1
+    assert len(second.relations) == 2
+    assert [n['entity'] for n in second.get_neighbors('稻瘟病')] == ['水稻', '三环唑']
+
+
+def test_follow_retries_after_poll_error(tmp_path, monkeypatch, caplog):
+    tracer = Tracer(enabled=True)
+    monkeypatch.setattr(tracing, '_default_tracer', tracer)
+    writer = _writable(tmp_path)
+    writer.build_from_data(DATA)
+    writer.mutation_log.close()
+
+    read_segment = mutation_log.read_segment
+    failures = []
+
+    def flaky_read(path, offset):
+        if not failures:
+            failures.append(path)
+            raise OSError("磁盘读取错误")
+        return read_segment(path, offset)
+
+    monkeypatch.setattr(mutation_log, 'read_segment', flaky_read)
+    updated = threading.Event()
+    tailer = LogTailer(str(tmp_path), copy_on_write=True)
+    with caplog.at_level(logging.ERROR, logger='mutation_log'):
+        tailer.follow(0.01, on_update=lambda applied: updated.set())
+        try:
+            assert updated.wait(5)
+        finally:
+            tailer.stop()
+    # 出错后跟随线程继续运行，下个周期从同一位置重试
+    assert tracer.counters['log_tail_errors'] == 1
+    assert '跟随变更日志失败' in caplog.text
+    assert tailer.kg.log_seq == 1 and len(tailer.kg.relations) == 1
+
+
+def test_recovery_after_compaction(tmp_path):
+    kg = _writable(tmp_path, compact_every=2)
+    kg.add_entity({'id': 'crop_001', 'name': '水稻'})
+    kg.add_entity({'id': 'crop_002', 'name': '小麦'})
+    kg.add_relation(['小麦', 'infected_by', '赤霉病'])
+    kg.mutation_log.close()
+
+    assert MutationLog(str(tmp_path), fsync=False).snapshot_seq == 2
+    replica, replayed = open_graph(str(tmp_path), writable=False)
+    # 快照之后只重放一条记录
+    assert replayed == 1
+    assert replica.log_seq == 3
+    assert set(replica.entities) == {'crop_001', 'crop_002'}
+    assert len(replica.relations) == 1
+
+
+def test_copy_on_write_batches_swaps(tmp_path, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(mutation_log.time, 'monotonic', lambda: clock[0])
+    writer = _writable(tmp_path)
+    writer.build_from_data(DATA)
+
+    swapped = []
+    tailer = LogTailer(str(tmp_path), on_reload=swapped.append, copy_on_write=True, swap_interval=10.0)
+    # 首次更新立即替换
+    assert tailer.poll() == 1 and len(swapped) == 1
+
+    writer.add_relation(['三环唑', 'prevents', '稻瘟病'])
+    clock[0] += 1
+    assert tailer.poll() == 1
+    staged = tailer.kg
+    writer.add_relation(['水稻', 'damaged_by', '稻飞虱'])
+    clock[0] += 1
+    assert tailer.poll() == 1
+    # 间隔未到: 两次拉取累积到同一个副本上，调用方仍持有上一版
+    assert tailer.kg is staged and len(swapped) == 1
+    assert len(swapped[0].relations) == 1
+
+    clock[0] += 10
+    assert tailer.poll() == 0
+    assert swapped[-1] is staged and len(staged.relations) == 3
+    writer.mutation_log.close()
+
+
+def test_failed_swap_is_retried(tmp_path):
+    writer = _writable(tmp_path)
+    writer.build_from_data(DATA)
+    writer.mutation_log.close()
+
+    swapped = []
+
+    def on_reload(kg):
+        if not swapped:
+            swapped.append(None)
+            raise RuntimeError("指标计算失败")
+        swapped.append(kg)
+
+    tailer = LogTailer(str(tmp_path), on_reload=on_reload, copy_on_write=True)
+    with pytest.raises(RuntimeError):
+        tailer.poll()
+    # 副本保持未替换，下次拉取时再次回调
+    assert tailer.poll() == 0
+    assert swapped[-1] is tailer.kg and tailer.kg.log_seq == 1
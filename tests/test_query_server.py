@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""常驻查询服务测试(不依赖 AgriMGraphragV2 系统模块)"""
+import asyncio
+import json
+
+import pytest
+
+from demo_v2 import LazyAgriSystem, SystemUnavailable
+from query_server import QueryService
+
+
+class _MissingSystem(LazyAgriSystem):
+    """模拟系统模块导入失败"""
+
+    def _load_system(self):
+        raise SystemUnavailable("Import error: No module named 'src'")
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    monkeypatch.delenv('OPENAI_BASE_URL', raising=False)
+    processed = tmp_path / 'processed.json'
+    processed.write_text(json.dumps({
+        'entities': [{'id': 'd1', 'name': '稻瘟病', 'type': 'disease'}],
+        'relations': [['三环唑', 'prevents', '稻瘟病']],
+    }, ensure_ascii=False), encoding='utf-8')
+    service = QueryService([str(processed)], embeddings_prefix=str(tmp_path / 'index'),
+                           system=_MissingSystem(), llm_config="")
+    yield service.load()
+    service.close()
+
+
+def test_missing_system_does_not_stop_startup(service):
+    assert not service.vector_ready
+    assert [r['name'] for r in asyncio.run(service.run(service.search, '稻瘟病'))] == ['稻瘟病']
+
+
+def test_qa_raises_instead_of_exiting(service):
+    with pytest.raises(SystemUnavailable):
+        asyncio.run(service.run(service.answer, '如何防治稻瘟病？'))
+    # 请求槽位已释放，服务仍可继续处理请求
+    assert service.status()['server']['inflight'] == 0
+    assert asyncio.run(service.run(service.neighbors, '稻瘟病'))
+
+
+def test_qa_maps_to_503(service):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    from query_server import create_app
+
+    with TestClient(create_app(service)) as client:
+        response = client.post("/qa", json={'question': '如何防治稻瘟病？'})
+        assert response.status_code == 503
+        assert client.get("/health").json() == {'status': 'ok'}
+
+
+def test_stream_slot_released_without_iteration(service):
+    capacity = service.workers + service.queue_size
+    for _ in range(capacity + 1):
+        # 客户端在开始迭代前断开: 只调用 release
+        events, release = service.open_stream('如何防治稻瘟病？')
+        release()
+        release()
+    assert service.status()['server']['inflight'] == 0
+
+    events, release = service.open_stream('如何防治稻瘟病？')
+    assert service.status()['server']['inflight'] == 1
+    assert [event['type'] for event in events] == ['error']
+    release()
+    assert service.status()['server']['inflight'] == 0
+    # 槽位没有被重复释放
+    with pytest.raises(ValueError):
+        service._slots.release()
+
+
+class _EmbeddingManager:
+    def __init__(self):
+        self.loaded = []
+
+    def load_embeddings(self, prefix):
+        self.loaded.append(prefix)
+
+    def encode(self, texts):
+        return [0.0] if isinstance(texts, str) else [[0.0] for _ in texts]
+
+
+class _StubSystem:
+    def __init__(self):
+        self.components_status = {'embedding': False, 'neo4j': False, 'chatgpt': False}
+        self.embedding_manager = _EmbeddingManager()
+
+    def initialize_embedding(self):
+        self.components_status['embedding'] = True
+
+    def initialize_neo4j(self):
+        self.components_status['neo4j'] = True
+
+    def initialize_chatgpt(self):
+        self.components_status['chatgpt'] = True
+
+    def answer_question(self, question, use_kg_context=True):
+        return {'answer': f"答:{question}", 'vector_index': list(self.embedding_manager.loaded)}
+
+    def cleanup(self):
+        pass
+
+
+class _StubLazySystem(LazyAgriSystem):
+    def _load_system(self):
+        self._system = _StubSystem()
+
+
+def test_snapshot_mode_loads_vector_index_for_qa(tmp_path, monkeypatch):
+    from graph_snapshot import write_snapshot
+    from query_server import load_graph
+
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    monkeypatch.delenv('OPENAI_BASE_URL', raising=False)
+    processed = tmp_path / 'processed.json'
+    processed.write_text(json.dumps({'entities': [{'id': 'd1', 'name': '稻瘟病', 'type': 'disease'}],
+                                     'relations': []}, ensure_ascii=False), encoding='utf-8')
+    write_snapshot(load_graph([str(processed)]), str(tmp_path / 'snap'))
+    prefix = str(tmp_path / 'index')
+    service = QueryService([str(processed)], embeddings_prefix=prefix, snapshot_dir=str(tmp_path / 'snap'),
+                           system=_StubLazySystem(), llm_config="", answer_cache_size=0).load()
+    try:
+        # 检索走快照，启动时不加载进程私有的向量索引
+        assert service.system.embedding_manager.loaded == []
+        assert service.answer('如何防治稻瘟病？')['vector_index'] == [prefix]
+        service.answer('稻瘟病怎么办？')
+        assert service.system.embedding_manager.loaded == [prefix]
+    finally:
+        service.close()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""多进程分片图谱测试(使用本地工作进程)"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from demo_basic import MockKnowledgeGraph
+from kg_context import KHopContextBuilder
+from sharded_graph import ShardedKnowledgeGraph
+
+DATA = {
+    'entities': [
+        {'id': 'c1', 'name': '水稻', 'type': 'crop'},
+        {'id': 'c2', 'name': '小麦', 'type': 'crop'},
+        {'id': 'd1', 'name': '稻瘟病', 'type': 'disease'},
+        {'id': 'd2', 'name': '赤霉病', 'type': 'disease'},
+        {'id': 'p1', 'name': '稻飞虱', 'type': 'pest'},
+        {'id': 'x1', 'name': '三环唑', 'type': 'pesticide'},
+        {'id': 'x2', 'name': '吡虫啉', 'type': 'pesticide'},
+    ],
+    'relations': [
+        ['水稻', 'infected_by', '稻瘟病'],
+        ['小麦', 'infected_by', '赤霉病'],
+        ['水稻', 'damaged_by', '稻飞虱'],
+        ['三环唑', 'prevents', '稻瘟病'],
+        ['吡虫啉', 'prevents', '稻飞虱'],
+    ],
+}
+
+
+def _neighbor_set(neighbors):
+    return sorted((n['entity'], n['relation'], n['direction']) for n in neighbors)
+
+
+@pytest.fixture(params=['hash', 'type'])
+def sharded(request):
+    kg = ShardedKnowledgeGraph(3, request.param)
+    kg.build_from_data(DATA)
+    kg.compute_analytics()
+    yield kg
+    kg.close()
+
+
+@pytest.fixture
+def single():
+    kg = MockKnowledgeGraph()
+    kg.build_from_data(DATA)
+    return kg
+
+
+def test_matches_single_process_graph(sharded, single):
+    assert sharded.get_stats()['total_relations'] == len(single.relations)
+    assert sharded.get_stats()['total_entities'] == len(single.entities)
+    for term in ['稻', '病', '水稻', '不存在']:
+        assert ([r['score'] for r in sharded.search_entities(term, 5)] ==
+                [r['score'] for r in single.search_entities(term, 5)])
+    for name in ['水稻', '稻瘟病', '稻飞虱', '赤霉病']:
+        assert _neighbor_set(sharded.get_neighbors(name)) == _neighbor_set(single.get_neighbors(name))
+    many = sharded.get_neighbors_many(['水稻', '稻瘟病', '水稻'], limit=1)
+    assert set(many) == {'水稻', '稻瘟病'}
+    assert all(len(neighbors) == 1 and 'importance' in neighbors[0] for neighbors in many.values())
+
+
+def test_khop_expansion_one_round_trip_per_hop(sharded, single):
+    calls = []
+    scatter = sharded._scatter
+    sharded._scatter = lambda requests: calls.append(requests) or scatter(requests)
+
+    builder = KHopContextBuilder(sharded, max_hops=2, importance=sharded.get_importance)
+    result = builder.build(seeds=['水稻'])
+    expected = KHopContextBuilder(single, max_hops=2).build(seeds=['水稻'])
+    # 每跳一次批量邻居查询，排序不再逐个节点查询重要度
+    assert len(calls) == 2
+    assert all(method == 'neighbors_many' for requests in calls for method, _ in requests.values())
+    assert sorted(p['entity'] for p in result['paths']) == sorted(p['entity'] for p in expected['paths'])
+
+
+def test_concurrent_searches(sharded, single):
+    terms = ['稻', '病', '水稻', '三环唑', '虫'] * 20
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda term: sharded.search_entities(term, 3), terms))
+    for term, result in zip(terms, results):
+        assert [r['score'] for r in result] == [r['score'] for r in single.search_entities(term, 3)]
+
+
+def test_type_partition_relation_before_entity():
+    with ShardedKnowledgeGraph(2, 'type') as kg:
+        kg.add_entity({'id': 'c1', 'name': '小麦', 'type': 'crop'})
+        kg.add_relation(['小麦', 'infected_by', '赤霉病'])
+        # 赤霉病按哈希落在 0 号分片，而病害类型对应 1 号分片
+        kg.add_entity({'id': 'd1', 'name': '赤霉病', 'type': 'disease'})
+        # 实体跟随先写入的边所在分片，邻居查询路由到同一分片
+        assert _neighbor_set(kg.get_neighbors('赤霉病')) == [('小麦', 'infected_by', 'incoming')]
+        assert kg.get_stats()['total_entities'] == 2
+        assert kg.search_entities('赤霉病', 1)[0]['entity']['id'] == 'd1'
+
+
+def test_worker_error_is_reported(sharded):
+    with pytest.raises(RuntimeError, match='neighbors'):
+        sharded._call(0, 'neighbors', None, 'bad-limit')
+    # 出错后连接仍可用
+    assert sharded.get_stats()['total_entities'] == len(DATA['entities'])
+
+
+def test_dict_relations_and_batch_validation():
+    with ShardedKnowledgeGraph(2, 'type') as kg:
+        kg.build_from_data({
+            'entities': DATA['entities'][:3],
+            'relations': [{'source': '水稻', 'type': 'infected_by', 'target': '稻瘟病'}],
+        })
+        assert _neighbor_set(kg.get_neighbors('稻瘟病')) == [('水稻', 'infected_by', 'incoming')]
+
+        # 任一条目无效时整批拒绝，任何分片都不写入，分片目录也不记录新名称
+        directory = dict(kg._directory)
+        for bad in ({'entities': [{'id': 'd2', 'name': '赤霉病', 'type': 'disease'}, {'name': '缺少id'}]},
+                    {'entities': [{'id': 'd2', 'name': '赤霉病', 'type': 'disease'}],
+                     'relations': [{'source': '小麦', 'type': 'infected_by'}]}):
+            with pytest.raises(ValueError):
+                kg.build_from_data(bad)
+        assert kg.get_stats()['total_entities'] == 3 and kg.get_stats()['total_relations'] == 1
+        assert kg._directory == directory
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""流水线埋点测试"""
+import json
+
+from tracing import Histogram, Tracer
+
+
+def test_quantile_above_last_bucket_is_observed_max():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 42.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.99) == 42.0
+    # 导出结果中不应出现 Infinity
+    assert 'Infinity' not in json.dumps(histogram.to_dict())
+
+
+def test_quantile_clamped_to_max_inside_bucket():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    histogram.observe(0.3)
+    assert histogram.quantile(0.5) == 0.3
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_nested_spans_and_prometheus():
+    tracer = Tracer(enabled=True)
+    with tracer.span("qa"):
+        with tracer.span("llm"):
+            pass
+    tracer.count("cache_hits", 2)
+    snapshot = tracer.snapshot()
+    assert set(snapshot['spans']) == {"qa", "qa/llm"}
+    assert snapshot['counters'] == {"cache_hits": 2}
+    text = tracer.to_prometheus()
+    assert 'agri_cache_hits_total 2' in text
+    assert 'span="qa/llm",le="+Inf"} 1' in text
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span("qa"):
+        tracer.count("x")
+    assert tracer.snapshot()['spans'] == {} and tracer.snapshot()['counters'] == {}
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+流水线埋点
+嵌套计时 span、计数器与延迟直方图，可导出为系统状态字典或 Prometheus 文本格式。
+关闭时 span/count/observe 直接返回，开销接近于零。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# 延迟直方图默认分桶(秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """按分桶估算分位数(返回所在桶上界，不超过实际观测到的最大值)"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, self.max)
+        # 落在最后一个桶之外
+        return self.max
+
+    def cumulative(self):
+        """Prometheus 格式的累积计数"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_s': self.sum,
+            'mean_ms': self.sum / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1000,
+            'p99_ms': self.quantile(0.99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class _NoopSpan:
+    """关闭埋点时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """埋点记录器(线程安全)"""
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {}
+        self.histograms = {}
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name):
+        """计时 span，嵌套时记录为 父/子 路径"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        stack = self._stack()
+        stack.append(name)
+        path = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            self.observe(path, elapsed)
+
+    def count(self, name, value=1):
+        """累加计数器"""
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """记录一次耗时到直方图"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def snapshot(self):
+        """导出当前指标(用于 get_system_status)"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'counters': dict(self.counters),
+                'spans': {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def to_prometheus(self, prefix="agri"):
+        """导出 Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{prefix}_{_metric_name(name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+            if self.histograms:
+                metric = f"{prefix}_span_duration_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for name, histogram in sorted(self.histograms.items()):
+                    label = name.replace('\\', '\\\\').replace('"', '\\"')
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{metric}_bucket{{span="{label}",le="{bound}"}} {total}')
+                    lines.append(f'{metric}_bucket{{span="{label}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{span="{label}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{span="{label}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "".join(ch if ch.isascii() and ch.isalnum() else "_" for ch in name).strip("_").lower()
+
+
+_default_tracer = Tracer()
+
+
+def get_tracer():
+    """全局埋点记录器(默认关闭)"""
+    return _default_tracer